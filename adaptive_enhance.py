@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scene-aware low-light enhancement that only does as much work as the frame needs.
+
+The fixed chains in untitled1.py and untitled2.py brighten every frame by
+the same amount, which wastes CPU and blows out well exposed scenes.  The
+AdaptiveEnhancer measures the luminance of a tiny thumbnail of each frame
+(a few microseconds) and picks one of four paths:
+
+- "passthrough": the frame is returned as is (bright scenes).
+- "tone": one gamma LUT pass, with the gamma chosen to move the mean
+  luminance towards `target` (slightly dim scenes).
+- "clahe": the tone LUT plus CLAHE on the luma channel (dim scenes).
+- "full": the complete enhancement chain (dark scenes).
+
+The smoothed mean luminance selects the path, with hysteresis so the output
+does not flicker around a threshold: a darker path is taken as soon as the
+mean drops `margin` below its threshold, a brighter one only after the mean
+has stayed `margin` above it for `hold` frames.  PathStats counts how often
+and how long every path ran.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+import cv_cache
+import tone_mapping
+from frame_buffers import arena_buffer
+from metrics import timed
+
+PATHS = ("full", "clahe", "tone", "passthrough")
+
+
+class PathStats:
+    """How often each path was chosen and the time spent in it."""
+
+    def __init__(self):
+        self.counts = dict.fromkeys(PATHS, 0)
+        self.seconds = dict.fromkeys(PATHS, 0.0)
+        self.switches = 0
+        self.frames = 0
+
+    def record(self, path, seconds, switched):
+        self.counts[path] += 1
+        self.seconds[path] += seconds
+        self.switches += switched
+        self.frames += 1
+
+    def fraction(self, path):
+        return self.counts[path] / self.frames if self.frames else 0.0
+
+    def summary(self):
+        parts = [f"{path} {self.fraction(path):.1%} "
+                 f"({self.seconds[path] / max(self.counts[path], 1) * 1000:.2f} ms)"
+                 for path in PATHS if self.counts[path]]
+        return f"{self.frames} frames, {self.switches} path switches: " + ", ".join(parts)
+
+
+class AdaptiveEnhancer:
+    """
+    Choose the enhancement path per frame from cheap luminance statistics.
+
+    Parameters:
+    - full: Callable (image, arena) -> image running the complete chain,
+      e.g. lut_enhance.FusedLowLightEnhancer.
+    - thresholds: Mean luminance (0..255) separating full|clahe|tone|passthrough.
+    - target: Mean luminance the tone/clahe paths aim for.
+    - margin: Hysteresis band around each threshold, in gray levels.
+    - hold: Frames a brighter path must be indicated before switching to it.
+    - smoothing: Weight of the newest frame in the smoothed mean.
+    - thumbnail: Size (width, height) of the thumbnail the statistics are taken from.
+    - clip_limit, tile_grid_size: CLAHE parameters of the "clahe" path.
+    """
+
+    def __init__(self, full, thresholds=(40, 75, 110), target=110, margin=6, hold=5, smoothing=0.3,
+                 thumbnail=(64, 36), clip_limit=2.0, tile_grid_size=(8, 8)):
+        self.full = full
+        self.thresholds = thresholds
+        self.target = target
+        self.margin = margin
+        self.hold = hold
+        self.smoothing = smoothing
+        self.thumbnail = thumbnail
+        self.clip_limit = clip_limit
+        self.tile_grid_size = tile_grid_size
+        self.level = None
+        self.mean = None
+        self.pending = 0
+        self.stats = PathStats()
+
+    def measure(self, image):
+        """Mean luminance of a nearest-neighbour thumbnail (a few thousand pixels)."""
+        small = cv2.resize(image, self.thumbnail, interpolation=cv2.INTER_NEAREST)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.mean(small)[0]
+
+    def _indicated(self, mean):
+        """Path index for a mean luminance, ignoring hysteresis."""
+        return int(np.searchsorted(self.thresholds, mean, side="right"))
+
+    def choose(self, image):
+        """Update the smoothed statistics with this frame and return the path to run."""
+        mean = self.measure(image)
+        self.mean = mean if self.mean is None else self.mean + self.smoothing * (mean - self.mean)
+        if self.level is None:
+            self.level = self._indicated(self.mean)
+            return PATHS[self.level]
+
+        level = self.level
+        if level > 0 and self.mean < self.thresholds[level - 1] - self.margin:
+            # Darker scene: switch at once so no frame stays under-enhanced
+            level = self._indicated(self.mean + self.margin)
+            self.pending = 0
+        elif level < len(self.thresholds) and self.mean > self.thresholds[level] + self.margin:
+            # Brighter scene: switch only when it lasts
+            self.pending += 1
+            if self.pending >= self.hold:
+                level = self._indicated(self.mean - self.margin)
+                self.pending = 0
+        else:
+            self.pending = 0
+        self.level = level
+        return PATHS[level]
+
+    def tone_lut(self):
+        """Gamma table moving the smoothed mean towards the target (quantized so tables are reused)."""
+        mean = min(max(self.mean, 1.0), 254.0)
+        gamma = np.log(self.target / 255.0) / np.log(mean / 255.0)
+        return tone_mapping.gamma_lut(round(float(np.clip(gamma, 0.2, 1.0)), 1))
+
+    @timed("adaptive_enhance")
+    def apply(self, image, arena=None):
+        """Enhance one BGR frame; the passthrough path returns `image` itself."""
+        start = time.perf_counter()
+        previous = self.level
+        path = self.choose(image)
+        if path == "passthrough":
+            result = image
+        elif path == "tone":
+            result = tone_mapping.apply(image, self.tone_lut(), dst=arena_buffer(arena, "adaptive.tone", image))
+        elif path == "clahe":
+            result = self._tone_clahe(image, arena)
+        else:
+            result = self.full(image, arena)
+        self.stats.record(path, time.perf_counter() - start, previous is not None and previous != self.level)
+        return result
+
+    __call__ = apply
+
+    def _tone_clahe(self, image, arena):
+        yuv = cv2.cvtColor(image, cv2.COLOR_BGR2YUV, dst=arena_buffer(arena, "adaptive.yuv", image))
+        y_channel = cv2.extractChannel(yuv, 0, arena_buffer(arena, "adaptive.y", image, channels=1))
+        tone_mapping.apply(y_channel, self.tone_lut(), dst=y_channel)
+        cv_cache.clahe(self.clip_limit, self.tile_grid_size).apply(y_channel, y_channel)
+        cv2.insertChannel(y_channel, yuv, 0)
+        return cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR, dst=arena_buffer(arena, "adaptive.bgr", image))
+
+
+def main(width=1280, height=720, frames=300):
+    """Run a synthetic day -> dusk -> night -> day sequence and report the chosen paths and timings."""
+    from lut_enhance import FusedLowLightEnhancer
+    from video_io import SyntheticSource
+
+    source = SyntheticSource(width, height, frames=frames)
+    fixed = FusedLowLightEnhancer("hsv_first")
+    adaptive = AdaptiveEnhancer(FusedLowLightEnhancer("hsv_first"))
+    fixed_time = 0.0
+    for index in range(frames):
+        frame = source.read()[1]
+        # Exposure ramps from bright daylight down to night and back
+        phase = abs(index / frames * 2 - 1)
+        frame = cv2.convertScaleAbs(frame, alpha=0.3 + 3.7 * phase)
+        start = time.perf_counter()
+        fixed(frame)
+        fixed_time += time.perf_counter() - start
+        adaptive(frame)
+    print(f"fixed chain: {fixed_time / frames * 1000:.2f} ms per frame")
+    print(f"adaptive: {sum(adaptive.stats.seconds.values()) / frames * 1000:.2f} ms per frame")
+    print(adaptive.stats.summary())
+
+
+if __name__ == "__main__":
+    main()
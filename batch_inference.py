@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dynamic-batching inference server for the YOLO detectors.
+
+Callers submit single frames from any thread (or coroutine) and get a
+future back.  A worker thread collects requests until either max_batch
+frames are waiting or the oldest request has waited max_wait seconds, runs
+one forward pass over the whole batch and scatters the per-frame results
+back to the futures.
+
+Example:
+    server = BatchingInferenceServer(YOLO('yolov8n.pt'), max_batch=8, max_wait=0.01)
+    with server:
+        result = server.submit(rgb_frame).result()
+        # or, inside a coroutine:
+        result = await server.infer_async(rgb_frame)
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+import numpy as np
+
+_STOP = object()
+
+
+class BatchMetrics:
+    """Counters for batch fill ratio and queue wait time (seconds)."""
+
+    def __init__(self, max_batch, window=1024):
+        self.max_batch = max_batch
+        self.batches = 0
+        self.frames = 0
+        self.wait_times = deque(maxlen=window)
+        self.batch_times = deque(maxlen=window)
+
+    def record(self, batch_size, waits, batch_time):
+        self.batches += 1
+        self.frames += batch_size
+        self.wait_times.extend(waits)
+        self.batch_times.append(batch_time)
+
+    @property
+    def fill_ratio(self):
+        """Mean batch size divided by max_batch."""
+        return self.frames / (self.batches * self.max_batch) if self.batches else 0.0
+
+    def snapshot(self):
+        waits = np.array(self.wait_times) if self.wait_times else np.zeros(1)
+        batch_times = np.array(self.batch_times) if self.batch_times else np.zeros(1)
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "mean_batch_size": self.frames / self.batches if self.batches else 0.0,
+            "fill_ratio": self.fill_ratio,
+            "queue_wait_mean": float(waits.mean()),
+            "queue_wait_p50": float(np.percentile(waits, 50)),
+            "queue_wait_p99": float(np.percentile(waits, 99)),
+            "batch_time_mean": float(batch_times.mean()),
+        }
+
+
+class BatchingInferenceServer:
+    """
+    Collects single-frame requests into batches for one model.
+
+    Parameters:
+    - model: Callable taking a list of frames (e.g. an ultralytics YOLO model).
+    - max_batch: Maximum frames per forward pass.
+    - max_wait: Latency deadline in seconds, measured from the oldest queued request.
+    - queue_size: Maximum number of pending requests (submit blocks when full).
+    - infer: Optional callable(model, frames) -> list of results; defaults to
+      model(frames, imgsz=imgsz, verbose=False).
+    - imgsz: Inference size passed to the default infer.
+    """
+
+    def __init__(self, model, max_batch=8, max_wait=0.01, queue_size=64, infer=None, imgsz=320):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.imgsz = imgsz
+        self.infer = infer or self._default_infer
+        self.requests = Queue(maxsize=queue_size)
+        self.metrics = BatchMetrics(max_batch)
+        self._thread = None
+
+    def _default_infer(self, model, frames):
+        return model(frames, imgsz=self.imgsz, verbose=False)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._serve, name="batch-inference", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.requests.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def submit(self, frame):
+        """Queue one frame and return a concurrent.futures.Future for its result."""
+        future = Future()
+        self.requests.put((frame, future, time.monotonic()))
+        return future
+
+    def __call__(self, frame):
+        """Blocking single-frame inference through the batcher."""
+        return self.submit(frame).result()
+
+    async def infer_async(self, frame):
+        """Awaitable single-frame inference through the batcher."""
+        return await asyncio.wrap_future(self.submit(frame))
+
+    def _collect(self):
+        first = self.requests.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+            except Empty:
+                break
+            if request is _STOP:
+                # Serve what we have, then stop
+                self.requests.put(_STOP)
+                break
+            batch.append(request)
+        return batch
+
+    def _serve(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+            frames = [frame for frame, _, _ in batch]
+            start = time.monotonic()
+            waits = [start - queued for _, _, queued in batch]
+            try:
+                results = self.infer(self.model, frames)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self.metrics.record(len(batch), waits, time.monotonic() - start)
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+
+def main(model_path='yolov8n.pt', frames=64, max_batch=8, imgsz=320):
+    """Compare the per-frame loop with batched submission on synthetic frames."""
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (240, 320, 3), dtype=np.uint8) for _ in range(frames)]
+    model(images[0], imgsz=imgsz, verbose=False)
+
+    start = time.perf_counter()
+    for image in images:
+        model(image, imgsz=imgsz, verbose=False)
+    sequential = time.perf_counter() - start
+
+    with BatchingInferenceServer(model, max_batch=max_batch, max_wait=0.02, imgsz=imgsz) as server:
+        start = time.perf_counter()
+        futures = [server.submit(image) for image in images]
+        for future in futures:
+            future.result()
+        batched = time.perf_counter() - start
+
+    print(f"per-frame: {frames / sequential:.1f} fps, batched: {frames / batched:.1f} fps "
+          f"({sequential / batched:.2f}x)")
+    print(server.metrics.snapshot())
+
+
+if __name__ == "__main__":
+    main()
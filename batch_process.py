@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline batch processing of recorded video at full speed over a process pool.
+
+The scripts are built around a live camera and a display loop, so
+re-running them over archived footage is bound by one core and real time.
+This CLI runs any benchmark.PIPELINES pipeline over video files as fast as
+the machine allows:
+
+- Every file is split into chunks of about `--chunk-seconds` starting on
+  keyframes.  The keyframes come from a demux-only scan (CAP_PROP_FORMAT -1
+  and CAP_PROP_LRF_HAS_KEY_FRAME), so a worker's seek does not decode
+  frames it then throws away.  Files without that information are split
+  at plain frame numbers.
+- Each chunk runs in a worker process, which starts `--warmup` seconds
+  earlier (also on a keyframe).  The warm-up frames go through the pipeline
+  so stateful models (MOG2/KNN backgrounds, frame differencing, temporal
+  denoising, the tracker) reach the chunk in a learned state, but they
+  produce no output.
+- The workers JPEG-encode their output frames into MJPEG AVI chunks
+  (clip_recorder.MjpegAviWriter).  Stitching copies the JPEG bytes in
+  order into one file per input, with no second encode.
+- For pipelines whose script has an EVENT_LOG, motion events are collected
+  per chunk against video time (`--start-time` + frame / fps).  Events cut
+  by a chunk boundary are merged again before they go to the event log.
+
+Usage:
+
+    python batch_process.py night.mp4 --pipeline untitled15 --workers 4
+    python batch_process.py cam*.mp4 --pipeline untitled6 --no-video --start-time 2024-08-04T00:00:00
+
+A chunk's background model has only seen its warm-up frames, so masks near
+the start of a chunk can differ slightly from those of one sequential run;
+a longer --warmup narrows the gap.
+"""
+
+import argparse
+import bisect
+import importlib
+import multiprocessing as mp
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+import benchmark
+import events
+from clip_recorder import MjpegAviWriter
+
+
+def scan_keyframes(path):
+    """
+    Frame numbers of the keyframes of a video and its frame count, from a demux-only pass.
+
+    Returns (None, frame_count) if the backend cannot report keyframes.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Error: Could not open {path}.")
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if not cap.set(cv2.CAP_PROP_FORMAT, -1):
+        cap.release()
+        return None, count
+    keyframes = []
+    index = 0
+    while cap.grab():
+        if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+            keyframes.append(index)
+        index += 1
+    cap.release()
+    return (keyframes or None), index
+
+
+def _keyframe_at_or_before(keyframes, frame):
+    if keyframes is None:
+        return max(frame, 0)
+    position = bisect.bisect_right(keyframes, frame)
+    return keyframes[position - 1] if position else 0
+
+
+def plan_chunks(path, chunk_seconds=30.0, warmup_seconds=10.0):
+    """
+    Split a video into keyframe-aligned chunks.
+
+    Returns:
+    - fps of the video and a list of (warmup_start, start, stop) frame
+      ranges: frames [warmup_start, start) only warm the pipeline up,
+      frames [start, stop) are the chunk's output.
+    """
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    keyframes, count = scan_keyframes(path)
+    length = max(1, int(round(chunk_seconds * fps)))
+    warmup = int(round(warmup_seconds * fps))
+    if keyframes is None:
+        starts = list(range(0, count, length))
+    else:
+        # The first keyframe at or after every multiple of the chunk length
+        starts = [0]
+        for keyframe in keyframes:
+            if keyframe >= starts[-1] + length:
+                starts.append(keyframe)
+    stops = starts[1:] + [count]
+    return fps, [(_keyframe_at_or_before(keyframes, start - warmup) if start else 0, start, stop)
+                 for start, stop in zip(starts, stops) if stop > start]
+
+
+class ChunkEvents:
+    """
+    events.EventRecorder stand-in for one chunk.
+
+    The scripts call update(regions); the timestamp is the video time of the
+    frame being processed, set by the chunk loop, and nothing is recorded
+    during the warm-up.  Events are kept in memory for stitching, with
+    min_frames=1 so that the pieces of an event cut by a chunk boundary
+    survive until they are merged.
+    """
+
+    def __init__(self, source, **aggregator_options):
+        self.aggregator = events.EventAggregator(source=source, min_frames=1, **aggregator_options)
+        self.timestamp = 0.0
+        self.active = False
+        self.records = []
+
+    def update(self, regions, timestamp=None, labels=None):
+        if not self.active:
+            return []
+        closed = self.aggregator.update(regions, self.timestamp if timestamp is None else timestamp, labels)
+        self.records.extend(closed)
+        return closed
+
+    def close(self):
+        self.records.extend(self.aggregator.flush())
+
+
+def _records_events(pipeline):
+    # Scripts with an EVENT_LOG setting take a recorder (see events.py)
+    return hasattr(importlib.import_module(pipeline.split(".")[0]), "EVENT_LOG")
+
+
+def process_chunk(task):
+    """
+    Run one chunk in a worker process.
+
+    Parameters:
+    - task: Dict with path, pipeline, warmup_start, start, stop, fps,
+      output (MJPEG AVI path or None), quality, threads, start_time and
+      event options (None = no events).
+
+    Returns:
+    - Dict with the frame counts, the seconds spent, the output file and
+      its frame index, and the chunk's event records.
+    """
+    cv2.setNumThreads(task["threads"])
+    began = time.perf_counter()
+    cap = cv2.VideoCapture(task["path"])
+    if not cap.isOpened():
+        raise IOError(f"Error: Could not open {task['path']}.")
+    if task["warmup_start"]:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, task["warmup_start"])
+
+    recorder = None
+    if task["events"] is not None:
+        recorder = ChunkEvents(os.path.basename(task["path"]), **task["events"])
+        step = benchmark.PIPELINES[task["pipeline"]](recorder=recorder)
+    else:
+        step = benchmark.PIPELINES[task["pipeline"]]()
+
+    writer = None
+    frames = 0
+    for index in range(task["warmup_start"], task["stop"]):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if recorder is not None:
+            recorder.timestamp = task["start_time"] + index / task["fps"]
+            recorder.active = index >= task["start"]
+        result = step(frame)
+        if index < task["start"]:
+            continue
+        frames += 1
+        if task["output"] is None:
+            continue
+        # Subtraction scripts return (frame, mask); the annotated frame is the output
+        if isinstance(result, tuple):
+            result = result[0]
+        ok, jpeg = cv2.imencode(".jpg", result, [cv2.IMWRITE_JPEG_QUALITY, task["quality"]])
+        if not ok:
+            continue
+        if writer is None:
+            writer = MjpegAviWriter(task["output"], result.shape[1], result.shape[0], task["fps"])
+        writer.write(jpeg)
+    cap.release()
+    if recorder is not None:
+        recorder.close()
+    if writer is not None:
+        writer.close()
+
+    return {
+        "frames": frames,
+        "warmup_frames": task["start"] - task["warmup_start"],
+        "seconds": time.perf_counter() - began,
+        "output": None if writer is None else writer.path,
+        "movi": None if writer is None else writer.movi,
+        "index": [] if writer is None else writer.index,
+        "size": None if writer is None else (writer.width, writer.height),
+        "events": [] if recorder is None else recorder.records,
+    }
+
+
+def stitch_video(chunks, path, fps):
+    """Copy the JPEG frames of the chunk AVIs, in order, into one MJPEG AVI; returns the frame count."""
+    writer = None
+    for chunk in chunks:
+        if chunk["output"] is None:
+            continue
+        if writer is None:
+            writer = MjpegAviWriter(path, *chunk["size"], fps)
+        with open(chunk["output"], "rb") as source:
+            for offset, size in chunk["index"]:
+                # Skip the "movi" fourcc and the frame's chunk header
+                source.seek(chunk["movi"] + 8 + offset + 8)
+                writer.write(source.read(size))
+        os.remove(chunk["output"])
+    if writer is None:
+        return 0
+    writer.close()
+    return len(writer.index)
+
+
+def _overlaps(a, b, margin):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw + margin and bx < ax + aw + margin and ay < by + bh + margin and by < ay + ah + margin
+
+
+def stitch_events(chunks, gap=2.0, margin=16, min_frames=3):
+    """
+    Event records of consecutive chunks with the events cut at a boundary merged again.
+
+    An event of a chunk that starts within `gap` seconds of the end of an
+    event of the previous chunks, with overlapping hulls, continues it.
+    Events seen in fewer than `min_frames` frames are dropped afterwards and
+    the rest renumbered in start order.
+    """
+    merged = []
+    for chunk in chunks:
+        # Ends and hulls as the previous chunks left them: several pieces of this chunk can continue one event
+        previous = [(earlier, earlier["end"], earlier["hull"], earlier["frames"]) for earlier in merged]
+        for event in chunk["events"]:
+            for earlier, end, hull, frames in previous:
+                if 0 <= event["start"] - end <= gap and _overlaps(hull, event["hull"], margin):
+                    x1 = min(earlier["hull"][0], event["hull"][0])
+                    y1 = min(earlier["hull"][1], event["hull"][1])
+                    x2 = max(earlier["hull"][0] + earlier["hull"][2], event["hull"][0] + event["hull"][2])
+                    y2 = max(earlier["hull"][1] + earlier["hull"][3], event["hull"][1] + event["hull"][3])
+                    earlier["hull"] = [x1, y1, x2 - x1, y2 - y1]
+                    earlier["end"] = max(earlier["end"], event["end"])
+                    # Pieces of one chunk cover the same frames, so only the longest one adds to the count
+                    earlier["frames"] = max(earlier["frames"], frames + event["frames"])
+                    if event["peak_area"] > earlier["peak_area"]:
+                        earlier["peak_area"] = event["peak_area"]
+                        earlier["peak_time"] = event["peak_time"]
+                    if "labels" in event:
+                        earlier["labels"] = sorted(set(earlier.get("labels", [])) | set(event["labels"]))
+                    break
+            else:
+                merged.append(dict(event))
+    merged = sorted((event for event in merged if event["frames"] >= min_frames), key=lambda event: event["start"])
+    for number, event in enumerate(merged):
+        event["id"] = number
+    return merged
+
+
+def run(paths, pipeline, output_dir="batch_output", workers=None, chunk_seconds=30.0, warmup_seconds=10.0,
+        video=True, quality=90, event_log=None, event_min_area=100, start_time=0.0):
+    """
+    Process video files with a pipeline over a process pool; returns a per-file and total report.
+
+    Parameters:
+    - paths: Video files.
+    - pipeline: Key of benchmark.PIPELINES.
+    - output_dir: Directory of the stitched <file>_<pipeline>.avi outputs.
+    - workers: Worker processes (default: one per CPU).
+    - chunk_seconds: Approximate chunk length.
+    - warmup_seconds: Frames processed before every chunk (except a file's first) without output.
+    - video: Write the processed frames; False only collects events.
+    - quality: JPEG quality of the output frames.
+    - event_log: Event log for pipelines that record events (None = <output_dir>/events.log).
+    - event_min_area: Smallest blob area (pixels) that is part of an event.
+    - start_time: Epoch seconds of the first frame of every file (0 = seconds into the video).
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    chunk_dir = os.path.join(output_dir, ".chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+    record_events = _records_events(pipeline)
+    # Split the OpenCV threads between the workers instead of oversubscribing the CPUs
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    began = time.perf_counter()
+    plans = {}
+    for number, path in enumerate(paths):
+        fps, ranges = plan_chunks(path, chunk_seconds, warmup_seconds)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        tasks = [{
+            "path": path, "pipeline": pipeline, "fps": fps, "quality": quality, "threads": threads,
+            "warmup_start": warmup_start, "start": start, "stop": stop, "start_time": start_time,
+            "output": os.path.join(chunk_dir, f"{number}_{stem}_{index:05d}.avi") if video else None,
+            "events": {"min_area": event_min_area} if record_events else None,
+        } for index, (warmup_start, start, stop) in enumerate(ranges)]
+        plans[path] = (fps, stem, tasks)
+
+    context = mp.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        futures = {path: [pool.submit(process_chunk, task) for task in tasks] for path, (_, _, tasks) in plans.items()}
+        results = {path: [future.result() for future in chunk_futures] for path, chunk_futures in futures.items()}
+
+    report = {"pipeline": pipeline, "workers": workers, "files": []}
+    log = events.EventLog(event_log or os.path.join(output_dir, "events.log")) if record_events else None
+    for path, chunks in results.items():
+        fps, stem, tasks = plans[path]
+        output = None
+        if video:
+            output = os.path.join(output_dir, f"{stem}_{pipeline}.avi")
+            stitch_video(chunks, output, fps)
+        records = stitch_events(chunks) if record_events else []
+        if log is not None:
+            log.extend(records)
+        report["files"].append({
+            "path": path,
+            "output": output,
+            "chunks": len(chunks),
+            "frames": sum(chunk["frames"] for chunk in chunks),
+            "warmup_frames": sum(chunk["warmup_frames"] for chunk in chunks),
+            "worker_seconds": sum(chunk["seconds"] for chunk in chunks),
+            "events": len(records),
+            "source_fps": fps,
+        })
+    if log is not None:
+        log.close()
+    shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - began
+    frames = sum(item["frames"] for item in report["files"])
+    report.update(frames=frames, seconds=elapsed, fps=frames / elapsed if elapsed else float("inf"),
+                  event_log=log.path if log is not None else None)
+    return report
+
+
+def print_report(report):
+    for item in report["files"]:
+        worker_fps = item["frames"] / item["worker_seconds"] if item["worker_seconds"] else float("inf")
+        line = (f"{os.path.basename(item['path'])}: {item['frames']} frames in {item['chunks']} chunks "
+                f"(+{item['warmup_frames']} warm-up), {worker_fps:.1f} fps per worker")
+        if report["event_log"] is not None:
+            line += f", {item['events']} events"
+        if item["output"]:
+            line += f" -> {item['output']}"
+        print(line)
+    source_fps = max((item["source_fps"] for item in report["files"]), default=30.0)
+    print(f"{report['pipeline']}: {report['frames']} frames in {report['seconds']:.1f} s with {report['workers']} "
+          f"workers = {report['fps']:.1f} fps ({report['fps'] / source_fps:.1f}x real time)")
+    if report["event_log"] is not None:
+        print(f"Events appended to {report['event_log']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a pipeline over recorded video files at full speed")
+    parser.add_argument("videos", nargs="+", help="video files")
+    parser.add_argument("--pipeline", default="untitled15",
+                        help="pipeline name from benchmark.py: " + ", ".join(benchmark.PIPELINES))
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-seconds", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=10.0, help="seconds processed before every chunk")
+    parser.add_argument("--no-video", action="store_true", help="only collect events, write no video")
+    parser.add_argument("--quality", type=int, default=90, help="JPEG quality of the output video")
+    parser.add_argument("--event-log", help="event log (default: <output-dir>/events.log)")
+    parser.add_argument("--event-min-area", type=float, default=100)
+    parser.add_argument("--start-time", default="0",
+                        help="time of the first frame: ISO date/time or epoch seconds (default: video time)")
+    args = parser.parse_args(argv)
+    if args.pipeline not in benchmark.PIPELINES:
+        parser.error(f"unknown pipeline {args.pipeline}")
+
+    report = run(args.videos, args.pipeline, args.output_dir, args.workers, args.chunk_seconds, args.warmup,
+                 not args.no_video, args.quality, args.event_log, args.event_min_area,
+                 events.parse_time(args.start_time))
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
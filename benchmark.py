@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reproducible benchmark suite for the enhancement, subtraction and detection pipelines.
+
+Every pipeline is driven frame by frame from pre-decoded frames, either from
+the deterministic synthetic generator in video_io or from recorded clips
+resized to each benchmark resolution, so no camera is needed and runs are
+comparable between machines and commits.  Each (pipeline, source,
+resolution) case runs in a fresh process so that its peak RSS is its own.
+
+Results are written as JSON and can be compared against a stored baseline:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json --tolerance 0.15   # exit code 1 on regression
+    python benchmark.py --pipelines untitled6,untitled21 --resolutions 720p --video corridor.mp4
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from video_io import SyntheticSource
+
+RESOLUTIONS = {
+    "320x240": (320, 240),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+
+
+def _enhancer(module, function):
+    """Stateless per-frame function taking (image, arena)."""
+    def factory():
+        from frame_buffers import FrameArena
+
+        step = getattr(importlib.import_module(module), function)
+        arena = FrameArena()
+
+        def run(frame):
+            result = step(frame, arena)
+            arena.next_frame()
+            return result
+        return run
+    return factory
+
+
+def _gray_enhancer(module, function, denoise_mode=None):
+    def factory():
+        from frame_buffers import FrameArena
+        from temporal_denoise import make_denoiser
+
+        step = getattr(importlib.import_module(module), function)
+        arena = FrameArena()
+        denoiser = make_denoiser(denoise_mode)
+
+        def run(frame):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            result = step(gray, arena, denoiser)
+            arena.next_frame()
+            return result
+        return run
+    return factory
+
+
+def _subtractor(module, function, create):
+    """Background subtraction with the same subtractor settings as the script's main() (options go to `function`)."""
+    def factory(**options):
+        step = getattr(importlib.import_module(module), function)
+        subtractor = create()
+        return lambda frame: step(frame, subtractor, **options)
+    return factory
+
+
+def _frame_difference(module, mode=None):
+    """detect_anomalies(frame, differencer, **options) with the script's differencer (and optionally another mode)."""
+    def factory(**options):
+        from frame_buffers import FrameArena
+
+        script = importlib.import_module(module)
+        differencer = script.make_differencer() if mode is None else script.make_differencer(mode)
+        arena = FrameArena()
+
+        def run(frame):
+            result = script.detect_anomalies(frame, differencer, arena=arena, **options)
+            arena.next_frame()
+            return result
+        return run
+    return factory
+
+
+def _detector(module, weights, imgsz):
+    """YOLO script: detector backend, scheduler and tracker configured from the script's constants."""
+    def factory():
+        from detections import DetectionRenderer
+        from detector_backends import load_detector
+        from tracker import DetectionScheduler, Tracker
+
+        script = importlib.import_module(module)
+        model = load_detector(weights, imgsz=imgsz, backend=script.BACKEND)
+        renderer = DetectionRenderer(thickness=1)
+        scheduler = DetectionScheduler(stride=script.DETECT_STRIDE, adaptive=script.ADAPTIVE_STRIDE,
+                                       max_stride=script.MAX_STRIDE)
+        tracker = Tracker()
+        return lambda frame: script.process_frame(frame, model, renderer, scheduler, tracker)
+    return factory
+
+
+PIPELINES = {
+    "untitled1": _enhancer("untitled1", "improve_low_light"),
+    "untitled1.fused": lambda: importlib.import_module("lut_enhance").FusedLowLightEnhancer("hsv_first"),
+    "untitled1.adaptive": lambda: importlib.import_module("adaptive_enhance").AdaptiveEnhancer(
+        importlib.import_module("lut_enhance").FusedLowLightEnhancer("hsv_first")),
+    "untitled2": _enhancer("untitled2", "improve_low_light"),
+    "untitled2.fused": lambda: importlib.import_module("lut_enhance").FusedLowLightEnhancer("hsv_last"),
+    "untitled3": _gray_enhancer("untitled3", "improve_low_light_gray"),
+    "untitled3.temporal": _gray_enhancer("untitled3", "improve_low_light_gray", "recursive"),
+    "untitled4": _enhancer("untitled4", "enhance_low_light"),
+    "untitled11": _enhancer("untitled11", "enhance_image"),
+    "untitled12": lambda: importlib.import_module("untitled12").simulate_ir,
+    "untitled6": _subtractor("untitled6", "subtract_background",
+                             lambda: cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=True)),
+    "untitled7": _subtractor("untitled7", "subtract_background",
+                             lambda: cv2.createBackgroundSubtractorKNN(history=500, dist2Threshold=400.0, detectShadows=True)),
+    "untitled9": _subtractor("untitled9", "subtract_background",
+                             lambda: cv2.createBackgroundSubtractorKNN(history=500, dist2Threshold=.512, detectShadows=True)),
+    "untitled10": _subtractor("untitled10", "subtract_background",
+                              lambda: cv2.createBackgroundSubtractorKNN(history=10, dist2Threshold=15.0, detectShadows=True)),
+    "untitled15": _subtractor("untitled15", "detect_anomalies", cv2.createBackgroundSubtractorMOG2),
+    "untitled21": _frame_difference("untitled21"),
+    "untitled22": _frame_difference("untitled22"),
+    "untitled23": _frame_difference("untitled23"),
+    "untitled23.three_frame": _frame_difference("untitled23", "three_frame"),
+    "untitled23.running_average": _frame_difference("untitled23", "running_average"),
+    "untitled13": _detector("untitled13", "yolov8n.pt", 320),
+    "untitled14": _detector("untitled14", "yolov10n.pt", 512),
+}
+
+
+def synthetic_frames(width, height, count, seed=0):
+    source = SyntheticSource(width, height, frames=count, seed=seed)
+    return [source.read()[1] for _ in range(count)]
+
+
+def recorded_frames(path, width, height, count):
+    """First `count` frames of a clip (looped if shorter), resized to width x height."""
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame.shape[1::-1] != (width, height):
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise IOError(f"Error: Could not read frames from {path}.")
+    return [frames[index % len(frames)] for index in range(count)]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(pipeline, source, resolution, frames=100, warmup=10):
+    """
+    Benchmark one pipeline on one source at one resolution.
+
+    Parameters:
+    - pipeline: Key of PIPELINES.
+    - source: "synthetic" or a path to a recorded clip.
+    - resolution: Key of RESOLUTIONS.
+    - frames: Number of timed frames.
+    - warmup: Untimed frames run first (allocation, model warm-up, background learning).
+    """
+    result = {"pipeline": pipeline, "source": source, "resolution": resolution}
+    width, height = RESOLUTIONS[resolution]
+    try:
+        step = PIPELINES[pipeline]()
+    except (ImportError, OSError, FileNotFoundError) as e:
+        return {**result, "skipped": f"{type(e).__name__}: {e}"}
+
+    total = frames + warmup
+    if source == "synthetic":
+        inputs = synthetic_frames(width, height, total)
+    else:
+        inputs = recorded_frames(source, width, height, total)
+
+    latencies = np.empty(frames)
+    elapsed = 0.0
+    for index, frame in enumerate(inputs):
+        # Pipelines draw on their input, so every call gets its own copy (not timed)
+        frame = frame.copy()
+        start = time.perf_counter()
+        step(frame)
+        latency = time.perf_counter() - start
+        if index >= warmup:
+            latencies[index - warmup] = latency
+            elapsed += latency
+
+    return {
+        **result,
+        "frames": frames,
+        "fps": frames / elapsed if elapsed else float("inf"),
+        "mean_ms": float(latencies.mean() * 1000),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def case_key(result):
+    return f"{result['pipeline']}|{os.path.basename(result['source'])}|{result['resolution']}"
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compare results against a baseline report.
+
+    A case regresses when its fps dropped or its p99 latency grew by more
+    than `tolerance` (relative).  Returns a list of (key, message) regressions.
+    """
+    reference = {case_key(result): result for result in baseline["results"] if "fps" in result}
+    regressions = []
+    for result in results:
+        old = reference.get(case_key(result))
+        if old is None or "fps" not in result:
+            continue
+        if result["fps"] < old["fps"] * (1 - tolerance):
+            regressions.append((case_key(result), f"fps {old['fps']:.1f} -> {result['fps']:.1f}"))
+        if result["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+            regressions.append((case_key(result), f"p99 {old['p99_ms']:.2f} ms -> {result['p99_ms']:.2f} ms"))
+    return regressions
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+    }
+
+
+def run_suite(pipelines, sources, resolutions, frames=100, warmup=10, isolate=True):
+    cases = [(pipeline, source, resolution)
+             for pipeline in pipelines for source in sources for resolution in resolutions]
+    results = []
+    if isolate:
+        # A fresh process per case keeps peak RSS (and OpenCV/model state) per pipeline
+        context = mp.get_context("spawn")
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for case in cases:
+                results.append(pool.apply(run_case, (*case, frames, warmup)))
+                print_result(results[-1])
+    else:
+        for case in cases:
+            results.append(run_case(*case, frames, warmup))
+            print_result(results[-1])
+    return {"environment": environment(), "frames": frames, "warmup": warmup, "results": results}
+
+
+def print_result(result):
+    if "skipped" in result:
+        print(f"{case_key(result):45s} skipped ({result['skipped']})")
+    else:
+        print(f"{case_key(result):45s} {result['fps']:8.1f} fps  p50 {result['p50_ms']:7.2f} ms  "
+              f"p99 {result['p99_ms']:7.2f} ms  peak RSS {result['peak_rss_mb']:7.1f} MiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pipelines", default=",".join(PIPELINES),
+                        help="comma-separated pipeline names (default: all)")
+    parser.add_argument("--resolutions", default=",".join(RESOLUTIONS),
+                        help="comma-separated resolutions: " + ", ".join(RESOLUTIONS))
+    parser.add_argument("--video", action="append", default=[],
+                        help="recorded clip to benchmark on (repeatable); synthetic frames are always used")
+    parser.add_argument("--frames", type=int, default=100, help="timed frames per case")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed warm-up frames per case")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="compare against this JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative fps/p99 change")
+    parser.add_argument("--no-isolate", action="store_true", help="run every case in this process")
+    args = parser.parse_args(argv)
+
+    pipelines = [name for name in args.pipelines.split(",") if name]
+    resolutions = [name for name in args.resolutions.split(",") if name]
+    unknown = [name for name in pipelines if name not in PIPELINES] + \
+              [name for name in resolutions if name not in RESOLUTIONS]
+    if unknown:
+        parser.error(f"unknown pipelines/resolutions: {', '.join(unknown)}")
+
+    report = run_suite(pipelines, ["synthetic"] + args.video, resolutions,
+                       args.frames, args.warmup, not args.no_isolate)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline, args.tolerance)
+        for key, message in regressions:
+            print(f"REGRESSION {key}: {message}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
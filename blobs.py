@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized blob extraction from binary motion masks.
+
+The motion and anomaly scripts used to call cv2.findContours and then loop
+in Python over every contour (contourArea, boundingRect, one cv2.rectangle
+each).  With sensitive thresholds a noisy mask yields thousands of tiny
+contours, so the per-frame cost grew with the amount of noise.  Here one
+cv2.connectedComponentsWithStats call labels the mask and returns the
+bounding box and pixel count of every blob; filtering, merging and drawing
+work on the whole stats array at once:
+
+- extract_blobs(mask, min_area): (N, 5) int32 array of x, y, w, h, area.
+- suppress(blobs, overlap): greedy NMS, largest blob first, optionally
+  growing every kept box to cover the boxes it suppressed.
+- upscale_blobs: blobs found at a pyramid level in full-resolution pixels.
+- draw_blobs / draw_labels: every box with a single cv2.polylines call.
+- blob_stats: count, total and largest area, frame coverage.
+
+Areas are pixel counts, not contourArea's polygon areas (a one-pixel blob
+has a contour area of 0), so a threshold keeps slightly more small blobs
+than before.  Blobs lying inside the hole of another blob are reported too,
+where RETR_EXTERNAL skipped them; suppress() removes them if that matters.
+`python blobs.py` compares the speed with the findContours loop.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from frame_buffers import arena_buffer
+
+# Columns of a blob array, in the order of cv2.CC_STAT_LEFT .. cv2.CC_STAT_AREA
+X, Y, W, H, AREA = range(5)
+
+
+def extract_blobs(mask, min_area=0, connectivity=8, arena=None):
+    """
+    Bounding boxes and areas of the connected non-zero regions of a mask.
+
+    Only the bounding rectangle of the foreground is labelled, so a mostly
+    empty mask costs little more than the cv2.boundingRect scan.
+
+    Parameters:
+    - mask: Single-channel uint8 mask; every non-zero pixel is foreground.
+    - min_area: Only blobs with more than this many pixels are returned.
+    - connectivity: 8 (like findContours) or 4.
+    - arena: Optional FrameArena providing the label image.
+
+    Returns:
+    - (N, 5) int32 array of x, y, w, h, area, in label order (top to bottom).
+    """
+    x, y, w, h = cv2.boundingRect(mask)
+    if not w:
+        return np.zeros((0, 5), np.int32)
+    # Grana labels 2x2 blocks and is about twice as slow on odd sizes, so grow the region to even ones
+    rows, cols = mask.shape[:2]
+    if w & 1 and w < cols:
+        x, w = min(x, cols - w - 1), w + 1
+    if h & 1 and h < rows:
+        y, h = min(y, rows - h - 1), h + 1
+    labels = arena_buffer(arena, 'blobs.labels', mask, dtype=np.int32, channels=1)
+    if labels is not None:
+        # Contiguous view of the first w * h labels, so OpenCV writes into the arena buffer
+        labels = labels.reshape(-1)[:w * h].reshape(h, w)
+    # Grana's block-based labelling is 2-3x faster than the default (Spaghetti) on 1-CPU hosts
+    _, _, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(mask[y:y + h, x:x + w], connectivity, cv2.CV_32S,
+                                                                  cv2.CCL_GRANA, labels)
+    # Label 0 is the background
+    stats = stats[1:]
+    stats = stats[stats[:, AREA] > min_area]
+    stats[:, X] += x
+    stats[:, Y] += y
+    return stats
+
+
+def xyxy(blobs):
+    """(N, 4) x1, y1, x2, y2 corners of the blob boxes."""
+    return np.concatenate([blobs[:, :2], blobs[:, :2] + blobs[:, 2:4]], axis=1)
+
+
+def suppress(blobs, overlap=0.5, merge=True):
+    """
+    Greedy non-maximum suppression of overlapping blob boxes, largest area first.
+
+    Two boxes overlap when their intersection covers more than `overlap` of
+    the smaller one, so a box nested in a larger one is always suppressed.
+    With merge=True every kept box grows to the union of the boxes it
+    suppressed and adds up their areas.  Each step is one vectorized pass
+    over the remaining boxes, so the loop runs once per kept box.
+    """
+    if len(blobs) < 2:
+        return blobs
+    blobs = blobs[np.argsort(-blobs[:, AREA], kind="stable")]
+    corners = xyxy(blobs)
+    box_areas = blobs[:, W].astype(np.int64) * blobs[:, H]
+    remaining = np.arange(len(blobs))
+    kept = []
+    while len(remaining):
+        first, rest = remaining[0], remaining[1:]
+        width = np.minimum(corners[first, 2], corners[rest, 2]) - np.maximum(corners[first, 0], corners[rest, 0])
+        height = np.minimum(corners[first, 3], corners[rest, 3]) - np.maximum(corners[first, 1], corners[rest, 1])
+        intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+        covered = intersection > overlap * np.minimum(box_areas[first], box_areas[rest])
+        blob = blobs[first].copy()
+        if merge and covered.any():
+            group = np.append(rest[covered], first)
+            x1, y1 = corners[group, :2].min(axis=0)
+            x2, y2 = corners[group, 2:].max(axis=0)
+            blob[:AREA] = x1, y1, x2 - x1, y2 - y1
+            blob[AREA] = blobs[group, AREA].sum()
+        kept.append(blob)
+        remaining = rest[~covered]
+    return np.array(kept, dtype=blobs.dtype).reshape(-1, 5)
+
+
+def upscale_blobs(blobs, level, frame_shape):
+    """Blobs found at pyramid `level` in full-resolution pixels, clipped to the frame (see pyramid_motion)."""
+    if level <= 0 or not len(blobs):
+        return blobs
+    height, width = frame_shape[:2]
+    scaled = np.empty_like(blobs)
+    scaled[:, X] = blobs[:, X] << level
+    scaled[:, Y] = blobs[:, Y] << level
+    scaled[:, W] = np.minimum((blobs[:, X] + blobs[:, W]) << level, width) - scaled[:, X]
+    scaled[:, H] = np.minimum((blobs[:, Y] + blobs[:, H]) << level, height) - scaled[:, Y]
+    scaled[:, AREA] = blobs[:, AREA] << (2 * level)
+    return scaled
+
+
+def draw_blobs(frame, blobs, color=(0, 255, 0), thickness=2):
+    """Draw every blob box in place with one cv2.polylines call (same pixels as cv2.rectangle)."""
+    if not len(blobs):
+        return frame
+    x1, y1, x2, y2 = xyxy(blobs).astype(np.int32).T
+    polygons = np.stack([np.stack([x1, y1], 1), np.stack([x2, y1], 1),
+                         np.stack([x2, y2], 1), np.stack([x1, y2], 1)], axis=1)
+    cv2.polylines(frame, list(polygons.reshape(-1, 4, 1, 2)), True, color, thickness)
+    return frame
+
+
+def draw_labels(frame, blobs, text, offset=10, color=(0, 255, 0), font_scale=0.5, thickness=1):
+    """Put the same text above every blob box, with the origins converted to Python ints once."""
+    for x, y in blobs[:, :2].tolist():
+        cv2.putText(frame, text, (x, y - offset), cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
+    return frame
+
+
+def blob_stats(blobs, frame_shape=None):
+    """Count, total and largest area of the blobs, and the fraction of the frame they cover."""
+    areas = blobs[:, AREA].astype(np.int64)
+    stats = {
+        "count": len(blobs),
+        "area": int(areas.sum()),
+        "largest": int(areas.max()) if len(areas) else 0,
+        "mean_area": float(areas.mean()) if len(areas) else 0.0,
+    }
+    if frame_shape is not None:
+        stats["coverage"] = stats["area"] / float(frame_shape[0] * frame_shape[1])
+    return stats
+
+
+def _contour_loop(frame, mask, min_area):
+    # The per-contour loop the scripts used before
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in contours:
+        if cv2.contourArea(contour) > min_area:
+            x, y, w, h = cv2.boundingRect(contour)
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    return len(contours)
+
+
+def main(width=1280, height=720, repeats=20):
+    """Time the findContours loop against extract_blobs + draw_blobs on masks of growing noise."""
+    rng = np.random.default_rng(0)
+    frame = np.zeros((height, width, 3), np.uint8)
+    for density in (0.0, 0.0001, 0.001, 0.01, 0.05):
+        mask = np.where(rng.random((height, width)) < density, 255, 0).astype(np.uint8)
+        cv2.rectangle(mask, (100, 100), (400, 300), 255, -1)
+        cv2.circle(mask, (800, 400), 80, 255, -1)
+        timings = []
+        for func in (lambda: _contour_loop(frame, mask, 1),
+                     lambda: draw_blobs(frame, extract_blobs(mask, 1))):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                func()
+            timings.append((time.perf_counter() - start) / repeats * 1000)
+        contours = _contour_loop(frame, mask, 1)
+        blobs = extract_blobs(mask, 1)
+        print(f"noise {density:7.2%}: {contours:6d} contours  findContours loop {timings[0]:7.2f} ms  "
+              f"blobs {timings[1]:6.2f} ms  ({len(blobs)} blobs > 1 px, {len(suppress(blobs))} after NMS)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Event-triggered clip recording with an in-memory pre-roll.
+
+The motion and anomaly scripts keep nothing, and recording everything
+continuously costs disk and I/O for hours of empty scenes.  ClipRecorder
+keeps only the last `pre_roll` seconds and writes a clip when the pipeline
+fires:
+
+- push(frame) copies the frame into one of `max_pending` reused
+  buffers and queues it; that copy is all the processing loop pays.  When
+  every buffer is still waiting to be encoded the frame is dropped and
+  counted, so a slow encoder never blocks the loop.
+- An encoder thread JPEG-encodes every frame (about 65 KB instead of
+  2.7 MB at 720p) into a ring bounded by `pre_roll` seconds and
+  `max_ring_bytes`.
+- trigger() / update(regions) start a clip: the ring (the pre-roll) and
+  every frame up to `post_roll` seconds after the last trigger go to a
+  writer thread, which stores the JPEG bytes unchanged in an MJPEG AVI.
+  There is no second encode.  Clips longer than `max_clip` seconds are split.
+
+Memory stays bounded: max_pending raw frames, the ring, and at most
+`max_queued` encoded frames waiting for the disk.  When the disk falls
+behind, the encoder waits on the writer, the buffers fill and push()
+drops frames.  `python clip_recorder.py` records a synthetic scene and
+reports the cost of push() and the clips written.
+"""
+
+import collections
+import datetime
+import os
+import queue
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import blobs
+
+# AVI index flag of a frame that decodes on its own (every MJPEG frame)
+_KEYFRAME = 0x10
+
+
+class MjpegAviWriter:
+    """
+    Minimal AVI muxer for already JPEG-encoded frames (MJPG, one video stream).
+
+    Parameters:
+    - path: Output file.
+    - width, height: Frame size.
+    - fps: Frame rate stored in the headers.
+    """
+
+    def __init__(self, path, width, height, fps=30.0):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.index = []
+        self.file = open(path, "wb")
+        self._write_headers(0)
+        self.movi = self.file.tell()
+        self.file.write(b"LIST\0\0\0\0movi")
+
+    def _write_headers(self, frames):
+        rate = int(round(self.fps * 1000))
+        avih = struct.pack("<14I", int(round(1e6 / self.fps)), 0, 0, _KEYFRAME, frames, 0, 1, 0,
+                           self.width, self.height, 0, 0, 0, 0)
+        strh = b"vidsMJPG" + struct.pack("<IHHIIIIIIiI4h", 0, 0, 0, 0, 1000, rate, 0, frames, 0, -1, 0,
+                                         0, 0, self.width, self.height)
+        strf = struct.pack("<IiiHH4sIiiII", 40, self.width, self.height, 1, 24, b"MJPG",
+                           self.width * self.height * 3, 0, 0, 0, 0)
+        strl = b"strl" + self._chunk(b"strh", strh) + self._chunk(b"strf", strf)
+        hdrl = b"hdrl" + self._chunk(b"avih", avih) + self._chunk(b"LIST", strl)
+        self.file.seek(0)
+        self.file.write(b"RIFF\0\0\0\0AVI " + self._chunk(b"LIST", hdrl))
+
+    @staticmethod
+    def _chunk(fourcc, data):
+        return fourcc + struct.pack("<I", len(data)) + data + (b"\0" if len(data) & 1 else b"")
+
+    def write(self, jpeg):
+        """Append one JPEG-encoded frame (bytes or a uint8 array from cv2.imencode)."""
+        data = bytes(jpeg)
+        # idx1 offsets are relative to the "movi" fourcc
+        self.index.append((self.file.tell() - self.movi - 8, len(data)))
+        self.file.write(self._chunk(b"00dc", data))
+
+    def close(self):
+        """Write the index and patch the sizes and frame counts into the headers."""
+        if self.file.closed:
+            return
+        end = self.file.tell()
+        index = b"".join(struct.pack("<4sIII", b"00dc", _KEYFRAME, offset, size) for offset, size in self.index)
+        self.file.write(self._chunk(b"idx1", index))
+        size = self.file.tell()
+        self._write_headers(len(self.index))
+        self.file.seek(4)
+        self.file.write(struct.pack("<I", size - 8))
+        self.file.seek(self.movi + 4)
+        self.file.write(struct.pack("<I", end - self.movi - 8))
+        self.file.close()
+
+
+class ClipRecorder:
+    """
+    Pre-roll ring of encoded frames, flushed to a clip file when the pipeline fires.
+
+    Parameters:
+    - directory: Directory the clips are written to (None disables recording;
+      every method is then a no-op).
+    - pre_roll: Seconds of video kept before the first trigger of a clip.
+    - post_roll: Seconds recorded after the last trigger.
+    - fps: Frame rate written to the clip headers (the source's frame rate).
+    - quality: JPEG quality of the stored frames.
+    - min_area: Smallest blob area (pixels) with which update() triggers.
+    - max_pending: Raw frame buffers waiting for the encoder; push() drops
+      frames when all are in use.
+    - max_ring_bytes: Upper bound of the pre-roll ring's encoded size.
+    - max_queued: Encoded frames waiting for the writer thread.
+    - max_clip: Seconds after which a clip is closed and a new one started.
+    - prefix: Clip file name prefix (the clip's start time is appended).
+    """
+
+    def __init__(self, directory="clips", pre_roll=5.0, post_roll=5.0, fps=30.0, quality=80, min_area=0,
+                 max_pending=4, max_ring_bytes=64 * 1024 * 1024, max_queued=256, max_clip=300.0, prefix="clip"):
+        self.directory = directory
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fps = fps if fps and fps > 0 else 30.0
+        self.quality = quality
+        self.min_area = min_area
+        self.max_pending = max_pending
+        self.max_ring_bytes = max_ring_bytes
+        self.max_clip = max_clip
+        self.prefix = prefix
+        self.pushed = 0
+        self.dropped = 0
+        self._allocated = 0
+        self.clips = []
+        self._ring = collections.deque()
+        self._ring_bytes = 0
+        self._free = queue.Queue()
+        self._pending = queue.Queue()
+        self._writes = queue.Queue(max_queued)
+        self._clip_start = None
+        self._record_until = None
+        self._threads = []
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            for target, name in ((self._encode_loop, "clip-encoder"), (self._write_loop, "clip-writer")):
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def push(self, frame, timestamp=None):
+        """
+        Queue a copy of `frame` for the pre-roll (and the clip, while recording).
+
+        Returns False if the frame was dropped because the encoder is behind.
+        """
+        if self.directory is None:
+            return False
+        self.pushed += 1
+        try:
+            buffer = self._free.get_nowait()
+        except queue.Empty:
+            if self._allocated >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._allocated += 1
+            buffer = None
+        if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            buffer = np.empty_like(frame)
+        np.copyto(buffer, frame)
+        self._pending.put(("frame", buffer, time.time() if timestamp is None else timestamp))
+        return True
+
+    def trigger(self, timestamp=None):
+        """Start a clip (or extend the running one) at the latest pushed frame."""
+        if self.directory is None:
+            return
+        self._pending.put(("trigger", None, time.time() if timestamp is None else timestamp))
+
+    def update(self, regions, timestamp=None):
+        """
+        Trigger if any blob of the (N, 5) array is at least min_area pixels; returns whether it did.
+
+        (N, 4) x, y, w, h boxes trigger on their box area.
+        """
+        if self.directory is None or not len(regions):
+            return False
+        if self.min_area:
+            areas = (regions[:, blobs.AREA] if regions.shape[1] > blobs.AREA
+                     else regions[:, blobs.W].astype(np.int64) * regions[:, blobs.H])
+            if areas.max() < self.min_area:
+                return False
+        self.trigger(timestamp)
+        return True
+
+    def _encode_loop(self):
+        while True:
+            kind, buffer, timestamp = self._pending.get()
+            if kind == "stop":
+                if self._clip_start is not None:
+                    self._writes.put(("close", None))
+                self._writes.put(("stop", None))
+                return
+            if kind == "trigger":
+                self._start_clip(timestamp)
+                continue
+            ok, jpeg = cv2.imencode(".jpg", buffer, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            shape = buffer.shape
+            self._free.put(buffer)
+            if not ok:
+                continue
+            if self._clip_start is not None:
+                if timestamp > self._record_until:
+                    self._writes.put(("close", None))
+                    self._clip_start = None
+                else:
+                    if timestamp - self._clip_start > self.max_clip:
+                        # Split long recordings; the next clip starts with this frame
+                        self._writes.put(("close", None))
+                        self._open(timestamp, shape)
+                    self._writes.put(("frame", jpeg))
+            self._remember(timestamp, jpeg, shape)
+
+    def _remember(self, timestamp, jpeg, shape):
+        self._ring.append((timestamp, jpeg, shape))
+        self._ring_bytes += len(jpeg)
+        while self._ring and (timestamp - self._ring[0][0] > self.pre_roll or self._ring_bytes > self.max_ring_bytes):
+            self._ring_bytes -= len(self._ring.popleft()[1])
+
+    def _start_clip(self, timestamp):
+        self._record_until = timestamp + self.post_roll
+        if self._clip_start is not None or not self._ring:
+            return
+        # Hand the pre-roll to the writer; the frames after it follow from _encode_loop
+        start, _, shape = self._ring[0]
+        self._open(start, shape)
+        for _, jpeg, _ in self._ring:
+            self._writes.put(("frame", jpeg))
+
+    def _open(self, start, shape):
+        self._clip_start = start
+        name = datetime.datetime.fromtimestamp(start).strftime(f"{self.prefix}_%Y%m%d_%H%M%S_%f")[:-3] + ".avi"
+        self._writes.put(("open", (os.path.join(self.directory, name), shape[1], shape[0])))
+
+    def _write_loop(self):
+        writer = None
+        while True:
+            kind, payload = self._writes.get()
+            if kind == "open":
+                path, width, height = payload
+                writer = MjpegAviWriter(path, width, height, self.fps)
+            elif kind == "frame" and writer is not None:
+                writer.write(payload)
+            elif kind == "close" and writer is not None:
+                writer.close()
+                self.clips.append(writer.path)
+                writer = None
+            elif kind == "stop":
+                return
+
+    def close(self):
+        """Encode what is queued, finish the running clip and stop the threads."""
+        if self.directory is None:
+            return
+        self._pending.put(("stop", None, None))
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.directory = None
+
+    def summary(self):
+        return (f"clips={len(self.clips)} pushed={self.pushed} dropped={self.dropped} "
+                f"ring={len(self._ring)} frames/{self._ring_bytes / 1e6:.1f} MB")
+
+
+def main(width=1280, height=720, frames=300, fps=30.0):
+    """Record a synthetic scene that fires twice and report push() cost, drops and the clips."""
+    import tempfile
+
+    from video_io import SyntheticSource
+
+    source = SyntheticSource(width, height, frames=frames, fps=fps)
+    with tempfile.TemporaryDirectory() as directory:
+        clips = ClipRecorder(directory, pre_roll=2.0, post_roll=1.0, fps=fps)
+        elapsed = 0.0
+        start_time = time.time()
+        for index in range(frames):
+            ok, frame = source.read()
+            if not ok:
+                break
+            # Stand-in for the pipeline's detections: two bursts of motion
+            timestamp = start_time + index / fps
+            start = time.perf_counter()
+            clips.push(frame, timestamp)
+            if 90 <= index < 120 or 220 <= index < 230:
+                clips.trigger(timestamp)
+            elapsed += time.perf_counter() - start
+            # Pace the loop like a live camera
+            time.sleep(max(0.0, 1.0 / fps - (time.perf_counter() - start)))
+        clips.close()
+        print(f"push+trigger: {elapsed / frames * 1000:.2f} ms/frame  {clips.summary()}")
+        for path in clips.clips:
+            cap = cv2.VideoCapture(path)
+            count = 0
+            while cap.read()[0]:
+                count += 1
+            print(f"  {os.path.basename(path)}: {count} frames at {cap.get(cv2.CAP_PROP_FPS):.0f} fps, "
+                  f"{os.path.getsize(path) / 1e6:.1f} MB")
+            cap.release()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Process-wide cache of OpenCV objects and filter kernels, keyed by their parameters.
+
+The per-frame functions used to build a CLAHE object or a kernel array on
+every call.  They now ask this module instead, which builds each object
+once per parameter set and keeps it in a bounded LRU cache:
+
+- Kernels (plain arrays) are shared by all threads and marked read-only, so
+  a caller cannot modify a kernel another stage is using.
+- CLAHE objects keep internal buffers between apply() calls and are not
+  thread safe, so every thread gets its own instances (the strip-parallel
+  workers included).
+
+warm() builds a list of parameter sets ahead of time, so a parameter sweep
+starts without construction costs in its timed loop.  hits/misses of every
+cache are reported by stats().
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+class ObjectCache:
+    """
+    Bounded LRU cache of objects built by a factory from their key.
+
+    Parameters:
+    - factory: Callable building the object from the key's items.
+    - maxsize: Number of objects kept (least recently used are evicted).
+    - thread_local: Keep a separate cache per thread (for objects that are not thread safe).
+    """
+
+    def __init__(self, factory, maxsize=32, thread_local=False):
+        self.factory = factory
+        self.maxsize = maxsize
+        self.thread_local = thread_local
+        self.hits = 0
+        self.misses = 0
+        self._shared = OrderedDict()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _entries(self):
+        if not self.thread_local:
+            return self._shared
+        entries = getattr(self._local, "entries", None)
+        if entries is None:
+            entries = self._local.entries = OrderedDict()
+        return entries
+
+    def get(self, *key):
+        entries = self._entries()
+        value = entries.get(key)
+        if value is not None:
+            # Lock-free hit; a concurrent eviction of the key only costs its LRU position
+            try:
+                entries.move_to_end(key)
+            except KeyError:
+                pass
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = self.factory(*key)
+        with self._lock:
+            # If two threads race on a shared key, the first one wins
+            value = entries.setdefault(key, value)
+            while len(entries) > self.maxsize:
+                entries.popitem(last=False)
+        return value
+
+    def warm(self, keys):
+        """Build the objects for an iterable of keys (in the calling thread for thread-local caches)."""
+        for key in keys:
+            self.get(*key)
+
+    def clear(self):
+        with self._lock:
+            self._shared.clear()
+            self._local = threading.local()
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+_clahe = ObjectCache(lambda clip_limit, tile_grid_size: cv2.createCLAHE(clipLimit=clip_limit,
+                                                                         tileGridSize=tile_grid_size),
+                     maxsize=16, thread_local=True)
+_kernels = ObjectCache(lambda kind, *args: _read_only(_KERNEL_FACTORIES[kind](*args)), maxsize=64)
+
+_KERNEL_FACTORIES = {
+    "ones": lambda ksize, dtype: np.ones(ksize, np.dtype(dtype)),
+    "sharpen": lambda: np.array([[0, -1, 0],
+                                 [-1, 5, -1],
+                                 [0, -1, 0]]),
+    "structuring": lambda shape, ksize: cv2.getStructuringElement(shape, ksize),
+}
+
+
+def clahe(clip_limit=40.0, tile_grid_size=(8, 8)):
+    """CLAHE object of the calling thread for these parameters."""
+    return _clahe.get(float(clip_limit), tuple(tile_grid_size))
+
+
+def ones_kernel(ksize, dtype=np.uint8):
+    """Read-only np.ones(ksize, dtype) kernel (e.g. for morphology)."""
+    return _kernels.get("ones", tuple(ksize), np.dtype(dtype).str)
+
+
+def sharpen_kernel():
+    """Read-only 3x3 sharpening kernel used by enhance_details."""
+    return _kernels.get("sharpen")
+
+
+def structuring_element(shape, ksize):
+    """Read-only cv2.getStructuringElement(shape, ksize)."""
+    return _kernels.get("structuring", shape, tuple(ksize))
+
+
+def warm(clahe_params=(), ones_sizes=()):
+    """
+    Build CLAHE objects and kernels before a parameter sweep.
+
+    Parameters:
+    - clahe_params: Iterable of (clip_limit, tile_grid_size) pairs (built for the calling thread).
+    - ones_sizes: Iterable of ksize tuples for uint8 np.ones kernels.
+    """
+    for clip_limit, tile_grid_size in clahe_params:
+        clahe(clip_limit, tile_grid_size)
+    for ksize in ones_sizes:
+        ones_kernel(ksize)
+
+
+def stats():
+    return {name: {"hits": cache.hits, "misses": cache.misses}
+            for name, cache in (("clahe", _clahe), ("kernels", _kernels))}
+
+
+def main(width=640, height=480, repeats=2000):
+    """Time per-call construction against the cached objects."""
+    gray = np.random.default_rng(0).integers(0, 256, (height, width), dtype=np.uint8)
+    cases = {
+        "createCLAHE": lambda: cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)),
+        "cached CLAHE": lambda: clahe(3.0, (8, 8)),
+        "createCLAHE + apply": lambda: cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(gray),
+        "cached CLAHE + apply": lambda: clahe(3.0, (8, 8)).apply(gray),
+        "np.array sharpen": lambda: np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]]),
+        "cached sharpen": sharpen_kernel,
+        "np.ones((5, 5))": lambda: np.ones((5, 5), np.uint8),
+        "cached ones kernel": lambda: ones_kernel((5, 5)),
+    }
+    for name, func in cases.items():
+        func()
+        runs = []
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                func()
+            runs.append((time.perf_counter() - start) / repeats)
+        print(f"{name:22s} {min(runs) * 1e6:9.2f} us per call")
+    print(stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized detection container and batched box/label renderer.
+
+Detections wraps a structured NumPy array (x1, y1, x2, y2, score, class_id)
+so filtering, coordinate scaling and label formatting happen in bulk instead
+of a per-box Python loop (which also used to truncate the score to 0 or 1
+through map(int, box)).  DetectionRenderer draws every box with a single
+cv2.polylines call and feeds cv2.putText plain Python values converted once
+per frame.
+"""
+
+import cv2
+import numpy as np
+
+DETECTION_DTYPE = np.dtype([
+    ("x1", np.float32), ("y1", np.float32), ("x2", np.float32), ("y2", np.float32),
+    ("score", np.float32), ("class_id", np.int32),
+])
+
+
+class Detections:
+    """
+    Detections of one frame.
+
+    Parameters:
+    - data: Structured array with DETECTION_DTYPE.
+    - names: Class id -> name mapping (model.names).
+    - track_ids: Optional int array of persistent track ids (set by tracker.Tracker).
+    """
+
+    def __init__(self, data=None, names=None, track_ids=None):
+        self.data = np.zeros(0, DETECTION_DTYPE) if data is None else data
+        self.names = names or {}
+        self.track_ids = track_ids
+
+    @classmethod
+    def from_array(cls, boxes, names=None):
+        """Build from an (N, 6) [x1, y1, x2, y2, score, class_id] array (e.g. boxes.data)."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+        data = np.empty(len(boxes), DETECTION_DTYPE)
+        for index, field in enumerate(("x1", "y1", "x2", "y2", "score")):
+            data[field] = boxes[:, index]
+        data["class_id"] = boxes[:, 5]
+        return cls(data, names)
+
+    @classmethod
+    def from_result(cls, result, names=None):
+        """Build from one ultralytics Results object."""
+        return cls.from_array(result.boxes.data.cpu().numpy(), names)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        track_ids = None if self.track_ids is None else np.atleast_1d(self.track_ids[index])
+        return Detections(np.atleast_1d(self.data[index]), self.names, track_ids)
+
+    @property
+    def xyxy(self):
+        """(N, 4) float32 box corners."""
+        return np.stack([self.data["x1"], self.data["y1"], self.data["x2"], self.data["y2"]], axis=1)
+
+    @property
+    def scores(self):
+        return self.data["score"]
+
+    @property
+    def class_ids(self):
+        return self.data["class_id"]
+
+    def filter(self, min_score=None, classes=None):
+        """Keep detections with score >= min_score and class_id in classes."""
+        keep = np.ones(len(self.data), bool)
+        if min_score is not None:
+            keep &= self.data["score"] >= min_score
+        if classes is not None:
+            keep &= np.isin(self.data["class_id"], list(classes))
+        return Detections(self.data[keep], self.names, None if self.track_ids is None else self.track_ids[keep])
+
+    def scaled(self, scale_x, scale_y=None, offset_x=0.0, offset_y=0.0):
+        """Return a copy with coordinates multiplied by the scale and shifted by the offset."""
+        scale_y = scale_x if scale_y is None else scale_y
+        data = self.data.copy()
+        data["x1"] = data["x1"] * scale_x + offset_x
+        data["x2"] = data["x2"] * scale_x + offset_x
+        data["y1"] = data["y1"] * scale_y + offset_y
+        data["y2"] = data["y2"] * scale_y + offset_y
+        return Detections(data, self.names, self.track_ids)
+
+    def labels(self):
+        """'name: score' strings for every detection ('name #id: score' for tracks)."""
+        names = [self.names.get(class_id, class_id) for class_id in self.data["class_id"].tolist()]
+        if self.track_ids is not None:
+            names = [f"{name} #{track_id}" for name, track_id in zip(names, self.track_ids.tolist())]
+        return [f"{name}: {score:.2f}" for name, score in zip(names, self.data["score"].tolist())]
+
+
+class DetectionRenderer:
+    """
+    Draws detections in bulk.
+
+    Boxes go through a single cv2.polylines call.  Labels still use
+    cv2.putText (blitting cached glyph bitmaps with NumPy measured slower
+    than OpenCV's own text rasterizer), but coordinates and strings are
+    converted to plain Python values once per frame instead of per box.
+    """
+
+    def __init__(self, color=(0, 255, 0), thickness=2, font_scale=0.5, text_thickness=1,
+                 font=cv2.FONT_HERSHEY_SIMPLEX):
+        self.color = color
+        self.thickness = thickness
+        self.font_scale = font_scale
+        self.text_thickness = text_thickness
+        self.font = font
+
+    def draw_boxes(self, frame, detections):
+        if not len(detections):
+            return frame
+        corners = detections.xyxy.astype(np.int32)
+        polygons = np.stack([corners[:, [0, 1]], corners[:, [2, 1]], corners[:, [2, 3]], corners[:, [0, 3]]], axis=1)
+        cv2.polylines(frame, list(polygons.reshape(-1, 4, 1, 2)), True, self.color, self.thickness)
+        return frame
+
+    def draw_labels(self, frame, detections, offset=10):
+        """Draw every label with its text origin at (x1, y1 - offset)."""
+        origins = detections.xyxy[:, :2].astype(np.int32).tolist()
+        for (x, y), label in zip(origins, detections.labels()):
+            cv2.putText(frame, label, (x, y - offset), self.font, self.font_scale, self.color, self.text_thickness)
+        return frame
+
+    def draw(self, frame, detections):
+        """Draw boxes and labels in place and return the frame."""
+        self.draw_boxes(frame, detections)
+        return self.draw_labels(frame, detections)
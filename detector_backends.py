@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pluggable CPU backends for the YOLO detectors.
+
+- UltralyticsBackend runs the .pt weights through PyTorch (the current path).
+- OnnxBackend exports the weights once to ONNX (FP32, or INT8 with dynamic
+  quantization), caches the export on disk keyed by weights hash, imgsz and
+  precision, and runs it through onnxruntime with a configurable thread count.
+
+Both take a BGR frame (the ultralytics convention for numpy input) and return
+an (N, 6) float32 array of [x1, y1, x2, y2, score, class_id] in frame
+coordinates, so they can be swapped without touching the drawing code.
+"""
+
+import ast
+import hashlib
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from metrics import timed
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".onnx_cache")
+
+
+def weights_digest(path, chunk_size=1 << 20):
+    """Short sha256 of a weights file, used as the export cache key."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def export_onnx(weights, imgsz=320, precision="fp32", cache_dir=CACHE_DIR):
+    """
+    Export `weights` to ONNX once and return the cached model path.
+
+    Parameters:
+    - weights: Path to yolov8n.pt / yolov10n.pt style weights.
+    - imgsz: Square input size baked into the export.
+    - precision: "fp32" or "int8" (dynamic weight quantization of the FP32 export).
+    - cache_dir: Directory holding the exports.
+    """
+    if precision not in ("fp32", "int8"):
+        raise ValueError(f"Unknown precision: {precision}")
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    key = f"{stem}-{weights_digest(weights)}-{imgsz}"
+    fp32_path = os.path.join(cache_dir, f"{key}-fp32.onnx")
+    if not os.path.exists(fp32_path):
+        from ultralytics import YOLO
+
+        exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=False)
+        shutil.move(exported, fp32_path + ".tmp")
+        os.replace(fp32_path + ".tmp", fp32_path)
+    if precision == "fp32":
+        return fp32_path
+
+    int8_path = os.path.join(cache_dir, f"{key}-int8.onnx")
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QUInt8)
+        os.replace(int8_path + ".tmp", int8_path)
+    return int8_path
+
+
+def letterbox(image, size, color=(114, 114, 114)):
+    """
+    Resize keeping the aspect ratio and pad to size x size, as ultralytics does.
+
+    Returns the padded image, the scale gain and the (left, top) padding.
+    """
+    height, width = image.shape[:2]
+    gain = min(size / height, size / width)
+    new_width, new_height = int(round(width * gain)), int(round(height * gain))
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return image, gain, (left, top)
+
+
+class UltralyticsBackend:
+    """PyTorch inference through ultralytics.YOLO."""
+
+    def __init__(self, weights, imgsz=320, conf=0.25, iou=0.7):
+        from ultralytics import YOLO
+
+        self.model = YOLO(weights)
+        self.names = self.model.names
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+
+    @timed("yolo")
+    def __call__(self, frame):
+        results = self.model(frame, imgsz=self.imgsz, conf=self.conf, iou=self.iou, verbose=False)
+        return results[0].boxes.data.cpu().numpy().astype(np.float32)
+
+
+class OnnxBackend:
+    """
+    onnxruntime inference of a cached ONNX export.
+
+    Parameters:
+    - weights: .pt weights (exported on first use) or an existing .onnx file.
+    - imgsz: Square input size.
+    - precision: "fp32" or "int8".
+    - threads: intra-op thread count for onnxruntime (None = library default).
+    - conf, iou: Confidence threshold and NMS IoU (NMS is skipped for
+      end-to-end models such as YOLOv10).
+    - max_det: Maximum detections per frame.
+    """
+
+    def __init__(self, weights, imgsz=320, precision="fp32", threads=None, conf=0.25, iou=0.7, max_det=300,
+                 cache_dir=CACHE_DIR):
+        import onnxruntime as ort
+
+        path = weights if weights.endswith(".onnx") else export_onnx(weights, imgsz, precision, cache_dir)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+    def preprocess(self, frame):
+        image, gain, pad = letterbox(frame, self.imgsz)
+        blob = cv2.dnn.blobFromImage(image, scalefactor=1 / 255.0, swapRB=True)
+        return blob, gain, pad
+
+    def postprocess(self, output, gain, pad, frame_shape):
+        if output.shape[-1] == 6:
+            # End-to-end export (YOLOv10): (1, max_det, 6) already in xyxy
+            boxes = output[0]
+            boxes = boxes[boxes[:, 4] > self.conf]
+        else:
+            # YOLOv8 export: (1, 4 + classes, anchors) with cx, cy, w, h
+            predictions = output[0].T
+            class_scores = predictions[:, 4:]
+            class_ids = class_scores.argmax(axis=1)
+            scores = class_scores[np.arange(len(class_ids)), class_ids]
+            keep = scores > self.conf
+            predictions, scores, class_ids = predictions[keep], scores[keep], class_ids[keep]
+            xywh = predictions[:, :4]
+            corners = np.empty_like(xywh)
+            corners[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+            corners[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+            boxes = np.column_stack([corners, scores, class_ids]).astype(np.float32)
+            if len(boxes):
+                top_left_wh = np.column_stack([corners[:, :2], xywh[:, 2:]])
+                kept = cv2.dnn.NMSBoxesBatched(top_left_wh.tolist(), scores.tolist(), class_ids.tolist(),
+                                               self.conf, self.iou)
+                kept = np.asarray(kept, dtype=np.int64).reshape(-1)
+                kept = kept[np.argsort(-scores[kept], kind="stable")]
+                boxes = boxes[kept]
+        boxes = boxes[:self.max_det].astype(np.float32, copy=True)
+
+        # Undo the letterbox: remove padding, rescale and clip to the frame
+        boxes[:, [0, 2]] -= pad[0]
+        boxes[:, [1, 3]] -= pad[1]
+        boxes[:, :4] /= gain
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, frame_shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, frame_shape[0])
+        return boxes
+
+    @timed("yolo")
+    def __call__(self, frame):
+        blob, gain, pad = self.preprocess(frame)
+        output = self.session.run(None, {self.input_name: blob})[0]
+        return self.postprocess(output, gain, pad, frame.shape)
+
+
+def load_detector(weights, imgsz=320, backend="torch", threads=None, **kwargs):
+    """
+    Create a detector backend by name.
+
+    - "torch": ultralytics / PyTorch (default, current behaviour)
+    - "onnx": onnxruntime FP32
+    - "onnx-int8": onnxruntime with dynamically quantized INT8 weights
+    """
+    if backend == "torch":
+        return UltralyticsBackend(weights, imgsz, **kwargs)
+    if backend == "onnx":
+        return OnnxBackend(weights, imgsz, "fp32", threads, **kwargs)
+    if backend == "onnx-int8":
+        return OnnxBackend(weights, imgsz, "int8", threads, **kwargs)
+    raise ValueError(f"Unknown detector backend: {backend}")
+
+
+def max_box_difference(reference, boxes):
+    """Largest coordinate difference after matching boxes of the same class by IoU."""
+    if len(reference) != len(boxes):
+        return float("inf")
+    worst = 0.0
+    for box in reference:
+        same_class = boxes[boxes[:, 5] == box[5]]
+        if not len(same_class):
+            return float("inf")
+        worst = max(worst, float(np.abs(same_class[:, :4] - box[:4]).max(axis=1).min()))
+    return worst
+
+
+def main(weights='yolov8n.pt', imgsz=320, frames=50, threads=None):
+    """Compare the PyTorch and onnxruntime backends on one test image and synthetic frames."""
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (240, 320, 3), dtype=np.uint8) for _ in range(frames)]
+    if os.path.exists("bus.jpg"):
+        images[0] = cv2.imread("bus.jpg")
+
+    reference = load_detector(weights, imgsz, "torch")
+    for name in ("torch", "onnx", "onnx-int8"):
+        detector = reference if name == "torch" else load_detector(weights, imgsz, name, threads)
+        detector(images[0])
+        start = time.perf_counter()
+        for image in images:
+            detector(image)
+        elapsed = time.perf_counter() - start
+        difference = max_box_difference(reference(images[0]), detector(images[0]))
+        print(f"{name}: {frames / elapsed:.1f} fps, max box difference vs torch: {difference:.2f} px")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motion events and a compact, queryable JSON-lines event log.
+
+The motion and anomaly scripts only draw "Anomaly Detected" boxes on the
+frame, so finding out what happened during the night means replaying the
+video, and anomaly_detection.log stays empty.  This module turns the
+per-frame blob arrays of blobs.extract_blobs into events:
+
+- EventAggregator merges the blobs of consecutive frames into time-bounded
+  events: a blob joins the open event whose last box it overlaps (grown by
+  `margin` pixels), and an event closes once it has seen no blob for `gap`
+  seconds.  A closed event has its start and end time, frame count, peak
+  area (summed blob pixels in one frame) and the bounding hull of all its
+  blobs; events shorter than `min_frames` frames are dropped as noise.
+- EventLog appends the closed events as one JSON object per line.  Events
+  are buffered and written in batches (one open/write per `batch_size`
+  events or `flush_interval` seconds), the file rotates at `max_bytes` like
+  logging.handlers.RotatingFileHandler, and every batch gets a line in a
+  sidecar index (<log>.idx) with its byte range and time span.
+- query() answers "what happened between 02:00 and 03:00" from the log
+  alone: with the index it reads only the batches overlapping the span.
+- EventRecorder ties both to a clock for the scripts.
+
+The per-frame cost is a vectorized overlap test of the frame's blobs
+against the open events.  `python events.py query --since 02:00 --until 03:00`
+prints the events of a span; `python events.py benchmark` measures the
+aggregation and an indexed query against a full scan.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+
+import blobs
+
+DEFAULT_LOG = "anomaly_detection.log"
+
+INDEX_SUFFIX = ".idx"
+
+
+class EventAggregator:
+    """
+    Merges per-frame blobs into time-bounded events.
+
+    Parameters:
+    - min_area: Blobs with fewer pixels are ignored.
+    - margin: Pixels an event's last box is grown by when matching blobs.
+    - gap: Seconds without a blob after which an event closes.
+    - min_frames: Events seen in fewer frames are discarded when they close.
+    - max_duration: Longer events are closed and continued as a new event,
+      so a scene in constant motion still reaches the log (None = never).
+    - source: Name stored in every event (camera, script or file).
+    """
+
+    def __init__(self, min_area=0, margin=16, gap=2.0, min_frames=3, max_duration=300.0, source=None):
+        self.min_area = min_area
+        self.margin = margin
+        self.gap = gap
+        self.min_frames = min_frames
+        self.max_duration = max_duration
+        self.source = source
+        self.open = []
+        self.next_id = 0
+
+    def _start(self, corners, area, timestamp):
+        event = {
+            "id": self.next_id,
+            "start": timestamp,
+            "end": timestamp,
+            "frames": 1,
+            "peak_area": area,
+            "peak_time": timestamp,
+            "last_area": area,
+            "box": corners.copy(),
+            "hull": corners.copy(),
+            "labels": set(),
+        }
+        self.next_id += 1
+        self.open.append(event)
+        return event
+
+    @staticmethod
+    def _extend(event, corners, area, timestamp):
+        if event["end"] != timestamp:
+            event["frames"] += 1
+            event["box"] = corners.copy()
+        else:
+            # Second group of blobs in the same frame: grow the frame's box
+            event["box"][:2] = np.minimum(event["box"][:2], corners[:2])
+            event["box"][2:] = np.maximum(event["box"][2:], corners[2:])
+            area += event["last_area"]
+        event["end"] = timestamp
+        event["last_area"] = area
+        event["hull"][:2] = np.minimum(event["hull"][:2], corners[:2])
+        event["hull"][2:] = np.maximum(event["hull"][2:], corners[2:])
+        if area > event["peak_area"]:
+            event["peak_area"] = area
+            event["peak_time"] = timestamp
+
+    def _record(self, event):
+        x1, y1, x2, y2 = event["hull"].tolist()
+        record = {
+            "id": event["id"],
+            "start": round(event["start"], 3),
+            "end": round(event["end"], 3),
+            "frames": event["frames"],
+            "peak_area": int(event["peak_area"]),
+            "peak_time": round(event["peak_time"], 3),
+            "hull": [x1, y1, x2 - x1, y2 - y1],
+        }
+        if event["labels"]:
+            record["labels"] = sorted(event["labels"])
+        if self.source is not None:
+            record["source"] = self.source
+        return record
+
+    def _close(self, closing):
+        return [self._record(event) for event in closing if event["frames"] >= self.min_frames]
+
+    def update(self, regions, timestamp, labels=None):
+        """
+        Add the blobs of one frame.
+
+        Parameters:
+        - regions: (N, 5) blob array (x, y, w, h, area) in full-resolution pixels,
+          or (N, 4) x, y, w, h boxes (motion_gate.motion_regions), whose box
+          areas are used instead.
+        - timestamp: Frame time in seconds (time.time() for live sources).
+        - labels: Optional class names detected in the frame; they are added
+          to every event that has a blob in it.
+
+        Returns:
+        - List of the event records closed by this frame.
+        """
+        if len(regions):
+            if regions.shape[1] > blobs.AREA:
+                areas = regions[:, blobs.AREA].astype(np.int64)
+            else:
+                areas = regions[:, blobs.W].astype(np.int64) * regions[:, blobs.H]
+            if self.min_area:
+                keep = areas >= self.min_area
+                regions, areas = regions[keep], areas[keep]
+        if len(regions):
+            corners = blobs.xyxy(regions).astype(np.int64)
+            touched = self._assign(corners, areas, timestamp)
+            if labels:
+                for event in touched:
+                    event["labels"].update(labels)
+
+        kept, closing = [], []
+        for event in self.open:
+            ended = timestamp - event["end"] > self.gap
+            too_long = self.max_duration is not None and event["end"] - event["start"] >= self.max_duration
+            (closing if ended or too_long else kept).append(event)
+        self.open = kept
+        return self._close(closing)
+
+    def _assign(self, corners, areas, timestamp):
+        # Intersection of every blob with every open event's last box, grown by the margin
+        assignment = np.full(len(corners), -1)
+        if self.open:
+            boxes = np.array([event["box"] for event in self.open])
+            boxes[:, :2] -= self.margin
+            boxes[:, 2:] += self.margin
+            width = np.minimum(corners[:, None, 2], boxes[None, :, 2]) - np.maximum(corners[:, None, 0], boxes[None, :, 0])
+            height = np.minimum(corners[:, None, 3], boxes[None, :, 3]) - np.maximum(corners[:, None, 1], boxes[None, :, 1])
+            overlap = np.clip(width, 0, None) * np.clip(height, 0, None)
+            best = overlap.argmax(axis=1)
+            hit = overlap[np.arange(len(corners)), best] > 0
+            assignment[hit] = best[hit]
+
+        touched = []
+        for index in np.unique(assignment[assignment >= 0]).tolist():
+            members = assignment == index
+            group = corners[members]
+            union = np.concatenate([group[:, :2].min(axis=0), group[:, 2:].max(axis=0)])
+            event = self.open[index]
+            self._extend(event, union, int(areas[members].sum()), timestamp)
+            touched.append(event)
+
+        # Blobs of no open event start new ones; later blobs near a new event join it
+        started = []
+        for row in np.flatnonzero(assignment < 0).tolist():
+            box, area = corners[row], int(areas[row])
+            for event in started:
+                grown = event["box"]
+                if (box[0] < grown[2] + self.margin and box[2] > grown[0] - self.margin
+                        and box[1] < grown[3] + self.margin and box[3] > grown[1] - self.margin):
+                    self._extend(event, box, area, timestamp)
+                    break
+            else:
+                started.append(self._start(box, area, timestamp))
+        return touched + started
+
+    def flush(self):
+        """Close every open event (end of the video); returns their records."""
+        closing, self.open = self.open, []
+        return self._close(closing)
+
+
+class EventLog:
+    """
+    Buffered, batched, rotating JSON-lines event log with a sidecar index.
+
+    Parameters:
+    - path: Log file (rotated copies are path.1 .. path.<backup_count>).
+    - max_bytes: Size at which the log rotates (0 = never).
+    - backup_count: Rotated copies kept.
+    - batch_size: Buffered events that trigger a write.
+    - flush_interval: Seconds after which buffered events are written anyway
+      (checked by write() and poll(); EventRecorder polls on every frame).
+    - index: Write the <path>.idx sidecar (one line per batch: byte offset,
+      length, event count and the earliest start / latest end in it).
+    """
+
+    def __init__(self, path=DEFAULT_LOG, max_bytes=10 * 1024 * 1024, backup_count=5, batch_size=64,
+                 flush_interval=5.0, index=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.index = index
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def write(self, event):
+        """Buffer one event record; writes the batch when it is full or old enough."""
+        self.pending.append(event)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        else:
+            self.poll()
+
+    def poll(self):
+        """Write the buffered events if the oldest batch is flush_interval seconds old; call once per frame."""
+        if self.pending and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def extend(self, events):
+        for event in events:
+            self.write(event)
+
+    def _rotate(self):
+        for suffix in ("", INDEX_SUFFIX):
+            for number in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{number}{suffix}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{number + 1}{suffix}")
+            if os.path.exists(self.path + suffix):
+                if self.backup_count > 0:
+                    os.replace(self.path + suffix, f"{self.path}.1{suffix}")
+                else:
+                    os.remove(self.path + suffix)
+
+    def flush(self):
+        """Write every buffered event with one append (and one index line)."""
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        events, self.pending = self.pending, []
+        data = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events).encode("utf-8")
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if self.max_bytes and size and size + len(data) > self.max_bytes:
+            self._rotate()
+            size = 0
+        with open(self.path, "ab") as log:
+            log.write(data)
+        if self.index:
+            entry = {"offset": size, "length": len(data), "count": len(events),
+                     "start": min(event["start"] for event in events), "end": max(event["end"] for event in events)}
+            with open(self.path + INDEX_SUFFIX, "a") as index:
+                index.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self.flush()
+
+
+class EventRecorder:
+    """
+    EventAggregator and EventLog driven by a clock, for the live scripts.
+
+    Parameters:
+    - path: Event log (None disables recording; every method is then a no-op).
+    - source: Name stored in every event.
+    - clock: Timestamp of the current frame (time.time for live sources).
+    - log_options: EventLog arguments (max_bytes, batch_size, ...).
+    - Other keyword arguments go to EventAggregator (min_area, gap, ...).
+    """
+
+    def __init__(self, path=DEFAULT_LOG, source=None, clock=time.time, log_options=None, **aggregator_options):
+        self.path = path
+        self.clock = clock
+        self.aggregator = EventAggregator(source=source, **aggregator_options)
+        self.log = EventLog(path, **(log_options or {})) if path is not None else None
+
+    def update(self, regions, timestamp=None, labels=None):
+        """Add the blobs of one frame (full-resolution pixels); returns the events it closed."""
+        if self.log is None:
+            return []
+        closed = self.aggregator.update(regions, self.clock() if timestamp is None else timestamp, labels)
+        self.log.extend(closed)
+        # Quiet frames close no events; this still writes what is buffered on time
+        self.log.poll()
+        return closed
+
+    def close(self):
+        """Close the open events and write everything still buffered."""
+        if self.log is None:
+            return
+        self.log.extend(self.aggregator.flush())
+        self.log.close()
+
+
+def log_files(path=DEFAULT_LOG):
+    """Existing log files, oldest rotated copy first."""
+    directory = os.path.dirname(path) or "."
+    prefix = os.path.basename(path) + "."
+    numbers = sorted((int(name[len(prefix):]) for name in os.listdir(directory)
+                      if name.startswith(prefix) and name[len(prefix):].isdigit()), reverse=True)
+    files = [f"{path}.{number}" for number in numbers]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def _read_index(path, size):
+    # The index is only used if its batches tile the whole log without gaps: a crash
+    # between the two writes, or a batch written with index=False, leaves a hole that
+    # later index lines would otherwise hide
+    entries = []
+    try:
+        with open(path + INDEX_SUFFIX) as index:
+            for line in index:
+                entries.append(json.loads(line))
+    except (OSError, ValueError):
+        return None
+    covered = 0
+    for entry in entries:
+        if entry["offset"] != covered:
+            return None
+        covered += entry["length"]
+    if not entries or covered != size:
+        return None
+    return entries
+
+
+def _ranges(path, start, end, use_index):
+    # Byte ranges of the file that can hold events overlapping [start, end]
+    size = os.path.getsize(path)
+    entries = _read_index(path, size) if use_index else None
+    if entries is None:
+        return [(0, size)]
+    return [(entry["offset"], entry["length"]) for entry in entries
+            if (start is None or entry["end"] >= start) and (end is None or entry["start"] <= end)]
+
+
+def query(path=DEFAULT_LOG, start=None, end=None, source=None, use_index=True):
+    """
+    Events overlapping [start, end] (epoch seconds, None = open), oldest file first.
+
+    Parameters:
+    - path: Event log; its rotated copies are searched too.
+    - start, end: Time span; an event matches if it was active at any time in it.
+    - source: Only events of this source.
+    - use_index: Read only the batches the sidecar index says can match.
+
+    Returns:
+    - List of event records (dicts), in the order they were logged.
+    """
+    found = []
+    for name in log_files(path):
+        with open(name, "rb") as log:
+            for offset, length in _ranges(name, start, end, use_index):
+                log.seek(offset)
+                for line in log.read(length).splitlines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if ((start is None or event["end"] >= start) and (end is None or event["start"] <= end)
+                            and (source is None or event.get("source") == source)):
+                        found.append(event)
+    return found
+
+
+def parse_time(text, day=None):
+    """
+    Epoch seconds of "HH:MM[:SS]" (on `day`, default today, local time), an ISO date/time or a number.
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        clock = datetime.time.fromisoformat(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    day = day or datetime.date.today()
+    return datetime.datetime.combine(day, clock).timestamp()
+
+
+def format_time(seconds):
+    return datetime.datetime.fromtimestamp(seconds).isoformat(sep=" ", timespec="seconds")
+
+
+def _query(args):
+    day = datetime.date.fromisoformat(args.date) if args.date else None
+    start = parse_time(args.since, day) if args.since else None
+    end = parse_time(args.until, day) if args.until else None
+    if start is not None and end is not None and end < start:
+        # "22:00" to "02:00" spans midnight
+        end += 24 * 3600
+    events = query(args.log, start, end, args.source)
+    if args.json:
+        for event in events:
+            print(json.dumps(event, separators=(",", ":")))
+        return
+    for event in events:
+        x, y, w, h = event["hull"]
+        labels = " " + ",".join(event["labels"]) if event.get("labels") else ""
+        print(f"{format_time(event['start'])} - {format_time(event['end'])}  {event['frames']:5d} frames  "
+              f"peak {event['peak_area']:7d} px  hull {x},{y} {w}x{h}  {event.get('source', '')}{labels}")
+    print(f"{len(events)} events")
+
+
+def _benchmark(args):
+    import tempfile
+
+    import cv2
+
+    from video_io import SyntheticSource
+
+    source = SyntheticSource(1280, 720, frames=args.frames)
+    subtractor = cv2.createBackgroundSubtractorMOG2()
+    frames = []
+    for _ in range(args.frames):
+        mask = subtractor.apply(source.read()[1])
+        cv2.threshold(mask, 200, 255, cv2.THRESH_BINARY, dst=mask)
+        frames.append(blobs.extract_blobs(mask, 15))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "events.log")
+        # A day of 30 fps video compressed into repeats of the clip
+        aggregator = EventAggregator(min_area=100, source="synthetic")
+        log = EventLog(path, max_bytes=0)
+        elapsed, count = 0.0, 0
+        for repeat in range(args.repeats):
+            for index, regions in enumerate(frames):
+                timestamp = 1e9 + (repeat * (len(frames) + 90) + index) / 30.0
+                start = time.perf_counter()
+                log.extend(aggregator.update(regions, timestamp))
+                elapsed += time.perf_counter() - start
+                count += 1
+            # Three seconds without motion between the repeats
+            log.extend(aggregator.update(frames[0][:0], timestamp + 3.0))
+        log.extend(aggregator.flush())
+        log.close()
+        print(f"aggregation: {elapsed / count * 1e6:.1f} us/frame over {count} frames, "
+              f"{os.path.getsize(path) / 1024:.1f} KiB log")
+
+        span = (1e9 + 600, 1e9 + 660)
+        for use_index in (True, False):
+            start = time.perf_counter()
+            for _ in range(20):
+                events = query(path, *span, use_index=use_index)
+            print(f"query {'with' if use_index else 'without'} index: "
+                  f"{(time.perf_counter() - start) / 20 * 1000:.2f} ms, {len(events)} events")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or benchmark the motion event log")
+    commands = parser.add_subparsers(dest="command")
+    query_parser = commands.add_parser("query", help="print the events of a time span")
+    query_parser.add_argument("--log", default=DEFAULT_LOG)
+    query_parser.add_argument("--since", help="HH:MM[:SS], ISO date/time or epoch seconds")
+    query_parser.add_argument("--until", help="HH:MM[:SS], ISO date/time or epoch seconds")
+    query_parser.add_argument("--date", help="day of HH:MM times (default today)")
+    query_parser.add_argument("--source")
+    query_parser.add_argument("--json", action="store_true", help="print the raw JSON lines")
+    benchmark_parser = commands.add_parser("benchmark", help="time aggregation and indexed queries")
+    benchmark_parser.add_argument("--frames", type=int, default=300)
+    benchmark_parser.add_argument("--repeats", type=int, default=100)
+    args = parser.parse_args(argv)
+    if args.command == "benchmark":
+        _benchmark(args)
+    elif args.command == "query":
+        _query(args)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Preallocated frame buffers for the per-frame image pipelines.
+
+A FrameArena hands out reusable arrays keyed by (name, shape, dtype).  The
+pipelines pass them to OpenCV through the dst= parameters (and to NumPy
+through out=), so once the first frame has been processed no new frame-sized
+arrays are allocated.  The arena counts every buffer it has to create, which
+makes the steady-state allocation rate visible.
+"""
+
+import numpy as np
+
+
+class FrameArena:
+    """
+    Pool of reusable frame-sized arrays.
+
+    Buffers are keyed by a stage name plus shape and dtype, so two stages of
+    the same pipeline never alias each other.  Buffers returned by get() are
+    overwritten on the next frame; copy them if they must outlive it.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.frames = 0
+        self.last_frame_allocations = 0
+        self._frame_start_allocations = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        """Return the buffer for (name, shape, dtype), creating it on first use."""
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = np.empty(key[1], dtype=key[2])
+            self._buffers[key] = buffer
+            self.allocations += 1
+            self.allocated_bytes += buffer.nbytes
+        return buffer
+
+    def like(self, name, image, dtype=None, channels=None):
+        """
+        Return a buffer shaped like `image`.
+
+        - dtype: override the element type (e.g. np.float64 for float stages).
+        - channels: 1 for a single-channel (H, W) buffer, N for (H, W, N).
+        """
+        shape = image.shape[:2]
+        if channels is None:
+            shape = image.shape
+        elif channels > 1:
+            shape = shape + (channels,)
+        return self.get(name, shape, image.dtype if dtype is None else dtype)
+
+    def next_frame(self):
+        """Mark the end of a frame and return the allocations made during it."""
+        self.last_frame_allocations = self.allocations - self._frame_start_allocations
+        self._frame_start_allocations = self.allocations
+        self.frames += 1
+        return self.last_frame_allocations
+
+    @property
+    def allocations_per_frame(self):
+        """Average buffer allocations per completed frame."""
+        return self.allocations / self.frames if self.frames else 0.0
+
+    def clear(self):
+        """Drop every cached buffer (e.g. after a resolution change)."""
+        self._buffers.clear()
+
+    def summary(self):
+        return (f"frames={self.frames} buffers={len(self._buffers)} "
+                f"allocations={self.allocations} "
+                f"last_frame={self.last_frame_allocations} "
+                f"per_frame={self.allocations_per_frame:.3f} "
+                f"bytes={self.allocated_bytes}")
+
+
+def arena_buffer(arena, name, image, dtype=None, channels=None):
+    """arena.like(...) when an arena is given, otherwise None (let OpenCV allocate)."""
+    if arena is None:
+        return None
+    return arena.like(name, image, dtype=dtype, channels=channels)
+
+
+def cast_into(dst, src, dtype=np.uint8):
+    """Truncating cast like src.astype(dtype), written into dst when one is given."""
+    if dst is None:
+        return src.astype(dtype)
+    np.copyto(dst, src, casting="unsafe")
+    return dst
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stateful frame differencing over a ring buffer of preprocessed gray frames.
+
+detect_anomalies in untitled21/22/23.py used to take the previous and the
+current BGR frame, convert both to gray (so every frame was converted
+twice) and draw the boxes onto the previous frame.  FrameDifferencer
+converts, optionally downscales and blurs each frame exactly once, keeps
+the results in a ring buffer and compares the new frame with them:
+
+- "two_frame": |g(t) - g(t-1)| > threshold.
+- "three_frame": |g(t) - g(t-1)| > threshold and |g(t) - g(t-2)| > threshold,
+  which keeps the object where it is now and drops the region it has just
+  uncovered.
+- "running_average": |g(t) - avg| > threshold, with avg an exponential
+  running average of the frames (cv2.accumulateWeighted, weight `alpha`),
+  which also finds slow motion two consecutive frames hide.
+
+Blurring the frames instead of their difference is what lets each frame be
+blurred once; the masks are close to, but not bit-identical with, the old
+blurred differences.  `python frame_diff.py` compares the modes with the
+old two-conversion code on synthetic video with a known foreground.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+import pyramid_motion
+import strip_parallel
+
+MODES = ("two_frame", "three_frame", "running_average")
+
+# Frames kept in the ring buffer per mode
+_DEPTHS = {"two_frame": 2, "three_frame": 3, "running_average": 1}
+
+
+class FrameDifferencer:
+    """
+    Motion masks from the differences between consecutive preprocessed frames.
+
+    Parameters:
+    - mode: One of MODES.
+    - threshold: Difference above which a pixel is motion (cv2.THRESH_BINARY).
+    - blur_ksize: Gaussian kernel applied to every gray frame (None = no blur),
+      given at full resolution.
+    - level: Pyramid level the frames are processed at (0 = full resolution).
+    - alpha: Weight of the newest frame in the running average.
+
+    push() returns a mask buffer that is overwritten by the next call.
+    """
+
+    def __init__(self, mode="two_frame", threshold=25, blur_ksize=None, level=0, alpha=0.05):
+        if mode not in MODES:
+            raise ValueError(f"Unknown differencing mode {mode!r}; expected one of {MODES}")
+        self.mode = mode
+        self.threshold = threshold
+        self.blur_ksize = None if blur_ksize is None else pyramid_motion.scaled_ksize(blur_ksize, level)
+        self.level = level
+        self.alpha = alpha
+        self.ring = None
+        self.count = 0
+        self.index = -1
+
+    def _allocate(self, shape):
+        self.ring = np.empty((_DEPTHS[self.mode],) + shape, np.uint8)
+        self.gray = np.empty(shape, np.uint8)
+        self.difference = np.empty(shape, np.uint8)
+        self.mask = np.empty(shape, np.uint8)
+        self.older = np.empty(shape, np.uint8) if self.mode == "three_frame" else None
+        self.average = np.empty(shape, np.float32) if self.mode == "running_average" else None
+        self.background = np.empty(shape, np.uint8) if self.mode == "running_average" else None
+
+    def previous(self, age=1):
+        """Preprocessed frame from `age` pushes ago (0 = the latest)."""
+        return self.ring[(self.index - age) % len(self.ring)]
+
+    def prepare(self, frame):
+        """Gray, downscaled and blurred copy of `frame`, written into the next ring slot."""
+        small = pyramid_motion.downscale(frame, self.level)
+        if self.ring is None or self.ring.shape[1:] != small.shape[:2]:
+            self._allocate(small.shape[:2])
+            self.count = 0
+            self.index = -1
+        self.index = (self.index + 1) % len(self.ring)
+        slot = self.ring[self.index]
+        if self.blur_ksize is None:
+            cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=slot)
+        else:
+            cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+            strip_parallel.GaussianBlur(self.gray, self.blur_ksize, 0, dst=slot)
+        self.count += 1
+        return slot
+
+    def _threshold(self, difference, dst):
+        cv2.threshold(difference, self.threshold, 255, cv2.THRESH_BINARY, dst=dst)
+        return dst
+
+    def push(self, frame):
+        """Add a BGR frame; returns its motion mask, or None until enough frames have been seen."""
+        current = self.prepare(frame)
+        if self.mode == "running_average":
+            if self.count == 1:
+                self.average[:] = current
+                return None
+            cv2.convertScaleAbs(self.average, dst=self.background)
+            cv2.absdiff(current, self.background, dst=self.difference)
+            cv2.accumulateWeighted(current, self.average, self.alpha)
+            return self._threshold(self.difference, self.mask)
+
+        if self.count < len(self.ring):
+            return None
+        cv2.absdiff(current, self.previous(1), dst=self.difference)
+        self._threshold(self.difference, self.mask)
+        if self.mode == "three_frame":
+            cv2.absdiff(current, self.previous(2), dst=self.difference)
+            self._threshold(self.difference, self.older)
+            cv2.bitwise_and(self.mask, self.older, dst=self.mask)
+        return self.mask
+
+    def reset(self):
+        self.count = 0
+        self.index = -1
+
+
+def _truth(frame, background):
+    return np.where(cv2.absdiff(frame, background).max(axis=2) > 50, 255, 0).astype(np.uint8)
+
+
+def _old_two_frame(frame1, frame2, threshold, blur_ksize):
+    # What detect_anomalies did before: both frames converted, the difference blurred
+    diff = cv2.absdiff(cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY), cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY))
+    if blur_ksize is not None:
+        diff = cv2.GaussianBlur(diff, blur_ksize, 0)
+    return cv2.threshold(diff, threshold, 255, cv2.THRESH_BINARY)[1]
+
+
+def main(width=1280, height=720, frames=150, threshold=8, blur_ksize=(5, 5)):
+    """Time every mode against the old code and score its masks against the known foreground."""
+    from numpy_background import f1, mask_scores
+    from video_io import SyntheticSource
+
+    source = SyntheticSource(width, height, frames=frames)
+    video = [source.read()[1] for _ in range(frames)]
+    truths = [_truth(frame, source.background) for frame in video]
+
+    def score(masks):
+        totals = np.zeros(3, np.int64)
+        for mask, truth in zip(masks, truths):
+            if mask is not None:
+                totals += mask_scores(mask, truth)
+        return f1(totals)
+
+    start = time.perf_counter()
+    masks = [None] + [_old_two_frame(previous, frame, threshold, blur_ksize)
+                      for previous, frame in zip(video, video[1:])]
+    print(f"old two-frame      {(time.perf_counter() - start) / frames * 1000:6.2f} ms/frame  F1 {score(masks):.3f}")
+    for level in (0, 1):
+        for mode in MODES:
+            differencer = FrameDifferencer(mode, threshold, blur_ksize, level)
+            masks = []
+            start = time.perf_counter()
+            for frame in video:
+                mask = differencer.push(frame)
+                masks.append(None if mask is None else mask.copy())
+            elapsed = time.perf_counter() - start
+            if level:
+                masks = [None if mask is None else cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+                         for mask in masks]
+            print(f"{mode:15s} L{level}  {elapsed / frames * 1000:6.2f} ms/frame  F1 {score(masks):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fused lookup-table version of the low-light enhancement chains in
+untitled1.py and untitled2.py.
+
+Every per-pixel point operation of the original chains (brightness/contrast,
+gamma on the Y channel, V boost in HSV and the histogram equalization +
+rescale_intensity step) is precomputed once as a 256-entry uint8 table and
+applied with a single cv2.LUT pass per colour space, so the output is
+bit-identical to improve_low_light() while avoiding the float64 temporaries.
+The tables themselves are built by tone_mapping.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+import cv_cache
+import strip_parallel
+from frame_buffers import arena_buffer
+from metrics import timed
+from tone_mapping import brightness_contrast_lut, equalize_rescale_lut, gamma_lut
+
+class FusedLowLightEnhancer:
+    """
+    Compiled, bit-identical replacement for improve_low_light().
+
+    Parameters:
+    - order: "hsv_first" reproduces untitled1.py, "hsv_last" reproduces
+      untitled2.py (which also ends with histogram equalization).
+    - alpha, beta: brightness/contrast parameters.
+    - gamma: gamma applied to the Y channel.
+    - v_alpha, v_beta: brightness boost of the HSV V channel.
+    - clip_limit, tile_grid_size: CLAHE parameters.
+    """
+
+    def __init__(self, order="hsv_first", alpha=1.5, beta=50, gamma=2.0,
+                 v_alpha=1.5, v_beta=30, clip_limit=3.0, tile_grid_size=(8, 8)):
+        if order not in ("hsv_first", "hsv_last"):
+            raise ValueError(f"Unknown order: {order}")
+        self.order = order
+        self.brightness_lut = brightness_contrast_lut(alpha, beta)
+        self.v_lut = brightness_contrast_lut(v_alpha, v_beta)
+        self.gamma_lut = gamma_lut(gamma)
+        self.clip_limit = clip_limit
+        self.tile_grid_size = tile_grid_size
+        self.kernel = cv_cache.sharpen_kernel()
+
+    def _gamma_to_gray(self, image, arena):
+        # BGR -> YUV, gamma on Y, back to BGR and then gray (as apply_clahe does)
+        yuv_image = cv2.cvtColor(image, cv2.COLOR_BGR2YUV, dst=arena_buffer(arena, "fused.yuv", image))
+        y_channel = cv2.extractChannel(yuv_image, 0, arena_buffer(arena, "fused.y", image, channels=1))
+        cv2.LUT(y_channel, self.gamma_lut, dst=y_channel)
+        cv2.insertChannel(y_channel, yuv_image, 0)
+        bgr_image = cv2.cvtColor(yuv_image, cv2.COLOR_YUV2BGR, dst=arena_buffer(arena, "fused.gamma", image))
+        return cv2.cvtColor(bgr_image, cv2.COLOR_BGR2GRAY, dst=arena_buffer(arena, "fused.gray", image, channels=1))
+
+    @timed("fused_low_light")
+    def apply(self, image, arena=None):
+        """
+        Enhance one BGR frame and return a BGR frame.
+
+        With a FrameArena the intermediate and output frames come from the
+        arena, so the result is only valid until the next call.
+        """
+        clahe_image = arena_buffer(arena, "fused.clahe", image, channels=1)
+        detailed_image = arena_buffer(arena, "fused.detailed", image, channels=1)
+        output = arena_buffer(arena, "fused.output", image)
+        if self.order == "hsv_first":
+            # V boost in HSV, then brightness/contrast on BGR
+            hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=arena_buffer(arena, "fused.hsv", image))
+            v_channel = cv2.extractChannel(hsv_image, 2, arena_buffer(arena, "fused.v", image, channels=1))
+            cv2.LUT(v_channel, self.v_lut, dst=v_channel)
+            cv2.insertChannel(v_channel, hsv_image, 2)
+            bright_image = cv2.cvtColor(hsv_image, cv2.COLOR_HSV2BGR, dst=arena_buffer(arena, "fused.bright", image))
+            cv2.LUT(bright_image, self.brightness_lut, dst=bright_image)
+            gray_image = self._gamma_to_gray(bright_image, arena)
+            clahe_image = strip_parallel.clahe(gray_image, self.clip_limit, self.tile_grid_size, clahe_image)
+            # The frame is gray from here on, so sharpen one channel instead of three
+            detailed_image = strip_parallel.filter2D(clahe_image, -1, self.kernel, dst=detailed_image)
+            return cv2.cvtColor(detailed_image, cv2.COLOR_GRAY2BGR, dst=output)
+
+        bright_image = cv2.LUT(image, self.brightness_lut, dst=arena_buffer(arena, "fused.bright", image))
+        gray_image = self._gamma_to_gray(bright_image, arena)
+        clahe_image = strip_parallel.clahe(gray_image, self.clip_limit, self.tile_grid_size, clahe_image)
+        # HSV V boost of a gray frame (S == 0) is a plain LUT on the gray values
+        cv2.LUT(clahe_image, self.v_lut, dst=clahe_image)
+        detailed_image = strip_parallel.filter2D(clahe_image, -1, self.kernel, dst=detailed_image)
+        cv2.LUT(detailed_image, equalize_rescale_lut(detailed_image), dst=detailed_image)
+        return cv2.cvtColor(detailed_image, cv2.COLOR_GRAY2BGR, dst=output)
+
+    __call__ = apply
+
+
+def synthetic_low_light_frame(height=1080, width=1920, seed=0):
+    """Dark, noisy BGR frame used by the benchmark."""
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(0, 60, width, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 8, (height, width, 3)).astype(np.float32)
+    return np.clip(ramp + noise, 0, 255).astype(np.uint8)
+
+
+def _time_call(func, frame, repeats):
+    func(frame)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func(frame)
+    return (time.perf_counter() - start) / repeats
+
+
+def main(repeats=20):
+    """Check bit-identity against the original chains and report the speedup."""
+    import untitled1
+    import untitled2
+
+    frame = synthetic_low_light_frame()
+    cases = [
+        ("untitled1.improve_low_light", untitled1.improve_low_light, FusedLowLightEnhancer("hsv_first")),
+        ("untitled2.improve_low_light", untitled2.improve_low_light, FusedLowLightEnhancer("hsv_last")),
+    ]
+    for name, reference, fused in cases:
+        identical = np.array_equal(reference(frame.copy()), fused(frame.copy()))
+        ref_time = _time_call(reference, frame, repeats)
+        fused_time = _time_call(fused, frame, repeats)
+        print(f"{name}: identical={identical} "
+              f"original={ref_time * 1000:.2f} ms fused={fused_time * 1000:.2f} ms "
+              f"speedup={ref_time / fused_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
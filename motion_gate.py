@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motion-gated detection: run YOLO only where the background subtractor sees motion.
+
+The foreground blobs of a frame decide whether the detector runs at all.
+When they do, the motion boxes are padded, overlapping ones are merged, and
+only those crops are sent to the model as one batch; the resulting boxes are
+shifted back to frame coordinates.  If the motion covers most of the frame,
+a single full-frame pass is cheaper than many crops and is used instead.
+"""
+
+import numpy as np
+
+import blobs
+from detections import Detections
+from metrics import timed
+
+
+@timed("find_blobs")
+def motion_regions(fg_mask, contour_area_threshold):
+    """(N, 4) int array of x, y, w, h for foreground blobs above the area threshold (in pixels)."""
+    return blobs.extract_blobs(fg_mask, contour_area_threshold)[:, :4]
+
+
+def pad_regions(regions, padding, frame_shape):
+    """Grow x, y, w, h regions by `padding` pixels and clip them to the frame; returns x1, y1, x2, y2."""
+    height, width = frame_shape[:2]
+    boxes = np.empty_like(regions)
+    boxes[:, 0] = np.maximum(regions[:, 0] - padding, 0)
+    boxes[:, 1] = np.maximum(regions[:, 1] - padding, 0)
+    boxes[:, 2] = np.minimum(regions[:, 0] + regions[:, 2] + padding, width)
+    boxes[:, 3] = np.minimum(regions[:, 1] + regions[:, 3] + padding, height)
+    return boxes
+
+
+def box_area(boxes):
+    """Total area of x1, y1, x2, y2 boxes."""
+    return float(((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])).sum())
+
+
+def merge_regions(boxes):
+    """Merge overlapping x1, y1, x2, y2 boxes until none overlap, so no area is detected twice."""
+    boxes = [list(box) for box in boxes.tolist()]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return np.array(boxes, dtype=np.int32).reshape(-1, 4)
+
+
+class GatingStats:
+    """Counts of skipped, cropped and full-frame detector runs."""
+
+    def __init__(self):
+        self.frames = 0
+        self.skipped = 0
+        self.full_frame = 0
+        self.crops = 0
+        self.area = 0.0
+
+    def record(self, crops, area_fraction, full_frame=False):
+        self.frames += 1
+        if full_frame:
+            self.full_frame += 1
+            self.area += 1.0
+        elif crops == 0:
+            self.skipped += 1
+        else:
+            self.crops += crops
+            self.area += area_fraction
+
+    @property
+    def skip_rate(self):
+        """Fraction of frames on which the detector did not run at all."""
+        return self.skipped / self.frames if self.frames else 0.0
+
+    @property
+    def detected_area(self):
+        """Mean fraction of the frame area sent to the detector per frame."""
+        return self.area / self.frames if self.frames else 0.0
+
+    def summary(self):
+        return (f"Detector skipped on {self.skipped}/{self.frames} frames ({self.skip_rate:.1%}), "
+                f"{self.crops} crops, {self.full_frame} full-frame runs, "
+                f"mean detected area {self.detected_area:.1%} of the frame")
+
+
+class MotionGatedDetector:
+    """
+    Runs a YOLO model only on padded motion regions of a frame.
+
+    Parameters:
+    - model: ultralytics YOLO model (called with a list of crops).
+    - imgsz: Inference size for the crops.
+    - padding: Pixels added around every motion box before cropping.
+    - full_frame_ratio: If the merged crops cover more than this fraction of
+      the frame, detect on the whole frame instead.
+    - infer: Optional callable(crops) -> list of results, e.g. to route the
+      crops through a BatchingInferenceServer.
+    """
+
+    def __init__(self, model, imgsz=320, padding=32, full_frame_ratio=0.6, infer=None):
+        self.model = model
+        self.imgsz = imgsz
+        self.padding = padding
+        self.full_frame_ratio = full_frame_ratio
+        self.infer = infer or self._default_infer
+        self.stats = GatingStats()
+
+    def _default_infer(self, crops):
+        return self.model(crops, imgsz=self.imgsz, verbose=False)
+
+    def crop_boxes(self, regions, frame_shape):
+        """Padded, merged x1, y1, x2, y2 crop boxes for the motion regions, or None for a full-frame pass."""
+        if not len(regions):
+            return np.zeros((0, 4), np.int32)
+        boxes = merge_regions(pad_regions(regions, self.padding, frame_shape))
+        if box_area(boxes) > self.full_frame_ratio * frame_shape[0] * frame_shape[1]:
+            return None
+        return boxes
+
+    def detect(self, frame, regions):
+        """
+        Detect objects inside the motion regions of `frame`.
+
+        Parameters:
+        - frame: Image passed to the model (already in the colour order the model expects).
+        - regions: (N, 4) x, y, w, h motion boxes from motion_regions().
+
+        Returns Detections in frame coordinates.
+        """
+        names = self.model.names
+        boxes = self.crop_boxes(regions, frame.shape)
+        if boxes is None:
+            self.stats.record(1, 1.0, full_frame=True)
+            return Detections.from_result(self.infer([frame])[0], names)
+        self.stats.record(len(boxes), box_area(boxes) / (frame.shape[0] * frame.shape[1]))
+        if not len(boxes):
+            return Detections(names=names)
+
+        crops = [np.ascontiguousarray(frame[y1:y2, x1:x2]) for x1, y1, x2, y2 in boxes.tolist()]
+        results = self.infer(crops)
+        detections = [Detections.from_result(result, names).scaled(1.0, 1.0, x1, y1)
+                      for result, (x1, y1, _, _) in zip(results, boxes.tolist())]
+        return Detections(np.concatenate([d.data for d in detections]), names)
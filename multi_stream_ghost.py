@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-camera ghost detector: one process, one YOLO model, N video sources.
+
+Every source (device index, video file or RTSP/HTTP URL) gets its own
+capture thread and its own MOG2 background model.  Frames from all streams
+are fanned into one bounded queue, and whatever is ready is sent to the
+shared model as a single batched model([...]) call.  With
+background="stacked" the streams share one NumPy running-Gaussian model
+(numpy_background) that updates every stream of a batch in one call; all
+sources must then deliver frames of the same size.
+"""
+
+import sys
+import threading
+from queue import Queue, Empty
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+from numpy_background import StackedGaussianBackground
+
+from untitled16 import draw_detections, draw_motion
+from video_io import open_sink, open_source
+
+_END = object()
+
+
+def parse_source(source):
+    """Device indices may be given as ints or digit strings; anything else is a path, URL or synthetic spec."""
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+
+
+class VideoStream:
+    """State of one input: its capture, its own MOG2 model and a frame counter."""
+
+    def __init__(self, index, source):
+        self.index = index
+        self.source = parse_source(source)
+        self.cap = open_source(self.source)
+        self.background_subtractor = cv2.createBackgroundSubtractorMOG2()
+        self.frames = 0
+
+        if not self.cap.isOpened():
+            raise IOError(f"Error: Could not open source {source}.")
+
+    @property
+    def window_name(self):
+        return f"Advanced Ghost Detector [{self.index}] {self.source}"
+
+
+class MultiStreamGhostDetector:
+    """
+    Fan-in detector for several sources sharing one loaded model.
+
+    Parameters:
+    - sources: List of device indices, file paths or stream URLs.
+    - contour_area_threshold: Minimum contour area for motion boxes.
+    - model_path: YOLO weights, loaded once for all streams.
+    - imgsz: Inference size.
+    - max_batch: Maximum number of frames per model call (defaults to the
+      number of streams).
+    - queue_size: Capacity of the shared fan-in queue.
+    - model: Already loaded model to use instead of model_path.
+    - sink: Display sink or sink spec (see video_io.open_sink).
+    - background: "mog2" (one OpenCV model per stream) or "stacked" (one
+      StackedGaussianBackground for all streams).
+    """
+
+    def __init__(self, sources, contour_area_threshold=1000, model_path='yolov8n.pt', imgsz=320,
+                 max_batch=None, queue_size=None, model=None, sink=None, background="mog2"):
+        if background not in ("mog2", "stacked"):
+            raise ValueError(f"Error: Unknown background model {background!r}.")
+        self.streams = [VideoStream(index, source) for index, source in enumerate(sources)]
+        self.background = background
+        # Created on the first batch, when the frame size is known
+        self.background_model = None
+        self.contour_area_threshold = contour_area_threshold
+        self.imgsz = imgsz
+        self.max_batch = max_batch or len(self.streams)
+        self.frame_queue = Queue(maxsize=queue_size or 2 * len(self.streams))
+        self.model = model if model is not None else YOLO(model_path)
+        self.sink = open_sink(sink)
+        self.batches = 0
+        self.batched_frames = 0
+        self._stop = threading.Event()
+
+    def capture_frames(self, stream):
+        while not self._stop.is_set():
+            ret, frame = stream.cap.read()
+            if not ret:
+                print(f"Error: Failed to capture image from {stream.source}")
+                break
+            self.frame_queue.put((stream, frame))
+        self.frame_queue.put((stream, _END))
+
+    def next_batch(self):
+        """Block for one frame, then take whatever else is already queued (up to max_batch)."""
+        batch = [self.frame_queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.frame_queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def detect_batch(self, frames):
+        # One forward pass for frames coming from different streams
+        rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+        results = self.model(rgb_frames, imgsz=self.imgsz, verbose=False)
+        for frame, result in zip(frames, results):
+            draw_detections(frame, result, self.model.names)
+        self.batches += 1
+        self.batched_frames += len(frames)
+        return frames
+
+    def subtract_backgrounds(self, batch):
+        """Foreground masks of a batch, from every stream's MOG2 or from stacked-model updates."""
+        if self.background == "mog2":
+            return [stream.background_subtractor.apply(frame) for stream, frame in batch]
+
+        if self.background_model is None:
+            height, width = batch[0][1].shape[:2]
+            self.background_model = StackedGaussianBackground(len(self.streams), height, width, channels=3)
+        masks = [None] * len(batch)
+        remaining = list(enumerate(batch))
+        while remaining:
+            # One update per group of frames from distinct streams, in arrival order
+            group, later, seen = [], [], set()
+            for position, (stream, frame) in remaining:
+                (later if stream.index in seen else group).append((position, stream, frame))
+                seen.add(stream.index)
+            stacked = self.background_model.apply(np.stack([frame for _, _, frame in group]),
+                                                  streams=[stream.index for _, stream, _ in group])
+            for (position, _, _), mask in zip(group, stacked):
+                masks[position] = mask
+            remaining = [(position, (stream, frame)) for position, stream, frame in later]
+        return masks
+
+    def process_batch(self, batch):
+        """Run background subtraction, then batched detection."""
+        streams, frames = [], []
+        for (stream, frame), fg_mask in zip(batch, self.subtract_backgrounds(batch)):
+            draw_motion(frame, fg_mask, self.contour_area_threshold)
+            stream.frames += 1
+            streams.append(stream)
+            frames.append(frame)
+        return streams, self.detect_batch(frames)
+
+    def run(self):
+        threads = [threading.Thread(target=self.capture_frames, args=(stream,), daemon=True)
+                   for stream in self.streams]
+        for thread in threads:
+            thread.start()
+
+        live = len(self.streams)
+        while live:
+            batch = []
+            for stream, frame in self.next_batch():
+                if frame is _END:
+                    live -= 1
+                else:
+                    batch.append((stream, frame))
+            if not batch:
+                continue
+
+            for stream, frame in zip(*self.process_batch(batch)):
+                self.sink.show(stream.window_name, frame)
+
+            # Break the loop on 'q' key press
+            if self.sink.wait_key() == ord('q'):
+                break
+
+        self._stop.set()
+        self.cleanup()
+
+    @property
+    def mean_batch_size(self):
+        return self.batched_frames / self.batches if self.batches else 0.0
+
+    def cleanup(self):
+        # Let blocked capture threads finish, then release every source
+        while True:
+            try:
+                self.frame_queue.get_nowait()
+            except Empty:
+                break
+        for stream in self.streams:
+            stream.cap.release()
+        self.sink.close()
+        print(f"Processed {self.batched_frames} frames in {self.batches} batches "
+              f"(mean batch size {self.mean_batch_size:.2f})")
+
+
+if __name__ == "__main__":
+    # Usage: python multi_stream_ghost.py 0 video.mp4 rtsp://127.0.0.1:8554/cam
+    try:
+        detector = MultiStreamGhostDetector(sys.argv[1:] or [0])
+        detector.run()
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        cv2.destroyAllWindows()
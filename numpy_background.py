@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Running-Gaussian background model for a stack of camera streams, in NumPy.
+
+MOG2 and KNN are opaque OpenCV objects, one per stream, updated one frame
+at a time.  StackedGaussianBackground keeps a single Gaussian per pixel
+(mean and an isotropic variance, like one MOG2 component) for K streams in
+one float32 array, and apply() updates all K models from a (K, H, W[, C])
+stack of frames with a few whole-array NumPy passes:
+
+    d = frame - mean
+    foreground = |d|^2 > threshold * variance
+    mean += rate * d
+    variance += rate * (|d|^2 - variance)     (clipped to [min, max])
+
+Foreground pixels learn `foreground_learning` times slower, so objects are
+not absorbed into the background while they move.  A single Gaussian
+cannot hold a second mode the way MOG2's mixture does, so a pixel that has
+been foreground for `absorb_frames` consecutive frames (the ghost of an
+object that was in the first frame, a parked car) is reset to its current
+value.  The learning rate can be set per stream and per call; new streams
+start fast (1 / 2n, as MOG2 does with its history) until the rate drops to
+`learning_rate`.
+
+The whole state (means, variances, foreground run lengths, frame counts) is
+one flat float32 array
+that can be passed in, e.g. a view of multiprocessing shared memory: see
+create_shared() / attach_shared().  `python numpy_background.py [clip ...]`
+compares throughput and masks with per-stream MOG2.
+"""
+
+import argparse
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+
+def state_size(streams, height, width, channels=1):
+    """Number of float32 values of the state of `streams` models."""
+    return streams * height * width * (channels + 2) + streams
+
+
+class StackedGaussianBackground:
+    """
+    Running-Gaussian background models of K streams of equal frame size.
+
+    Parameters:
+    - streams: Number of streams K.
+    - height, width: Frame size of every stream.
+    - channels: 1 for gray frames (K, H, W), 3 for BGR frames (K, H, W, 3).
+    - learning_rate: Background learning rate, a scalar or one per stream.
+    - threshold: Squared distance, in variances, above which a pixel is
+      foreground (like MOG2's varThreshold).
+    - foreground_learning: Fraction of the learning rate applied to foreground pixels.
+    - absorb_frames: Consecutive foreground frames after which a pixel's
+      current value becomes its background.
+    - var_init, var_min, var_max: Initial variance and its bounds (MOG2 defaults).
+    - state: Optional flat float32 array of state_size(...) values to keep
+      the model in (e.g. shared memory); it is used as is, so a state that
+      already holds models continues from them.
+    """
+
+    def __init__(self, streams, height, width, channels=1, learning_rate=0.005, threshold=16.0,
+                 foreground_learning=0.1, absorb_frames=50, var_init=15.0, var_min=4.0, var_max=75.0,
+                 state=None):
+        self.streams = streams
+        self.shape = (height, width) if channels == 1 else (height, width, channels)
+        self.learning_rate = learning_rate
+        self.threshold = threshold
+        self.foreground_learning = foreground_learning
+        self.absorb_frames = absorb_frames
+        self.var_init = var_init
+        self.var_min = var_min
+        self.var_max = var_max
+
+        size = state_size(streams, height, width, channels)
+        if state is None:
+            state = np.zeros(size, np.float32)
+        if state.dtype != np.float32 or state.size != size:
+            raise ValueError(f"Error: The state must be {size} float32 values, got {state.size} {state.dtype}.")
+        self.state = state.reshape(-1)
+        pixels = streams * height * width
+        self.mean = self.state[:pixels * channels].reshape((streams,) + self.shape)
+        self.variance = self.state[pixels * channels:pixels * (channels + 1)].reshape(streams, height, width)
+        # Consecutive frames each pixel has been foreground
+        self.runs = self.state[pixels * (channels + 1):pixels * (channels + 2)].reshape(streams, height, width)
+        # Frames seen by each stream (0 = not initialized)
+        self.counts = self.state[pixels * (channels + 2):]
+
+        # Work buffers, reused by every call
+        self._difference = np.empty_like(self.mean)
+        self._distance = np.empty_like(self.variance)
+        self._rate = np.empty_like(self.variance)
+        self._bound = np.empty_like(self.variance)
+        self._foreground = np.empty(self.variance.shape, bool)
+        self._squared = np.empty_like(self.mean) if channels > 1 else None
+
+    def rates(self, counts, learning_rate=None):
+        """Per-stream learning rates: max(learning_rate, 1 / (2 * frames seen))."""
+        learning_rate = self.learning_rate if learning_rate is None else learning_rate
+        return np.maximum(np.broadcast_to(np.asarray(learning_rate, np.float32), counts.shape),
+                          1.0 / (2.0 * np.maximum(counts, 1.0))).astype(np.float32)
+
+    def apply(self, frames, streams=None, learning_rate=None, masks=None):
+        """
+        Update the models with one frame per stream and return the foreground masks.
+
+        Parameters:
+        - frames: (K, H, W[, C]) uint8 stack, or (n, ...) with `streams`.
+        - streams: Optional indices of the streams the frames belong to
+          (each at most once); None means all streams in order.
+        - learning_rate: Override for this call (scalar or one per frame).
+        - masks: Optional (n, H, W) uint8 output array.
+
+        Returns:
+        - (n, H, W) uint8 masks, 255 for foreground (no shadow class).
+        """
+        frames = np.asarray(frames)
+        if frames.shape[1:] != self.shape:
+            raise ValueError(f"Error: Expected frames of shape {self.shape}, got {frames.shape[1:]}.")
+        if masks is None:
+            masks = np.empty((len(frames),) + self.variance.shape[1:], np.uint8)
+        if streams is None or (len(streams) == self.streams and np.array_equal(streams, np.arange(self.streams))):
+            self._update(frames, self.mean, self.variance, self.runs, self.counts, learning_rate, masks,
+                         len(frames))
+            return masks
+
+        streams = np.asarray(streams)
+        # Fancy indexing copies; the updated models are scattered back
+        mean, variance, runs, counts = (self.mean[streams], self.variance[streams], self.runs[streams],
+                                        self.counts[streams])
+        self._update(frames, mean, variance, runs, counts, learning_rate, masks, len(frames))
+        self.mean[streams], self.variance[streams], self.runs[streams], self.counts[streams] = (
+            mean, variance, runs, counts)
+        return masks
+
+    def _update(self, frames, mean, variance, runs, counts, learning_rate, masks, n):
+        new = counts == 0
+        if new.any():
+            mean[new] = frames[new]
+            variance[new] = self.var_init
+            runs[new] = 0
+        difference, distance = self._difference[:n], self._distance[:n]
+        rate, bound, foreground = self._rate[:n], self._bound[:n], self._foreground[:n]
+
+        np.subtract(frames, mean, out=difference, dtype=np.float32)
+        if difference.ndim == 4:
+            squared = self._squared[:n]
+            np.multiply(difference, difference, out=squared)
+            np.add(squared[..., 0], squared[..., 1], out=distance)
+            for channel in range(2, squared.shape[3]):
+                distance += squared[..., channel]
+        else:
+            np.multiply(difference, difference, out=distance)
+        np.multiply(variance, self.threshold, out=bound)
+        np.greater(distance, bound, out=foreground)
+        np.multiply(foreground, 255, out=masks, casting="unsafe")
+
+        # rate = alpha on background pixels, alpha * foreground_learning on foreground ones
+        alpha = self.rates(counts, learning_rate)[:, None, None]
+        np.multiply(foreground, alpha * (self.foreground_learning - 1.0), out=rate)
+        rate += alpha
+        if difference.ndim == 4:
+            difference *= rate[..., None]
+        else:
+            difference *= rate
+        mean += difference
+        np.subtract(distance, variance, out=distance)
+        distance *= rate
+        variance += distance
+        np.clip(variance, self.var_min, self.var_max, out=variance)
+
+        # Pixels that stayed foreground for absorb_frames frames start over from the frame
+        runs += 1
+        runs *= foreground
+        absorbed = np.greater_equal(runs, self.absorb_frames, out=foreground)
+        if absorbed.any():
+            # Usually a handful of pixels: index them instead of masked full-frame copies
+            index = np.flatnonzero(absorbed)
+            channels = mean.size // variance.size
+            mean.reshape(-1, channels)[index] = frames.reshape(-1, channels)[index]
+            variance.reshape(-1)[index] = self.var_init
+            runs.reshape(-1)[index] = 0
+
+        counts += 1
+
+    def getBackgroundImage(self, stream=0):
+        """uint8 background (rounded mean) of one stream, like the OpenCV subtractors."""
+        return np.clip(np.rint(self.mean[stream]), 0, 255).astype(np.uint8)
+
+
+def create_shared(name, streams, height, width, channels=1, **kwargs):
+    """
+    Create a named shared memory block holding a new model's state.
+
+    Returns (SharedMemory, model); other processes open the same models with
+    attach_shared().  The creator must close() and unlink() the block.
+    """
+    size = state_size(streams, height, width, channels)
+    block = shared_memory.SharedMemory(name=name, create=True, size=size * 4)
+    state = np.ndarray(size, np.float32, buffer=block.buf)
+    state[:] = 0
+    return block, StackedGaussianBackground(streams, height, width, channels, state=state, **kwargs)
+
+
+def attach_shared(name, streams, height, width, channels=1, **kwargs):
+    """Open the models of a block made by create_shared(); returns (SharedMemory, model)."""
+    block = shared_memory.SharedMemory(name=name)
+    state = np.ndarray(state_size(streams, height, width, channels), np.float32, buffer=block.buf)
+    return block, StackedGaussianBackground(streams, height, width, channels, state=state, **kwargs)
+
+
+def mask_scores(masks, reference):
+    """(true positives, false positives, false negatives) of 255-foreground masks against a reference."""
+    predicted, expected = masks == 255, reference == 255
+    return (int(np.count_nonzero(predicted & expected)), int(np.count_nonzero(predicted & ~expected)),
+            int(np.count_nonzero(~predicted & expected)))
+
+
+def f1(scores):
+    true_positive, false_positive, false_negative = scores
+    return 2 * true_positive / max(2 * true_positive + false_positive + false_negative, 1)
+
+
+def _synthetic_streams(streams, width, height, frames):
+    # One synthetic video per stream; the truth is every pixel far from the known background
+    from video_io import SyntheticSource
+
+    sources = [SyntheticSource(width, height, frames=frames, seed=seed) for seed in range(streams)]
+    videos, truths = [], []
+    for source in sources:
+        video = [source.read()[1] for _ in range(frames)]
+        videos.append(video)
+        truths.append([np.where(cv2.absdiff(frame, source.background).max(axis=2) > 50, 255, 0).astype(np.uint8)
+                       for frame in video])
+    return videos, truths
+
+
+def _clip_streams(path, streams, width, height, frames):
+    # The same clip, started at a different offset for every stream
+    from benchmark import recorded_frames
+
+    clip = recorded_frames(path, width, height, frames + 30 * streams)
+    return [clip[30 * index:30 * index + frames] for index in range(streams)], None
+
+
+def compare(videos, truths=None, warmup=50, gray=False, **kwargs):
+    """
+    Run per-stream MOG2 and one stacked model on the same videos.
+
+    Without ground truth the masks are scored against MOG2's (shadows
+    excluded); with it, both are scored against the truth.
+    """
+    streams, frames = len(videos), len(videos[0])
+    height, width = videos[0][0].shape[:2]
+    convert = (lambda frame: cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)) if gray else (lambda frame: frame)
+    subtractors = [cv2.createBackgroundSubtractorMOG2() for _ in range(streams)]
+    model = StackedGaussianBackground(streams, height, width, 1 if gray else 3, **kwargs)
+    stack = np.empty((streams,) + model.shape, np.uint8)
+    masks = np.empty((streams, height, width), np.uint8)
+    seconds = {"MOG2": 0.0, "stacked": 0.0}
+    scores = {"MOG2": np.zeros(3, np.int64), "stacked": np.zeros(3, np.int64)}
+    for index in range(frames):
+        for stream in range(streams):
+            stack[stream] = convert(videos[stream][index])
+        start = time.perf_counter()
+        reference = np.stack([subtractor.apply(frame) for subtractor, frame in zip(subtractors, stack)])
+        seconds["MOG2"] += time.perf_counter() - start
+        start = time.perf_counter()
+        model.apply(stack, masks=masks)
+        seconds["stacked"] += time.perf_counter() - start
+        if index < warmup:
+            continue
+        for stream in range(streams):
+            if truths is None:
+                scores["stacked"] += mask_scores(masks[stream], reference[stream])
+            else:
+                scores["MOG2"] += mask_scores(reference[stream], truths[stream][index])
+                scores["stacked"] += mask_scores(masks[stream], truths[stream][index])
+    return {name: {"fps": streams * frames / seconds[name],
+                   "f1": f1(scores[name]) if truths is not None or name == "stacked" else None}
+            for name in seconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stacked NumPy background model against per-stream MOG2")
+    parser.add_argument("clips", nargs="*", help="recorded clips (default: synthetic video with known foreground)")
+    parser.add_argument("--streams", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--size", default="640x360")
+    parser.add_argument("--gray", action="store_true", help="model gray frames instead of BGR")
+    parser.add_argument("--learning-rate", type=float, default=0.005)
+    args = parser.parse_args(argv)
+
+    width, height = (int(value) for value in args.size.split("x"))
+    for name in args.clips or ["synthetic"]:
+        if name == "synthetic":
+            videos, truths = _synthetic_streams(args.streams, width, height, args.frames)
+        else:
+            videos, truths = _clip_streams(name, args.streams, width, height, args.frames)
+        report = compare(videos, truths, gray=args.gray, learning_rate=args.learning_rate)
+        scored = "F1 against the true foreground" if truths is not None else "F1 against MOG2's masks"
+        print(f"{name}: {args.streams} streams of {width}x{height}, {args.frames} frames ({scored})")
+        for model, result in report.items():
+            quality = "" if result["f1"] is None else f"  F1 {result['f1']:.3f}"
+            print(f"  {model:8s} {result['fps']:8.1f} stream-frames/s{quality}")
+
+
+if __name__ == "__main__":
+    main()
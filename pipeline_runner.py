@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stage pipeline runner for the capture -> process -> display loops.
+
+A pipeline is a list of stages (capture, enhance, background subtraction,
+detection, annotate, sink ...).  Every stage runs in its own thread or
+process and talks to the next one through a bounded queue with blocking
+gets, so a slow stage applies back-pressure instead of busy-spinning.
+Edges that cross a process boundary hand frames over through a ring of
+shared-memory slots; only the slot index and the small metadata are pickled.
+
+Example:
+    pipeline = Pipeline([
+        Stage("capture", camera_frames),
+        Stage("enhance", improve_low_light, mode="process", workers=4),
+        Stage("display", show_frame, mode="main"),
+    ])
+    pipeline.run()
+"""
+
+import heapq
+import multiprocessing as mp
+import queue
+import threading
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import metrics
+
+_STOP = "__pipeline_stop__"
+_SKIP = "__pipeline_skip__"
+
+
+class StopPipeline(Exception):
+    """Raise from any stage function to stop the whole pipeline (e.g. on 'q')."""
+
+
+class Stage:
+    """
+    One step of a Pipeline.
+
+    Parameters:
+    - name: Stage name used in error messages and stats.
+    - func: For the first stage, a callable returning an iterable of items
+      (a generator function).  For every other stage, a callable taking one
+      item and returning the next item, or None to drop it.
+    - factory: Alternative to func; called once inside the worker to build
+      func.  Use it for state that cannot be shared or pickled (models,
+      background subtractors, windows).
+    - mode: "thread", "process" or "main" (last stage only, runs on the
+      calling thread, e.g. for cv2.imshow).
+    - workers: Number of parallel workers.  Only use > 1 for stateless
+      stages; downstream stages get items back in order.
+    - queue_size: Capacity of the input queue of this stage.
+    - ordered: Reorder input by sequence number before calling func.
+    """
+
+    def __init__(self, name, func=None, factory=None, mode="thread", workers=1, queue_size=4, ordered=True):
+        if (func is None) == (factory is None):
+            raise ValueError(f"Stage {name}: give exactly one of func or factory")
+        if mode not in ("thread", "process", "main"):
+            raise ValueError(f"Stage {name}: unknown mode {mode}")
+        if mode == "main" and workers != 1:
+            raise ValueError(f"Stage {name}: a main-thread stage has exactly one worker")
+        self.name = name
+        self.func = func
+        self.factory = factory
+        self.mode = mode
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ordered = ordered
+
+    def build(self, source=False):
+        func = self.factory() if self.factory is not None else self.func
+        # Per-stage timing (a no-op unless metrics are enabled; process-mode
+        # stages record into their own process and are not exported)
+        if source:
+            return metrics.timed_generator(self.name, func)
+        return metrics.timed(self.name)(func)
+
+
+class SharedFrameRing:
+    """
+    Fixed pool of shared-memory slots used to pass frames between processes.
+
+    The producer blocks on a free slot (back-pressure), copies the frame in
+    and sends only (slot, shape, dtype).  The consumer works on a view of the
+    slot and releases it once its stage function has returned.
+    """
+
+    def __init__(self, slots, slot_bytes):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.name = self._shm.name
+        self._free = mp.Queue()
+        for index in range(slots):
+            self._free.put(index)
+        self._owner = True
+
+    def __getstate__(self):
+        return {"slots": self.slots, "slot_bytes": self.slot_bytes, "name": self.name, "_free": self._free}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = None
+        self._owner = False
+
+    def _buffer(self):
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        return self._shm.buf
+
+    def fits(self, array):
+        return isinstance(array, np.ndarray) and array.nbytes <= self.slot_bytes
+
+    def put(self, array):
+        slot = self._free.get()
+        view = np.ndarray(array.shape, array.dtype, buffer=self._buffer(), offset=slot * self.slot_bytes)
+        np.copyto(view, array)
+        return slot, array.shape, array.dtype.str
+
+    def view(self, slot, shape, dtype):
+        return np.ndarray(shape, np.dtype(dtype), buffer=self._buffer(), offset=slot * self.slot_bytes)
+
+    def release(self, slot):
+        self._free.put(slot)
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+            self._shm = None
+
+
+class _Channel:
+    """Bounded queue between two stages, optionally with a shared-memory ring."""
+
+    def __init__(self, size, producers, consumers, interprocess, ring=None):
+        self.queue = mp.Queue(size) if interprocess else queue.Queue(size)
+        self.ring = ring
+        self.consumers = consumers
+        self._producers = mp.Value("i", producers)
+
+    def put(self, seq, item):
+        frame, extras = _split_item(item)
+        if self.ring is not None and self.ring.fits(frame):
+            slot, shape, dtype = self.ring.put(frame)
+            self.queue.put((seq, ("shm", slot, shape, dtype), extras))
+        else:
+            self.queue.put((seq, frame, extras))
+
+    def get(self):
+        message = self.queue.get()
+        if message == _STOP:
+            return _STOP, None, None
+        seq, frame, extras = message
+        slot = None
+        if isinstance(frame, tuple) and frame and frame[0] == "shm":
+            _, slot, shape, dtype = frame
+            frame = self.ring.view(slot, shape, dtype)
+        return seq, _join_item(frame, extras), slot
+
+    def producer_done(self):
+        with self._producers.get_lock():
+            self._producers.value -= 1
+            last = self._producers.value == 0
+        if last:
+            for _ in range(self.consumers):
+                self.queue.put(_STOP)
+
+
+def _split_item(item):
+    # Frames travel through shared memory, the rest of a tuple is pickled
+    if isinstance(item, tuple) and item and isinstance(item[0], np.ndarray):
+        return item[0], ("tuple", item[1:])
+    if isinstance(item, np.ndarray):
+        return item, None
+    return item, ("object",)
+
+
+def _join_item(frame, extras):
+    if extras is None:
+        return frame
+    if extras[0] == "tuple":
+        return (frame,) + tuple(extras[1])
+    return frame
+
+
+def _release_slot(channel, slot, result):
+    # A stage may return the shared-memory view itself (in-place processing);
+    # copy it out before the slot is handed back to the producer.
+    if slot is None:
+        return result
+    frame, _ = _split_item(result)
+    slot_view = channel.ring.view(slot, (channel.ring.slot_bytes,), np.uint8)
+    if isinstance(frame, np.ndarray) and np.may_share_memory(frame, slot_view):
+        frame = frame.copy()
+        result = frame if not isinstance(result, tuple) else (frame,) + tuple(result[1:])
+    channel.ring.release(slot)
+    return result
+
+
+def _detach(channel, slot, item):
+    if slot is None:
+        return item
+    frame, extras = _split_item(item)
+    item = _join_item(frame.copy(), extras)
+    channel.ring.release(slot)
+    return item
+
+
+def _run_source(stage, output, stop_event, errors, worker_index):
+    try:
+        func = stage.build(source=True)
+        for seq, item in enumerate(func()):
+            if stop_event.is_set():
+                break
+            output.put(seq, item)
+    except StopPipeline:
+        stop_event.set()
+    except Exception:
+        errors.put((stage.name, traceback.format_exc()))
+        stop_event.set()
+    finally:
+        output.producer_done()
+
+
+def _run_worker(stage, input_channel, output, stop_event, errors, worker_index):
+    # Each worker exits on exactly one stop marker; after an error or a
+    # StopPipeline it keeps consuming (without calling func) until then, so
+    # upstream producers never block on a full queue.
+    func = _guarded(stage, stage.build, stop_event, errors)
+    pending = []
+    next_seq = 0
+    while True:
+        seq, item, slot = input_channel.get()
+        if seq == _STOP:
+            break
+        if not (stage.ordered and stage.workers == 1):
+            _process_item(stage, func, input_channel, output, seq, item, slot, stop_event, errors)
+            continue
+        if seq == next_seq:
+            _process_item(stage, func, input_channel, output, seq, item, slot, stop_event, errors)
+            next_seq += 1
+        else:
+            # Out of order (parallel upstream workers): park a private copy
+            # so the shared-memory slot goes straight back to the producer
+            heapq.heappush(pending, (seq, _detach(input_channel, slot, item)))
+        while pending and pending[0][0] == next_seq:
+            seq, item = heapq.heappop(pending)
+            _process_item(stage, func, input_channel, output, seq, item, None, stop_event, errors)
+            next_seq += 1
+    if output is not None:
+        output.producer_done()
+
+
+def _guarded(stage, call, stop_event, errors, *args):
+    try:
+        return call(*args)
+    except StopPipeline:
+        stop_event.set()
+    except Exception:
+        errors.put((stage.name, traceback.format_exc()))
+        stop_event.set()
+    return None
+
+
+def _process_item(stage, func, input_channel, output, seq, item, slot, stop_event, errors):
+    result = None
+    skipped = isinstance(item, str) and item == _SKIP
+    if not skipped and func is not None and not stop_event.is_set():
+        result = _guarded(stage, func, stop_event, errors, item)
+    result = _release_slot(input_channel, slot, result)
+    if output is not None:
+        # An upstream skip was already counted by the stage that dropped the frame
+        if result is None and not skipped:
+            metrics.count_dropped(stage.name)
+        output.put(seq, _SKIP if result is None else result)
+
+
+class Pipeline:
+    """
+    Runs a list of Stage objects, the first one being the source.
+
+    Parameters:
+    - stages: Stage list, in order.
+    - frame_bytes: Size of one shared-memory slot; frames larger than this
+      on a process edge fall back to pickling.
+    - ring_slots: Slots per process edge (defaults to queue_size + workers + 1).
+    """
+
+    def __init__(self, stages, frame_bytes=1920 * 1080 * 3, ring_slots=None):
+        if len(stages) < 2:
+            raise ValueError("A pipeline needs at least a source and a sink")
+        if any(stage.mode == "main" for stage in stages[:-1]):
+            raise ValueError("Only the last stage can run on the main thread")
+        self.stages = stages
+        self.frame_bytes = frame_bytes
+        self.ring_slots = ring_slots
+        self.stop_event = mp.Event()
+        self.errors = mp.Queue()
+        self._workers = []
+        self._rings = []
+        self._channels = []
+
+    def _make_channels(self):
+        for upstream, downstream in zip(self.stages, self.stages[1:]):
+            interprocess = "process" in (upstream.mode, downstream.mode)
+            ring = None
+            if interprocess:
+                slots = self.ring_slots or downstream.queue_size + downstream.workers + upstream.workers + 1
+                ring = SharedFrameRing(slots, self.frame_bytes)
+                self._rings.append(ring)
+            channel = _Channel(downstream.queue_size, upstream.workers, downstream.workers, interprocess, ring)
+            if metrics.ENABLED:
+                metrics.REGISTRY.queue_depth(downstream.name, channel.queue.qsize)
+            self._channels.append(channel)
+
+    def _spawn(self, stage, target, args):
+        for index in range(stage.workers):
+            worker_args = args + (self.stop_event, self.errors, index)
+            if stage.mode == "process":
+                worker = mp.Process(target=target, args=worker_args, name=f"{stage.name}-{index}", daemon=True)
+            else:
+                worker = threading.Thread(target=target, args=worker_args, name=f"{stage.name}-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def start(self):
+        """Start every stage except a main-thread sink."""
+        self._make_channels()
+        self._spawn(self.stages[0], _run_source, (self.stages[0], self._channels[0]))
+        for index, stage in enumerate(self.stages[1:], start=1):
+            if stage.mode == "main":
+                continue
+            output = self._channels[index] if index < len(self._channels) else None
+            self._spawn(stage, _run_worker, (stage, self._channels[index - 1], output))
+
+    def run(self):
+        """Start the pipeline, run a main-thread sink if any, and wait for the end."""
+        self.start()
+        sink = self.stages[-1]
+        if sink.mode == "main":
+            _run_worker(sink, self._channels[-1], None, self.stop_event, self.errors, 0)
+        self.join()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self):
+        for worker in self._workers:
+            worker.join()
+        for ring in self._rings:
+            ring.close()
+        while True:
+            try:
+                name, error = self.errors.get_nowait()
+            except queue.Empty:
+                break
+            print(f"Error in stage {name}:\n{error}")
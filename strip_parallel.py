@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Strip-parallel execution of the spatial filters on large frames.
+
+OpenCV and NumPy release the GIL inside their kernels, so a frame split into
+horizontal strips can be filtered on a thread pool.  Every strip is extended
+by a halo of rows on each side, wide enough that the filter never sees the
+strip edge: the halo rows are filtered too but thrown away, and the interior
+rows are written straight into the output.  The result is bit-identical to
+filtering the whole frame at once.
+
+Halo sizes:
+- filter2D: the kernel extent above and below the anchor.
+- GaussianBlur: ksize // 2 (the kernel size OpenCV derives from sigma when ksize is 0).
+- morphologyEx: the structuring element radius times the number of erode/dilate passes.
+- scipy gaussian_filter: int(truncate * sigma + 0.5).
+- CLAHE: the output of a pixel depends on the histograms of whole tiles and
+  is interpolated between neighbouring tile rows, so strips are cut on tile
+  row boundaries with one full tile row of halo, and every strip runs CLAHE
+  with the same tile size.  OpenCV computes the interpolation weights in
+  float32 from the row index, so a strip only reproduces them bit for bit
+  when the tile height is a power of two; other tile heights run unsplit
+  unless exact=False (then about 1 pixel in 10**4 may differ by one level).
+  Frames whose size is not a multiple of the tile grid (OpenCV pads those)
+  and grids with a single tile row always run unsplit.
+
+Frames with fewer than 2 * min_rows rows are filtered directly into the
+destination, so small frames pay nothing.  Every strip is filtered into a
+per-thread scratch buffer that is reused from frame to frame, and its
+interior rows are copied into the destination; in-place calls (src and dst
+sharing memory) go through one more reused per-thread buffer, so a warm
+executor allocates no image memory.  The module-level functions mirror the cv2 signatures
+and share one executor sized to the machine.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import cv_cache
+
+# Output dtypes of filter2D for an explicit ddepth
+_DEPTHS = {cv2.CV_8U: np.uint8, cv2.CV_16U: np.uint16, cv2.CV_16S: np.int16,
+           cv2.CV_32F: np.float32, cv2.CV_64F: np.float64}
+
+
+class StripExecutor:
+    """
+    Thread pool running a filter over overlapping horizontal strips.
+
+    Parameters:
+    - workers: Number of threads (default: number of CPUs).
+    - min_rows: Minimum rows per strip; fewer strips are used on small frames.
+    """
+
+    def __init__(self, workers=None, min_rows=128):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self._pool = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="strip")
+            return self._pool
+
+    def strip_count(self, rows):
+        return max(1, min(self.workers, rows // self.min_rows))
+
+    def bounds(self, rows, align=1):
+        """Row ranges [(y0, y1), ...] of the strips, with interior cuts on multiples of `align`."""
+        units = rows // align
+        count = min(self.strip_count(rows), units)
+        if count <= 1:
+            return [(0, rows)]
+        cuts = [round(units * index / count) * align for index in range(count)] + [rows]
+        return list(zip(cuts[:-1], cuts[1:]))
+
+    def _scratch(self, name, shape, dtype):
+        """Per-thread buffer of `shape` and `dtype`, reused (and only grown) across calls."""
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        buffer = getattr(self._local, name, None)
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(size, np.uint8)
+            setattr(self._local, name, buffer)
+        return buffer[:size].view(dtype).reshape(shape)
+
+    def run(self, func, src, halo, dst=None, align=1, dtype=None):
+        """
+        Compute func(src, out) strip by strip into dst (allocated like src, with `dtype`, when None).
+
+        func must map a block of rows to a block of the same shape, written
+        into `out` (allocated by func when out is None), and only look `halo`
+        rows up and down; with align > 1 the halo is rounded up to a multiple
+        of align and strips are cut on multiples of align.
+        """
+        strips = self.bounds(src.shape[0], align)
+        if len(strips) == 1:
+            return func(src, dst) if dst is None else _copy_result(func(src, dst), dst)
+
+        if align > 1:
+            halo = -(-halo // align) * align
+        dtype = src.dtype if dtype is None else dtype
+        if dst is None:
+            target = np.empty(src.shape, dtype)
+        elif np.shares_memory(src, dst):
+            # In-place filtering would let one strip read rows another has already written
+            target = self._scratch("target", src.shape, dtype)
+        else:
+            target = dst
+        self._fill(func, src, halo, target, strips)
+        return target if dst is None else _copy_result(target, dst)
+
+    def _fill(self, func, src, halo, dst, strips):
+        rows = src.shape[0]
+
+        def strip(bounds):
+            y0, y1 = bounds
+            top, bottom = max(0, y0 - halo), min(rows, y1 + halo)
+            # The halo rows differ from the full-frame result, so the block goes to scratch first
+            block = self._scratch("block", (bottom - top,) + src.shape[1:], dst.dtype)
+            result = func(src[top:bottom], block)
+            dst[y0:y1] = result[y0 - top:y1 - top]
+
+        for future in [self.pool.submit(strip, bounds) for bounds in strips]:
+            future.result()
+
+    def filter2D(self, src, ddepth, kernel, dst=None, anchor=(-1, -1), delta=0, borderType=cv2.BORDER_DEFAULT):
+        kernel = np.asarray(kernel)
+        anchor_y = anchor[1] if anchor[1] >= 0 else kernel.shape[0] // 2
+        halo = max(anchor_y, kernel.shape[0] - 1 - anchor_y)
+        return self.run(lambda block, out: cv2.filter2D(block, ddepth, kernel, out, anchor, delta, borderType),
+                        src, halo, dst,
+                        dtype=None if ddepth < 0 else _DEPTHS[ddepth])
+
+    def GaussianBlur(self, src, ksize, sigmaX, dst=None, sigmaY=0, borderType=cv2.BORDER_DEFAULT):
+        height = ksize[1]
+        if height <= 0:
+            sigma = sigmaY if sigmaY > 0 else sigmaX
+            # Kernel size OpenCV derives from sigma (createGaussianKernels)
+            height = int(round(sigma * (3 if src.dtype == np.uint8 else 4) * 2 + 1)) | 1
+        return self.run(lambda block, out: cv2.GaussianBlur(block, ksize, sigmaX, out, sigmaY, borderType),
+                        src, height // 2, dst)
+
+    def morphologyEx(self, src, op, kernel, dst=None, anchor=(-1, -1), iterations=1):
+        passes = {cv2.MORPH_ERODE: 1, cv2.MORPH_DILATE: 1, cv2.MORPH_OPEN: 2, cv2.MORPH_CLOSE: 2,
+                  cv2.MORPH_GRADIENT: 1, cv2.MORPH_TOPHAT: 2, cv2.MORPH_BLACKHAT: 2}[op]
+        kernel = np.asarray(kernel)
+        anchor_y = anchor[1] if anchor[1] >= 0 else kernel.shape[0] // 2
+        halo = max(anchor_y, kernel.shape[0] - 1 - anchor_y) * passes * iterations
+        return self.run(lambda block, out: cv2.morphologyEx(block, op, kernel, out, anchor, iterations),
+                        src, halo, dst)
+
+    def gaussian_filter(self, src, sigma, output=None, truncate=4.0):
+        """scipy.ndimage.gaussian_filter with the default "reflect" mode."""
+        from scipy.ndimage import gaussian_filter
+
+        return self.run(lambda block, out: gaussian_filter(block, sigma, output=out, truncate=truncate), src,
+                        int(truncate * float(sigma) + 0.5), output)
+
+    def clahe(self, src, clipLimit=40.0, tileGridSize=(8, 8), dst=None, exact=True):
+        """CLAHE on a single-channel frame, split on tile row boundaries."""
+        tiles_x, tiles_y = tileGridSize
+        rows, cols = src.shape[:2]
+        tile_rows = rows // tiles_y
+        if tiles_y < 2 or rows % tiles_y or cols % tiles_x or (exact and tile_rows & (tile_rows - 1)):
+            return cv_cache.clahe(clipLimit, tileGridSize).apply(src, dst)
+
+        def block_clahe(block, out):
+            # CLAHE objects are not thread safe; cv_cache keeps one per worker thread
+            return cv_cache.clahe(clipLimit, (tiles_x, block.shape[0] // tile_rows)).apply(block, out)
+
+        return self.run(block_clahe, src, tile_rows, dst, align=tile_rows)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def _copy_result(result, dst):
+    if result is not dst:
+        np.copyto(dst, result)
+    return dst
+
+
+_default = None
+
+
+def default_executor():
+    """Shared executor used by the module-level functions."""
+    global _default
+    if _default is None:
+        _default = StripExecutor()
+    return _default
+
+
+def filter2D(src, ddepth, kernel, dst=None, **kwargs):
+    return default_executor().filter2D(src, ddepth, kernel, dst, **kwargs)
+
+
+def GaussianBlur(src, ksize, sigmaX, dst=None, **kwargs):
+    return default_executor().GaussianBlur(src, ksize, sigmaX, dst, **kwargs)
+
+
+def morphologyEx(src, op, kernel, dst=None, **kwargs):
+    return default_executor().morphologyEx(src, op, kernel, dst, **kwargs)
+
+
+def gaussian_filter(src, sigma, output=None, **kwargs):
+    return default_executor().gaussian_filter(src, sigma, output, **kwargs)
+
+
+def clahe(src, clipLimit=40.0, tileGridSize=(8, 8), dst=None, exact=True):
+    return default_executor().clahe(src, clipLimit, tileGridSize, dst, exact)
+
+
+def main(width=3840, height=2160, repeats=5, workers=None):
+    """Check bit-exactness against the single-threaded calls and time both at 4K."""
+    from scipy import ndimage
+
+    rng = np.random.default_rng(0)
+    gray = rng.integers(0, 256, (height, width), dtype=np.uint8)
+    # Power-of-two tile height, so that CLAHE can be split exactly
+    square = gray[:2048, :2048]
+    mask = np.where(rng.random((height, width)) > 0.7, 255, 0).astype(np.uint8)
+    image = gray / 255.0
+    sharpen = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+    box = np.ones((5, 5), np.uint8)
+    executor = StripExecutor(workers)
+    cases = {
+        "filter2D 3x3": (lambda: cv2.filter2D(gray, -1, sharpen), lambda: executor.filter2D(gray, -1, sharpen)),
+        "GaussianBlur 5x5": (lambda: cv2.GaussianBlur(mask, (5, 5), 0),
+                             lambda: executor.GaussianBlur(mask, (5, 5), 0)),
+        "morphology close": (lambda: cv2.morphologyEx(mask, cv2.MORPH_CLOSE, box),
+                             lambda: executor.morphologyEx(mask, cv2.MORPH_CLOSE, box)),
+        "morphology open": (lambda: cv2.morphologyEx(mask, cv2.MORPH_OPEN, box),
+                            lambda: executor.morphologyEx(mask, cv2.MORPH_OPEN, box)),
+        "gaussian_filter": (lambda: ndimage.gaussian_filter(image, 1), lambda: executor.gaussian_filter(image, 1)),
+        "CLAHE 8x8": (lambda: cv2.createCLAHE(3.0, (8, 8)).apply(gray), lambda: executor.clahe(gray, 3.0, (8, 8))),
+        "CLAHE 2048 8x8": (lambda: cv2.createCLAHE(3.0, (8, 8)).apply(square),
+                           lambda: executor.clahe(square, 3.0, (8, 8))),
+    }
+    print(f"{width}x{height}, {executor.workers} workers, {len(executor.bounds(height))} strips")
+    for name, (single, strips) in cases.items():
+        exact = np.array_equal(single(), strips())
+        timings = []
+        for func in (single, strips):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                func()
+            timings.append((time.perf_counter() - start) / repeats * 1000)
+        print(f"{name:18s} exact={exact}  single {timings[0]:7.2f} ms  strips {timings[1]:7.2f} ms")
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
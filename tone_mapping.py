@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Integer-domain tone mapping with 256-entry lookup tables.
+
+Every per-pixel point operation of the enhancement scripts (brightness and
+contrast, gamma, log, inverse, histogram equalization) maps the 256 possible
+uint8 levels to new levels, so it is computed once per level, in the same
+float64 arithmetic as the original code, and then applied with a single
+cv2.LUT pass.  The frames themselves never leave uint8, which avoids the
+8x memory traffic and the temporaries of the float64 chains.
+
+Tables that only depend on their parameters are cached; the histogram based
+ones (equalization, log with rescaling to the frame's range) are rebuilt per
+frame from a 256-bin histogram.  compose() fuses consecutive tables into one.
+
+Gray frames are mapped in place with apply(image, table, dst=image).
+apply_to_channel() maps the Y (YUV) or V (HSV) channel of a BGR frame in
+place inside the converted frame.  Shortcuts that skip the conversion
+(shifting B, G and R by the Y delta, scaling them by f(V) / V) were no faster
+than OpenCV's vectorized cvtColor round trip at 720p and not bit-identical
+to it, so the round trip stays.  `python tone_mapping.py` checks the tables
+against the float64 code and times both.
+"""
+
+import functools
+import time
+
+import cv2
+import numpy as np
+
+from frame_buffers import arena_buffer
+
+IDENTITY_LUT = np.arange(256, dtype=np.uint8)
+
+
+def _table(values):
+    table = np.ascontiguousarray(values)
+    table.setflags(write=False)
+    return table
+
+
+@functools.lru_cache(maxsize=64)
+def brightness_contrast_lut(alpha=1.5, beta=50):
+    """LUT equivalent of cv2.convertScaleAbs(image, alpha=alpha, beta=beta)."""
+    return _table(cv2.convertScaleAbs(IDENTITY_LUT, alpha=alpha, beta=beta).reshape(256))
+
+
+@functools.lru_cache(maxsize=64)
+def gamma_lut(gamma=2.0):
+    """LUT equivalent of the float64 (image / 255) ** gamma * 255 gamma correction (truncated to uint8)."""
+    return _table(np.clip(np.power(IDENTITY_LUT / 255.0, gamma) * 255.0, 0, 255).astype(np.uint8))
+
+
+@functools.lru_cache(maxsize=1)
+def inverse_lut():
+    """LUT of the negative 255 - x (cv2.bitwise_not as a table, for composing)."""
+    return _table(255 - IDENTITY_LUT)
+
+
+@functools.lru_cache(maxsize=64)
+def _log_levels(low, high, depth):
+    # log1p(img_as_float(x) * 255) of every level, rescaled to [0, 1] over the levels low..high
+    levels = np.log1p(np.multiply(IDENTITY_LUT, 1.0 / 255) * 255)
+    imin, imax = levels[low], levels[high]
+    if imin != imax:
+        levels = (levels - imin) / (imax - imin)
+    else:
+        levels = np.clip(levels, 0, 1)
+    if depth in (np.float32, np.float64):
+        return _table(levels.astype(depth))
+    scale = 255 if depth == np.uint8 else 65535
+    return _table(np.clip(levels * scale, 0, scale).astype(depth))
+
+
+def log_lut(gray_image=None, depth=np.uint8):
+    """
+    Log transform rescaled to the full output range, as in enhance_image (untitled11).
+
+    Parameters:
+    - gray_image: Rescale over the levels present in this frame (like
+      rescale_intensity with in_range='image'); None rescales over 0..255.
+    - depth: np.uint8 or np.uint16 output table (uint16 keeps 8 more bits for a
+      following filter), or np.float32 / np.float64 for the unquantized levels in [0, 1].
+    """
+    low, high = 0, 255
+    if gray_image is not None:
+        low, high = (int(value) for value in cv2.minMaxLoc(gray_image)[:2])
+    return _log_levels(low, high, np.dtype(depth).type)
+
+
+def equalize_lut(gray_image):
+    """LUT equivalent of exposure.equalize_hist(image) * 255 for uint8 frames (truncated)."""
+    hist = cv2.calcHist([gray_image], [0], None, [256], [0, 256]).reshape(256).astype(np.int64)
+    cdf = hist.cumsum()
+    cdf = cdf / float(cdf[-1])
+    return (cdf * 255).astype(np.uint8)
+
+
+def equalize_rescale_lut(gray_image):
+    """
+    LUT equivalent of the enhance_contrast step in untitled2.py, i.e.
+    rescale_intensity(equalize_hist(gray), out_range=(0, 255)).astype(uint8).
+
+    The table depends on the frame histogram, so it is rebuilt per frame from
+    a 256-bin histogram instead of float64 full-frame temporaries.
+    Histogram counts are exact for frames up to 2**24 pixels.
+    """
+    hist = cv2.calcHist([gray_image], [0], None, [256], [0, 256]).reshape(256).astype(np.int64)
+    present = np.flatnonzero(hist)
+    cdf = hist.cumsum()
+    cdf = cdf / float(cdf[-1])
+    imin, imax = float(cdf[present[0]]), float(cdf[present[-1]])
+    values = np.clip(cdf, imin, imax)
+    if imin != imax:
+        values = (values - imin) / (imax - imin)
+        values = values * 255.0
+    else:
+        values = np.clip(values, 0.0, 255.0)
+    return values.astype(np.uint8)
+
+
+def equalize(gray_image, dst=None):
+    """OpenCV's integer histogram equalization (cv2.equalizeHist)."""
+    return cv2.equalizeHist(gray_image, dst)
+
+
+def compose(*tables):
+    """Single table applying `tables` left to right (tables[-1] may be wider than uint8)."""
+    result = tables[0]
+    for table in tables[1:]:
+        result = table[result]
+    return result
+
+
+def apply(image, table, dst=None):
+    """cv2.LUT(image, table); pass dst=image to map in place."""
+    return cv2.LUT(image, table, dst=dst)
+
+
+# Colour space conversions and channel index for apply_to_channel
+_CHANNELS = {
+    "yuv": (cv2.COLOR_BGR2YUV, cv2.COLOR_YUV2BGR, 0),
+    "hsv": (cv2.COLOR_BGR2HSV, cv2.COLOR_HSV2BGR, 2),
+}
+
+
+def apply_to_channel(image, table, space="yuv", dst=None, arena=None):
+    """
+    Map the Y (space="yuv") or V (space="hsv") channel of a BGR frame through `table`.
+
+    The channel is mapped in place inside the converted frame, with all
+    planes taken from the arena when one is given, so the only full-frame
+    passes are OpenCV's two conversions.
+    """
+    forward, backward, index = _CHANNELS[space]
+    converted = cv2.cvtColor(image, forward, dst=arena_buffer(arena, f"tone_mapping.{space}", image))
+    channel = cv2.extractChannel(converted, index, arena_buffer(arena, f"tone_mapping.{space}.channel", image,
+                                                                 channels=1))
+    cv2.LUT(channel, table, dst=channel)
+    cv2.insertChannel(channel, converted, index)
+    return cv2.cvtColor(converted, backward, dst=dst)
+
+
+def main(width=1280, height=720, repeats=20):
+    """Check the tables against the float64 code they replace and time both."""
+    rng = np.random.default_rng(0)
+    frame = np.clip(rng.normal(60, 40, (height, width, 3)), 0, 255).astype(np.uint8)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def float_gamma(image):
+        image_float = image / 255.0
+        np.power(image_float, 2.0, out=image_float)
+        return np.clip(image_float * 255.0, 0, 255).astype(np.uint8)
+
+    def float_luma_gamma(image):
+        yuv = cv2.cvtColor(image, cv2.COLOR_BGR2YUV)
+        yuv[..., 0] = float_gamma(yuv[..., 0])
+        return cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR)
+
+    def float_log(image):
+        log_transformed = np.log1p(np.multiply(image, 1.0 / 255) * 255)
+        imin, imax = log_transformed.min(), log_transformed.max()
+        return ((log_transformed - imin) / (imax - imin) * 255).astype(np.uint8)
+
+    cases = [
+        ("gamma", float_gamma, lambda image: apply(image, gamma_lut(2.0)), gray),
+        ("gamma on Y", float_luma_gamma, lambda image: apply_to_channel(image, gamma_lut(2.0)), frame),
+        ("log", float_log, lambda image: apply(image, log_lut(image)), gray),
+    ]
+    for name, reference, table, image in cases:
+        identical = np.array_equal(reference(image), table(image))
+        timings = []
+        for func in (reference, table):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                func(image)
+            timings.append((time.perf_counter() - start) / repeats * 1000)
+        print(f"{name:12s} identical={identical}  float64 {timings[0]:7.2f} ms  LUT {timings[1]:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lightweight SORT-style tracker for detect-every-N operation.
+
+YOLO runs only on scheduled frames.  On every frame a constant-velocity
+Kalman filter (vectorized over all tracks in NumPy) propagates the boxes, so
+the scripts still draw boxes at the full capture rate.  On detection frames
+the predicted boxes are matched to the new detections by IoU and corrected.
+Tracks keep a persistent id and the frame they were first seen on, which is
+what dwell time analytics need.
+
+Example:
+    scheduler = DetectionScheduler(stride=3)
+    tracker = Tracker()
+    for frame in frames:
+        detections = Detections.from_array(model(frame), model.names) if scheduler.should_detect(tracker) else None
+        tracks = tracker.step(detections, scheduler.current_stride)
+
+`python tracker.py` checks that a track the latest detection did not match
+is no longer reported, at stride 1 and 3.
+"""
+
+import numpy as np
+
+from detections import DETECTION_DTYPE, Detections
+
+# State: cx, cy, w, h and their velocities; measurement: cx, cy, w, h
+_F = np.eye(8, dtype=np.float64)
+_F[:4, 4:] = np.eye(4)
+_H = np.eye(4, 8, dtype=np.float64)
+
+# Process / measurement noise relative to the box size (as in DeepSORT)
+_STD_POSITION = 1 / 20
+_STD_VELOCITY = 1 / 160
+
+
+def xyxy_to_cxcywh(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    wh = boxes[:, 2:] - boxes[:, :2]
+    return np.column_stack([boxes[:, :2] + wh / 2, wh])
+
+
+def cxcywh_to_xyxy(boxes):
+    return np.column_stack([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2])
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU of (N, 4) and (M, 4) x1, y1, x2, y2 boxes."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def greedy_match(iou, threshold):
+    """Match rows to columns by descending IoU; returns (matches, unmatched_rows, unmatched_cols)."""
+    matches = []
+    if iou.size:
+        rows, cols = np.nonzero(iou >= threshold)
+        order = np.argsort(-iou[rows, cols], kind="stable")
+        used_rows, used_cols = set(), set()
+        for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+            if row not in used_rows and col not in used_cols:
+                used_rows.add(row)
+                used_cols.add(col)
+                matches.append((row, col))
+    matched_rows = {row for row, _ in matches}
+    matched_cols = {col for _, col in matches}
+    unmatched_rows = [row for row in range(iou.shape[0]) if row not in matched_rows]
+    unmatched_cols = [col for col in range(iou.shape[1]) if col not in matched_cols]
+    return matches, unmatched_rows, unmatched_cols
+
+
+class Tracker:
+    """
+    Multi-object tracker with one Kalman filter per track, stored as stacked arrays.
+
+    Parameters:
+    - iou_threshold: Minimum IoU between a predicted track and a detection to match them.
+    - max_age: Frames a track survives without a matching detection before it
+      is deleted (should exceed the detection stride).  Tracks are reported
+      only while their misses stay within the detection stride (see tracks()).
+    - min_hits: Matched detections needed before a track is reported.
+    - class_aware: Only match detections of the same class.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=30, min_hits=1, class_aware=True):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.class_aware = class_aware
+        self.names = {}
+        self.frame_index = -1
+        self.next_id = 1
+        self.mean = np.zeros((0, 8))
+        self.covariance = np.zeros((0, 8, 8))
+        self.ids = np.zeros(0, np.int64)
+        self.class_ids = np.zeros(0, np.int32)
+        self.scores = np.zeros(0, np.float32)
+        self.hits = np.zeros(0, np.int64)
+        self.misses = np.zeros(0, np.int64)
+        self.first_frame = np.zeros(0, np.int64)
+        self.changed = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _process_noise(self):
+        h = self.mean[:, 3]
+        std = np.column_stack([_STD_POSITION * h] * 4 + [_STD_VELOCITY * h] * 4)
+        return np.einsum("ni,ij->nij", np.square(std), np.eye(8))
+
+    def predict(self):
+        """Advance every track by one frame."""
+        if len(self):
+            self.mean = self.mean @ _F.T
+            self.mean[:, 2:4] = np.maximum(self.mean[:, 2:4], 1.0)
+            self.covariance = _F @ self.covariance @ _F.T + self._process_noise()
+        self.misses += 1
+
+    def _update(self, index, measurements):
+        h = self.mean[index, 3]
+        noise = np.square(_STD_POSITION * h)[:, None, None] * np.eye(4)
+        covariance = self.covariance[index]
+        projected = _H @ covariance @ _H.T + noise
+        gain = covariance @ _H.T @ np.linalg.inv(projected)
+        innovation = measurements - self.mean[index] @ _H.T
+        self.mean[index] += np.einsum("nij,nj->ni", gain, innovation)
+        self.covariance[index] = covariance - gain @ _H @ covariance
+
+    def _add(self, measurements, class_ids, scores):
+        count = len(measurements)
+        mean = np.zeros((count, 8))
+        mean[:, :4] = measurements
+        h = measurements[:, 3]
+        std = np.column_stack([2 * _STD_POSITION * h] * 4 + [10 * _STD_VELOCITY * h] * 4)
+        self.mean = np.concatenate([self.mean, mean])
+        self.covariance = np.concatenate([self.covariance, np.einsum("ni,ij->nij", np.square(std), np.eye(8))])
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + count)])
+        self.next_id += count
+        self.class_ids = np.concatenate([self.class_ids, class_ids])
+        self.scores = np.concatenate([self.scores, scores])
+        self.hits = np.concatenate([self.hits, np.ones(count, np.int64)])
+        self.misses = np.concatenate([self.misses, np.zeros(count, np.int64)])
+        self.first_frame = np.concatenate([self.first_frame, np.full(count, self.frame_index, np.int64)])
+
+    def _keep(self, keep):
+        for name in ("mean", "covariance", "ids", "class_ids", "scores", "hits", "misses", "first_frame"):
+            setattr(self, name, getattr(self, name)[keep])
+
+    def update(self, detections):
+        """Match detections to the (already predicted) tracks, correct them and start new tracks."""
+        self.names = detections.names or self.names
+        predicted = cxcywh_to_xyxy(self.mean[:, :4])
+        iou = iou_matrix(predicted, detections.xyxy.astype(np.float64))
+        if self.class_aware:
+            iou[self.class_ids[:, None] != detections.class_ids[None, :]] = 0.0
+        matches, unmatched_tracks, unmatched_detections = greedy_match(iou, self.iou_threshold)
+
+        measurements = xyxy_to_cxcywh(detections.xyxy)
+        if matches:
+            tracks, matched = map(np.array, zip(*matches))
+            self._update(tracks, measurements[matched])
+            self.scores[tracks] = detections.scores[matched]
+            self.hits[tracks] += 1
+            self.misses[tracks] = 0
+
+        lost = self.misses > self.max_age
+        self.changed = bool(unmatched_detections) or bool(lost.any())
+        self._keep(~lost)
+        if unmatched_detections:
+            new = np.array(unmatched_detections)
+            self._add(measurements[new], detections.class_ids[new], detections.scores[new])
+
+    def step(self, detections=None, stride=1):
+        """
+        Process one frame: predict, then update if `detections` were computed for it.
+
+        Returns the current tracks as Detections with track_ids.  `stride` is the
+        current detection stride (DetectionScheduler.current_stride).
+        """
+        self.frame_index += 1
+        self.predict()
+        if detections is not None:
+            self.update(detections)
+        else:
+            lost = self.misses > self.max_age
+            if lost.any():
+                self._keep(~lost)
+        return self.tracks(stride)
+
+    def tracks(self, max_misses=1):
+        """
+        Reported tracks as Detections with track_ids.
+
+        A track is reported once it has min_hits matches and while it has missed
+        fewer than `max_misses` frames (pass the detection stride).  predict()
+        counts the current frame as a miss until update() matches the track, so
+        a track the last detection did not match is no longer drawn, although
+        it is kept until max_age in case the object comes back.
+        """
+        reported = (self.hits >= self.min_hits) & (self.misses < max_misses)
+        boxes = cxcywh_to_xyxy(self.mean[reported, :4])
+        data = np.empty(len(boxes), DETECTION_DTYPE)
+        for index, field in enumerate(("x1", "y1", "x2", "y2")):
+            data[field] = boxes[:, index]
+        data["score"] = self.scores[reported]
+        data["class_id"] = self.class_ids[reported]
+        return Detections(data, self.names, self.ids[reported])
+
+    def dwell_times(self, fps=None):
+        """Track id -> time since first seen, in frames (or seconds when fps is given)."""
+        frames = self.frame_index - self.first_frame + 1
+        if fps:
+            frames = frames / fps
+        return dict(zip(self.ids.tolist(), frames.tolist()))
+
+
+class DetectionScheduler:
+    """
+    Decides on which frames the detector runs.
+
+    Parameters:
+    - stride: Run the detector every `stride` frames (1 = every frame).
+    - adaptive: Grow the stride up to max_stride while the tracked scene is
+      stable, and drop back to `stride` as soon as tracks appear or vanish.
+    - max_stride: Upper bound for the adaptive stride.
+    """
+
+    def __init__(self, stride=3, adaptive=False, max_stride=10):
+        self.stride = stride
+        self.adaptive = adaptive
+        self.max_stride = max(max_stride, stride)
+        self.current_stride = stride
+        self.countdown = 0
+        self.frames = 0
+        self.detections = 0
+
+    def should_detect(self, tracker=None):
+        """Call once per frame; True when the detector should run on this frame."""
+        self.frames += 1
+        if self.countdown > 0:
+            self.countdown -= 1
+            return False
+        if self.adaptive and tracker is not None and self.detections:
+            if tracker.changed:
+                self.current_stride = self.stride
+            else:
+                self.current_stride = min(self.current_stride + 1, self.max_stride)
+        self.countdown = self.current_stride - 1
+        self.detections += 1
+        return True
+
+    @property
+    def detection_rate(self):
+        """Fraction of frames on which the detector ran."""
+        return self.detections / self.frames if self.frames else 0.0
+
+
+def main(strides=(1, 3), frames=12):
+    """Report on which frames a box that vanishes after the first detection is still drawn."""
+    box = np.zeros(1, DETECTION_DTYPE)
+    box["x2"], box["y2"], box["score"] = 50, 50, 0.9
+    present = Detections(box, {0: "object"})
+    empty = Detections(box[:0], {0: "object"})
+    for stride in strides:
+        scheduler = DetectionScheduler(stride)
+        tracker = Tracker()
+        drawn = []
+        for index in range(frames):
+            detect = scheduler.should_detect(tracker)
+            detections = (present if index == 0 else empty) if detect else None
+            if len(tracker.step(detections, scheduler.current_stride)):
+                drawn.append(index)
+        # Drawn up to the frame before the detection that no longer finds the object
+        ok = drawn == list(range(stride))
+        print(f"stride {stride}: drawn on frames {drawn}, kept {len(tracker)} track(s)  ok={ok}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,93 @@
 import cv2
-import numpy as np
+from frame_buffers import FrameArena, arena_buffer
+from lut_enhance import FusedLowLightEnhancer
+from adaptive_enhance import AdaptiveEnhancer
+from video_io import open_sink, open_source
+from metrics import timed
+import strip_parallel
+import cv_cache
+import tone_mapping
 
-def adjust_brightness_contrast(image, beta=50, alpha=1.5):
+# با ADAPTIVE هر فریم بر اساس روشنایی صحنه فقط مراحل لازم را اجرا می‌کند
+# (از عبور مستقیم در روز تا زنجیره‌ی کامل در تاریکی)
+ADAPTIVE = False
+
+# پارامتر arena (اختیاری) بافرهای از پیش تخصیص‌یافته را برای خروجی هر مرحله فراهم می‌کند
+
+def adjust_brightness_contrast(image, beta=50, alpha=1.5, arena=None):
     # افزایش روشنایی و کنتراست تصویر
-    return cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
+    dst = arena_buffer(arena, 'adjust_brightness_contrast', image)
+    return cv2.convertScaleAbs(image, dst, alpha=alpha, beta=beta)
 
-def gamma_correction(image, gamma=2.0):
-    # تبدیل تصویر به فضای رنگی YUV
-    yuv_image = cv2.cvtColor(image, cv2.COLOR_BGR2YUV)
-    
-    # اعمال تصحیح گاما بر روی کانال Y
-    yuv_image[..., 0] = np.clip(np.power(yuv_image[..., 0] / 255.0, gamma) * 255.0, 0, 255).astype(np.uint8)
-    
-    # تبدیل مجدد به فضای رنگی BGR
-    return cv2.cvtColor(yuv_image, cv2.COLOR_YUV2BGR)
+def gamma_correction(image, gamma=2.0, arena=None):
+    # اعمال تصحیح گاما بر روی کانال Y در فضای YUV با جدول LUT (بدون آرایه‌های float64)
+    return tone_mapping.apply_to_channel(image, tone_mapping.gamma_lut(gamma), "yuv",
+                                         dst=arena_buffer(arena, 'gamma_correction.bgr', image), arena=arena)
 
-def apply_clahe(image):
+@timed("clahe")
+def apply_clahe(image, arena=None):
     # تبدیل تصویر به فضای رنگی خاکستری
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
-    # ایجاد شیء CLAHE و تنظیم پارامترها
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=arena_buffer(arena, 'apply_clahe.gray', image, channels=1))
     
-    # اعمال CLAHE بر روی تصویر خاکستری
-    clahe_image = clahe.apply(gray_image)
+    # اعمال CLAHE بر روی تصویر خاکستری (در نوارهای موازی روی فریم‌های بزرگ)
+    clahe_image = strip_parallel.clahe(gray_image, 3.0, (8, 8), arena_buffer(arena, 'apply_clahe.clahe', gray_image))
     
     # تبدیل تصویر خاکستری به BGR
-    return cv2.cvtColor(clahe_image, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(clahe_image, cv2.COLOR_GRAY2BGR, dst=arena_buffer(arena, 'apply_clahe.bgr', image))
 
-def enhance_details(image):
+def enhance_details(image, arena=None):
     # استفاده از sharpening filter برای افزایش جزئیات
-    kernel = np.array([[0, -1, 0],
-                       [-1, 5, -1],
-                       [0, -1, 0]])
-    sharpened_image = cv2.filter2D(image, -1, kernel)
+    kernel = cv_cache.sharpen_kernel()
+    sharpened_image = strip_parallel.filter2D(image, -1, kernel, dst=arena_buffer(arena, 'enhance_details', image))
     
     return sharpened_image
 
-def convert_to_hsv(image):
+def convert_to_hsv(image, arena=None):
     # تبدیل تصویر به فضای رنگی HSV
-    hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=arena_buffer(arena, 'convert_to_hsv.hsv', image))
     
     # افزایش روشنایی در کانال V
-    hsv_image[..., 2] = cv2.convertScaleAbs(hsv_image[..., 2], alpha=1.5, beta=30)
+    v_channel = cv2.extractChannel(hsv_image, 2, arena_buffer(arena, 'convert_to_hsv.v', image, channels=1))
+    cv2.convertScaleAbs(v_channel, v_channel, alpha=1.5, beta=30)
+    cv2.insertChannel(v_channel, hsv_image, 2)
     
     # تبدیل مجدد به فضای رنگی BGR
-    return cv2.cvtColor(hsv_image, cv2.COLOR_HSV2BGR)
+    return cv2.cvtColor(hsv_image, cv2.COLOR_HSV2BGR, dst=arena_buffer(arena, 'convert_to_hsv.bgr', image))
 
-def improve_low_light(image):
+@timed("improve_low_light")
+def improve_low_light(image, arena=None):
     # تبدیل به فضای رنگی HSV برای افزایش روشنایی
-    hsv_image = convert_to_hsv(image)
+    hsv_image = convert_to_hsv(image, arena)
     
     # تنظیم روشنایی و کنتراست
-    bright_image = adjust_brightness_contrast(hsv_image, beta=50, alpha=1.5)
+    bright_image = adjust_brightness_contrast(hsv_image, beta=50, alpha=1.5, arena=arena)
     
     # تصحیح گاما
-    gamma_corrected_image = gamma_correction(bright_image, gamma=2.0)
+    gamma_corrected_image = gamma_correction(bright_image, gamma=2.0, arena=arena)
     
     # اعمال CLAHE برای افزایش کنتراست محلی
-    clahe_image = apply_clahe(gamma_corrected_image)
+    clahe_image = apply_clahe(gamma_corrected_image, arena)
     
     # افزایش جزئیات
-    detailed_image = enhance_details(clahe_image)
+    detailed_image = enhance_details(clahe_image, arena)
     
     return detailed_image
 
-def main():
+def main(source=None, sink=None):
     # اتصال به دوربین (0 برای دوربین پیش‌فرض)
-    cap = cv2.VideoCapture(0)
+    cap = open_source(source)
+    sink = open_sink(sink)
 
     if not cap.isOpened():
         print("خطا: دوربین باز نشد!")
         return
 
+    # نسخه‌ی کامپایل‌شده و معادل improve_low_light با جدول‌های LUT
+    enhancer = FusedLowLightEnhancer("hsv_first")
+    if ADAPTIVE:
+        enhancer = AdaptiveEnhancer(enhancer)
+    arena = FrameArena()
+
     while True:
         # خواندن فریم از دوربین
         ret, frame = cap.read()
@@ -82,19 +97,23 @@ def main():
             break
 
         # بهبود تصویر در شرایط نور کم
-        improved_frame = improve_low_light(frame)
+        improved_frame = enhancer(frame, arena)
+        arena.next_frame()
 
         # نمایش تصویر اصلی و تصویر بهبود یافته
-        cv2.imshow('Original Frame', frame)
-        cv2.imshow('Improved Frame', improved_frame)
+        sink.show('Original Frame', frame)
+        sink.show('Improved Frame', improved_frame)
 
         # خروج از برنامه با فشار دادن کلید 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if sink.wait_key() == ord('q'):
             break
 
     # آزادسازی منابع و بستن پنجره‌ها
+    print(arena.summary())
+    if ADAPTIVE:
+        print(enhancer.stats.summary())
     cap.release()
-    cv2.destroyAllWindows()
+    sink.close()
 
 if __name__ == "__main__":
     main()
@@ -15,18 +15,73 @@ Created on Sat Aug  3 21:01:48 2024
 """
 
 import cv2
-import numpy as np
-
-def main():
+from video_io import open_sink, open_source
+from metrics import timed
+import strip_parallel
+import cv_cache
+import pyramid_motion
+import background_snapshot
+import blobs
+import clip_recorder
+
+# Background model snapshot: restored at start and checkpointed every minute in the
+# background, so a restart does not begin with an empty model (None = disabled)
+BACKGROUND_SNAPSHOT = None
+
+# Pyramid level for background subtraction: frames are downscaled by 2**PYRAMID_LEVEL
+# and the boxes rescaled to full resolution (0 = full resolution; 1-3 for 4K cameras)
+PYRAMID_LEVEL = 0
+
+# Clip directory: the seconds before and after every detection are written from an
+# in-memory pre-roll to a clip file, and nothing else is recorded (None = disabled)
+CLIP_DIRECTORY = None
+
+@timed("background_subtraction")
+def subtract_background(frame, backSub, level=PYRAMID_LEVEL, clips=None):
+    """Apply background subtraction and draw bounding boxes around moving objects."""
+    # Keep the clean frame in the clip pre-roll (before boxes are drawn on it)
+    if clips is not None:
+        clips.push(frame)
+
+    # Apply background subtraction
+    fgMask = backSub.apply(pyramid_motion.downscale(frame, level))
+
+    # Apply morphological operations
+    kernel = cv_cache.ones_kernel(pyramid_motion.scaled_ksize((1, 1), level))
+    fgMask = strip_parallel.morphologyEx(fgMask, cv2.MORPH_CLOSE, kernel)
+    fgMask = strip_parallel.morphologyEx(fgMask, cv2.MORPH_OPEN, kernel)
+
+    # Apply Gaussian blur to reduce noise
+    blurred = strip_parallel.GaussianBlur(fgMask, pyramid_motion.scaled_ksize((1, 1), level), 0)
+
+    # Find the blobs (filtering out small ones)
+    regions = blobs.extract_blobs(blurred, pyramid_motion.scaled_area(10, level))
+
+    # Start (or extend) a clip when blobs were found
+    regions = blobs.upscale_blobs(regions, level, frame.shape)
+    if clips is not None:
+        clips.update(regions)
+
+    # Draw bounding boxes around detected objects
+    blobs.draw_blobs(frame, regions, thickness=2)
+
+    return frame, fgMask
+
+def main(source=None, sink=None):
     # Initialize video capture
-    cap = cv2.VideoCapture(0)
+    cap = open_source(source)
+    sink = open_sink(sink)
     
     if not cap.isOpened():
         print("Error: Unable to open camera.")
         return
 
     # Create background subtractor with KNN
-    backSub = cv2.createBackgroundSubtractorKNN(history=10, dist2Threshold=15.0, detectShadows=True)
+    backSub = background_snapshot.restore_or_create(
+        BACKGROUND_SNAPSHOT, lambda: cv2.createBackgroundSubtractorKNN(history=10, dist2Threshold=15.0, detectShadows=True))
+    checkpointer = background_snapshot.BackgroundCheckpointer(backSub, BACKGROUND_SNAPSHOT)
+
+    clips = clip_recorder.ClipRecorder(CLIP_DIRECTORY, fps=cap.get(cv2.CAP_PROP_FPS), min_area=100)
 
     try:
         while True:
@@ -37,39 +92,24 @@ def main():
                 print("Error: Unable to read frame.")
                 break
 
-            # Apply background subtraction
-            fgMask = backSub.apply(frame)
-
-            # Apply morphological operations
-            kernel = np.ones((1, 1), np.uint8)
-            fgMask = cv2.morphologyEx(fgMask, cv2.MORPH_CLOSE, kernel)
-            fgMask = cv2.morphologyEx(fgMask, cv2.MORPH_OPEN, kernel)
-
-            # Apply Gaussian blur to reduce noise
-            blurred = cv2.GaussianBlur(fgMask, (1, 1), 0)
-
-            # Find contours
-            contours, _ = cv2.findContours(blurred, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-            # Draw bounding boxes around detected objects
-            for contour in contours:
-                if cv2.contourArea(contour) > 10:  # Filter out small contours
-                    x, y, w, h = cv2.boundingRect(contour)
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    
+            # Checkpoint the background model now and then (before boxes are drawn on the frame)
+            checkpointer.update(frame)
+            frame, fgMask = subtract_background(frame, backSub, clips=clips)
 
             # Display the results
-            cv2.imshow('Frame', frame)
-            cv2.imshow('Foreground Mask', fgMask)
+            sink.show('Frame', frame)
+            sink.show('Foreground Mask', fgMask)
 
             # Exit loop if 'q' is pressed
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            if sink.wait_key() == ord('q'):
                 break
 
     finally:
         # Release resources
+        checkpointer.close()
+        clips.close()
         cap.release()
-        cv2.destroyAllWindows()
+        sink.close()
 
 if __name__ == "__main__":
     main()
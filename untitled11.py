@@ -8,57 +8,67 @@ Created on Sat Aug  3 22:20:23 2024
 
 import cv2
 import numpy as np
-from skimage import exposure, img_as_float
-from scipy.ndimage import gaussian_filter
+from frame_buffers import FrameArena, arena_buffer, cast_into
+from video_io import open_sink, open_source
+from metrics import timed
+import strip_parallel
+import tone_mapping
 
-def enhance_image(image):
+@timed("enhance_image")
+def enhance_image(image, arena=None):
     # تبدیل تصویر به فضای رنگی خاکستری
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=arena_buffer(arena, 'enhance_image.gray', image, channels=1))
     
-    # نرمال‌سازی و تبدیل به float
-    gray_image_float = img_as_float(gray_image)
+    # تبدیل لگاریتمی و نرمال‌سازی شدت (معادل log1p روی img_as_float و rescale_intensity با in_range='image')
+    # به صورت جدول LUT با خروجی float64 در بافرهای arena (همان دقت نسخه اصلی، بدون آرایه‌های موقت)
+    log_transformed = cv2.LUT(gray_image, tone_mapping.log_lut(gray_image, np.float64),
+                              dst=arena_buffer(arena, 'enhance_image.log', gray_image, np.float64))
     
-    # تبدیل لگاریتمی برای افزایش کنتراست
-    log_transformed = np.log1p(gray_image_float * 255)
+    # استفاده از فیلتر گوسی برای کاهش نویز (sigma=1 با شعاع 4 و مرز reflect، مانند gaussian_filter)
+    denoised_image = strip_parallel.GaussianBlur(log_transformed, (9, 9), 1,
+                                                 dst=arena_buffer(arena, 'enhance_image.denoised', log_transformed),
+                                                 borderType=cv2.BORDER_REFLECT)
     
-    # نرمال‌سازی شدت تصویر
-    log_transformed = exposure.rescale_intensity(log_transformed, in_range='image')
+    # بازگشت به دامنه اصلی تصویر (برش به پایین مانند تبدیل float به uint8)
+    np.multiply(denoised_image, 255, out=denoised_image)
+    enhanced_image = cast_into(arena_buffer(arena, 'enhance_image.enhanced', gray_image), denoised_image)
     
-    # استفاده از فیلتر گوسی برای کاهش نویز
-    denoised_image = gaussian_filter(log_transformed, sigma=1)
-    
-    # بازگشت به دامنه اصلی تصویر
-    enhanced_image = (denoised_image * 255).astype(np.uint8)
-    
-    # استفاده از افزایش کنتراست هیستوگرام
-    enhanced_image = exposure.equalize_hist(enhanced_image) * 255
-    enhanced_image = enhanced_image.astype(np.uint8)
+    # استفاده از افزایش کنتراست هیستوگرام (معادل exposure.equalize_hist به صورت جدول LUT)
+    tone_mapping.apply(enhanced_image, tone_mapping.equalize_lut(enhanced_image), dst=enhanced_image)
     
     # تبدیل تصویر به فضای رنگی BGR
-    enhanced_image = cv2.cvtColor(enhanced_image, cv2.COLOR_GRAY2BGR)
+    enhanced_image = cv2.cvtColor(enhanced_image, cv2.COLOR_GRAY2BGR, dst=arena_buffer(arena, 'enhance_image.bgr', image))
     
     return enhanced_image
 
-# باز کردن دوربین (عدد 0 برای دوربین پیش‌فرض)
-cap = cv2.VideoCapture(0)
+def main(source=None, sink=None):
+    # باز کردن دوربین (عدد 0 برای دوربین پیش‌فرض)
+    cap = open_source(source)
+    sink = open_sink(sink)
+    arena = FrameArena()
 
-while True:
-    # خواندن یک فریم از دوربین
-    ret, frame = cap.read()
-    
-    if not ret:
-        break
-    
-    # بهبود تصویر
-    enhanced_frame = enhance_image(frame)
-    
-    # نمایش تصویر بهبود یافته
-    cv2.imshow('Night Vision', enhanced_frame)
-    
-    # خروج از حلقه با زدن کلید 'q'
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+    while True:
+        # خواندن یک فریم از دوربین
+        ret, frame = cap.read()
+
+        if not ret:
+            break
+
+        # بهبود تصویر
+        enhanced_frame = enhance_image(frame, arena)
+        arena.next_frame()
+
+        # نمایش تصویر بهبود یافته
+        sink.show('Night Vision', enhanced_frame)
+
+        # خروج از حلقه با زدن کلید 'q'
+        if sink.wait_key() == ord('q'):
+            break
+
+    # آزادسازی منابع
+    print(arena.summary())
+    cap.release()
+    sink.close()
 
-# آزادسازی منابع
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
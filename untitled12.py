@@ -1,7 +1,10 @@
 import cv2
 import numpy as np
+from video_io import open_sink, open_source
+from metrics import timed
 
 # تابع برای شبیه‌سازی تصویر مادون قرمز
+@timed("simulate_ir")
 def simulate_ir(image):
     # تبدیل تصویر به فضای رنگی خاکستری
     gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -11,28 +14,33 @@ def simulate_ir(image):
     
     return ir_image
 
-# باز کردن دوربین (عدد 0 نشان‌دهنده دوربین پیش‌فرض است)
-cap = cv2.VideoCapture(0)
+def main(source=None, sink=None):
+    # باز کردن دوربین (عدد 0 نشان‌دهنده دوربین پیش‌فرض است)
+    cap = open_source(source)
+    sink = open_sink(sink)
 
-while True:
-    # خواندن فریم از دوربین
-    ret, frame = cap.read()
-    
-    if not ret:
-        print("خطا در خواندن فریم")
-        break
-    
-    # شبیه‌سازی تصویر مادون قرمز
-    ir_frame = simulate_ir(frame)
-    
-    # نمایش تصویر اصلی و شبیه‌سازی شده
-    cv2.imshow('Original Frame', frame)
-    cv2.imshow('Simulated IR Frame', ir_frame)
-    
-    # خروج از حلقه با فشار دادن کلید 'q'
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+    while True:
+        # خواندن فریم از دوربین
+        ret, frame = cap.read()
+
+        if not ret:
+            print("خطا در خواندن فریم")
+            break
+
+        # شبیه‌سازی تصویر مادون قرمز
+        ir_frame = simulate_ir(frame)
+
+        # نمایش تصویر اصلی و شبیه‌سازی شده
+        sink.show('Original Frame', frame)
+        sink.show('Simulated IR Frame', ir_frame)
+
+        # خروج از حلقه با فشار دادن کلید 'q'
+        if sink.wait_key() == ord('q'):
+            break
+
+    # آزاد کردن دوربین و بستن تمام پنجره‌ها
+    cap.release()
+    sink.close()
 
-# آزاد کردن دوربین و بستن تمام پنجره‌ها
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
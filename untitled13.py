@@ -1,57 +1,86 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
+from detector_backends import load_detector
+from detections import Detections, DetectionRenderer
+from tracker import DetectionScheduler, Tracker
+from video_io import open_sink, open_source
+from metrics import timed
 
-# Load YOLOv8x model and move it to GPU if available
-model = YOLO('yolov8n.pt')  # Use 'yolov8n.pt' for even faster processing if accuracy is acceptable
+# Detector backend: "torch" (ultralytics/PyTorch), "onnx" or "onnx-int8" (onnxruntime, exported once and cached)
+BACKEND = "torch"
 
-# Open a connection to the camera
-cap = cv2.VideoCapture(0)
-
-# Check if the camera opened successfully
-if not cap.isOpened():
-    print("Error: Could not open camera.")
-    exit()
-
-# Set the camera resolution (lower resolution for faster processing)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 320)  # Reduced resolution for speed
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)  # Reduced resolution for speed
-
-while True:
-    # Capture frame-by-frame
-    ret, frame = cap.read()
-    if not ret:
-        print("Error: Failed to capture image")
-        break
+# Run the detector every DETECT_STRIDE frames and track the boxes in between
+# (1 = detect on every frame); ADAPTIVE_STRIDE grows the stride up to
+# MAX_STRIDE while the tracked scene is stable
+DETECT_STRIDE = 1
+ADAPTIVE_STRIDE = False
+MAX_STRIDE = 10
 
+@timed("detect_and_track")
+def process_frame(frame, model, renderer, scheduler, tracker):
     # Convert to grayscale for night vision effect
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    
+
     # Apply a color map to simulate night vision
     night_vision = cv2.applyColorMap(gray, cv2.COLORMAP_HOT)
 
     # Convert the frame to the format required by YOLOv8
     night_vision_rgb = cv2.cvtColor(night_vision, cv2.COLOR_BGR2RGB)
 
-    # Perform object detection with YOLOv8x
-    results = model(night_vision_rgb, stream=True, imgsz=320)  # Further reduced image size for speed
+    # Perform object detection with YOLOv8x on scheduled frames only
+    detections = None
+    if scheduler.should_detect(tracker):
+        boxes = model(night_vision_rgb)  # Further reduced image size for speed
+        detections = Detections.from_array(boxes, model.names)
+
+    # Propagate the tracks to this frame and draw them with their ids
+    tracks = tracker.step(detections, scheduler.current_stride)
+    renderer.draw(night_vision, tracks)
+
+    return night_vision
+
+def main(source=None, sink=None):
+    # Load YOLOv8x model and move it to GPU if available
+    model = load_detector('yolov8n.pt', imgsz=320, backend=BACKEND)  # Use 'yolov8n.pt' for even faster processing if accuracy is acceptable
+
+    # Thin boxes and text for speed
+    renderer = DetectionRenderer(thickness=1)
+    scheduler = DetectionScheduler(stride=DETECT_STRIDE, adaptive=ADAPTIVE_STRIDE, max_stride=MAX_STRIDE)
+    tracker = Tracker()
+
+    # Open a connection to the camera
+    cap = open_source(source)
+    sink = open_sink(sink)
+
+    # Check if the camera opened successfully
+    if not cap.isOpened():
+        print("Error: Could not open camera.")
+        return
+
+    # Set the camera resolution (lower resolution for faster processing)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 320)  # Reduced resolution for speed
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)  # Reduced resolution for speed
+
+    while True:
+        # Capture frame-by-frame
+        ret, frame = cap.read()
+        if not ret:
+            print("Error: Failed to capture image")
+            break
+
+        night_vision = process_frame(frame, model, renderer, scheduler, tracker)
 
-    # Draw bounding boxes and labels on the night vision image
-    for result in results:
-        boxes = result.boxes.data.cpu().numpy()
-        for box in boxes:
-            x1, y1, x2, y2, score, class_id = map(int, box)
-            label = f"{model.names[class_id]}: {score:.2f}"
-            cv2.rectangle(night_vision, (x1, y1), (x2, y2), (0, 255, 0), 1)  # Thin box for speed
-            cv2.putText(night_vision, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)  # Thin text for speed
+        # Display the resulting frame
+        sink.show('Night Vision YOLOv8x', night_vision)
 
-    # Display the resulting frame
-    cv2.imshow('Night Vision YOLOv8x', night_vision)
+        # Break the loop on 'q' key press
+        if sink.wait_key() == ord('q'):
+            break
 
-    # Break the loop on 'q' key press
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+    # Release the capture and close all windows
+    cap.release()
+    sink.close()
+    print(f"Detector ran on {scheduler.detection_rate:.1%} of {scheduler.frames} frames")
 
-# Release the capture and close all windows
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
@@ -7,49 +7,78 @@ Created on Sun Aug  4 13:35:09 2024
 """
 
 import cv2
-from ultralytics import YOLO
-
-# Load the YOLOv8n model (nano) for ultra-fast inference
-model = YOLO('yolov10n.pt')  # Replace with the path to your YOLOv8n model
-
-# Open a connection to the camera
-cap = cv2.VideoCapture(0)
-
-# Check if the camera opened successfully
-if not cap.isOpened():
-    print("Error: Could not open camera.")
-    exit()
-
-# Set the camera resolution (lower resolution for speed)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 512)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 512)
-
-while True:
-    # Capture frame-by-frame
-    ret, frame = cap.read()
-    if not ret:
-        print("Error: Failed to capture image")
-        break
-
-    # Perform object detection with YOLOv8n
-    results = model(frame, imgsz=512, stream=True)  # Adjust img size if necessary
-
-    # Draw bounding boxes and labels on the frame
-    for result in results:
-        boxes = result.boxes.data.cpu().numpy()
-        for box in boxes:
-            x1, y1, x2, y2, score, class_id = map(int, box)
-            label = f"{model.names[class_id]}: {score:.2f}"
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 1)  # Thin box for speed
-            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)  # Thin text for speed
-
-    # Display the resulting frame
-    cv2.imshow('YOLOv8n Real-Time Detection', frame)
-
-    # Break the loop on 'q' key press
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-# Release the capture and close all windows
-cap.release()
-cv2.destroyAllWindows()
+from detector_backends import load_detector
+from detections import Detections, DetectionRenderer
+from tracker import DetectionScheduler, Tracker
+from video_io import open_sink, open_source
+from metrics import timed
+
+# Detector backend: "torch" (ultralytics/PyTorch), "onnx" or "onnx-int8" (onnxruntime, exported once and cached)
+BACKEND = "torch"
+
+# Run the detector every DETECT_STRIDE frames and track the boxes in between
+# (1 = detect on every frame); ADAPTIVE_STRIDE grows the stride up to
+# MAX_STRIDE while the tracked scene is stable
+DETECT_STRIDE = 1
+ADAPTIVE_STRIDE = False
+MAX_STRIDE = 10
+
+@timed("detect_and_track")
+def process_frame(frame, model, renderer, scheduler, tracker):
+    # Perform object detection with YOLOv8n on scheduled frames only
+    detections = None
+    if scheduler.should_detect(tracker):
+        boxes = model(frame)  # Adjust img size in load_detector if necessary
+        detections = Detections.from_array(boxes, model.names)
+
+    # Propagate the tracks to this frame and draw them with their ids
+    tracks = tracker.step(detections, scheduler.current_stride)
+    renderer.draw(frame, tracks)
+
+    return frame
+
+def main(source=None, sink=None):
+    # Load the YOLOv8n model (nano) for ultra-fast inference
+    model = load_detector('yolov10n.pt', imgsz=512, backend=BACKEND)  # Replace with the path to your YOLOv8n model
+
+    # Thin boxes and text for speed
+    renderer = DetectionRenderer(thickness=1)
+    scheduler = DetectionScheduler(stride=DETECT_STRIDE, adaptive=ADAPTIVE_STRIDE, max_stride=MAX_STRIDE)
+    tracker = Tracker()
+
+    # Open a connection to the camera
+    cap = open_source(source)
+    sink = open_sink(sink)
+
+    # Check if the camera opened successfully
+    if not cap.isOpened():
+        print("Error: Could not open camera.")
+        return
+
+    # Set the camera resolution (lower resolution for speed)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 512)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 512)
+
+    while True:
+        # Capture frame-by-frame
+        ret, frame = cap.read()
+        if not ret:
+            print("Error: Failed to capture image")
+            break
+
+        frame = process_frame(frame, model, renderer, scheduler, tracker)
+
+        # Display the resulting frame
+        sink.show('YOLOv8n Real-Time Detection', frame)
+
+        # Break the loop on 'q' key press
+        if sink.wait_key() == ord('q'):
+            break
+
+    # Release the capture and close all windows
+    cap.release()
+    sink.close()
+    print(f"Detector ran on {scheduler.detection_rate:.1%} of {scheduler.frames} frames")
+
+if __name__ == "__main__":
+    main()
@@ -8,45 +8,94 @@ Created on Sun Aug  4 13:39:00 2024
 
 import cv2
 import numpy as np
+from video_io import open_sink, open_source
+from metrics import timed
+import pyramid_motion
+import background_snapshot
+import blobs
+import clip_recorder
+import events
 
-# Initialize the background subtractor
-background_subtractor = cv2.createBackgroundSubtractorMOG2()
+# Background model snapshot: restored at start and checkpointed every minute in the
+# background, so a restart does not begin with an empty model (None = disabled)
+BACKGROUND_SNAPSHOT = None
 
-# Open a connection to the camera
-cap = cv2.VideoCapture(0)
+# Pyramid level for background subtraction: frames are downscaled by 2**PYRAMID_LEVEL
+# and the boxes rescaled to full resolution (0 = full resolution; 1-3 for 4K cameras)
+PYRAMID_LEVEL = 0
 
-# Check if the camera opened successfully
-if not cap.isOpened():
-    print("Error: Could not open camera.")
-    exit()
+# Motion events (start/end time, peak area, hull) are appended to this JSON-lines
+# log; query it with `python events.py query --since 02:00 --until 03:00` (None = disabled)
+EVENT_LOG = "anomaly_detection.log"
 
-while True:
-    # Capture frame-by-frame
-    ret, frame = cap.read()
-    if not ret:
-        print("Error: Failed to capture image")
-        break
+# Clip directory: the seconds before and after every detection are written from an
+# in-memory pre-roll to a clip file, and nothing else is recorded (None = disabled)
+CLIP_DIRECTORY = None
+
+@timed("background_subtraction")
+def detect_anomalies(frame, background_subtractor, level=PYRAMID_LEVEL, recorder=None, clips=None):
+    # Keep the clean frame in the clip pre-roll (before boxes are drawn on it)
+    if clips is not None:
+        clips.push(frame)
 
     # Apply background subtraction
-    fg_mask = background_subtractor.apply(frame)
+    fg_mask = background_subtractor.apply(pyramid_motion.downscale(frame, level))
+
+    # Find the blobs of the detected objects
+    regions = blobs.extract_blobs(fg_mask, pyramid_motion.scaled_area(15, level))  # Adjust the threshold for blob area
+
+    # Add the full-resolution blobs to the event log and draw them on the frame
+    regions = blobs.upscale_blobs(regions, level, frame.shape)
+    if recorder is not None:
+        recorder.update(regions)
+    if clips is not None:
+        clips.update(regions)
+    blobs.draw_blobs(frame, regions, thickness=1)
+    blobs.draw_labels(frame, regions, "Anomaly Detected")
+
+    return frame
+
+def main(source=None, sink=None):
+    # Initialize the background subtractor
+    background_subtractor = background_snapshot.restore_or_create(BACKGROUND_SNAPSHOT, cv2.createBackgroundSubtractorMOG2)
+    checkpointer = background_snapshot.BackgroundCheckpointer(background_subtractor, BACKGROUND_SNAPSHOT)
+
+    # Open a connection to the camera
+    cap = open_source(source)
+    sink = open_sink(sink)
+
+    # Check if the camera opened successfully
+    if not cap.isOpened():
+        print("Error: Could not open camera.")
+        return
+
+    recorder = events.EventRecorder(EVENT_LOG, source="untitled15", min_area=100)
+    clips = clip_recorder.ClipRecorder(CLIP_DIRECTORY, fps=cap.get(cv2.CAP_PROP_FPS), min_area=100)
+
+    while True:
+        # Capture frame-by-frame
+        ret, frame = cap.read()
+        if not ret:
+            print("Error: Failed to capture image")
+            break
 
-    # Find contours of the detected objects
-    contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Checkpoint the background model now and then (before boxes are drawn on the frame)
+        checkpointer.update(frame)
+        frame = detect_anomalies(frame, background_subtractor, recorder=recorder, clips=clips)
 
-    # Draw contours on the frame
-    for contour in contours:
-        if cv2.contourArea(contour) > 15:  # Adjust the threshold for contour area
-            x, y, w, h = cv2.boundingRect(contour)
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 1)
-            cv2.putText(frame, "Anomaly Detected", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        # Display the resulting frame
+        sink.show('Ghost Detector (Anomaly Detection)', frame)
 
-    # Display the resulting frame
-    cv2.imshow('Ghost Detector (Anomaly Detection)', frame)
+        # Break the loop on 'q' key press
+        if sink.wait_key() == ord('q'):
+            break
 
-    # Break the loop on 'q' key press
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+    # Release the capture and close all windows
+    checkpointer.close()
+    recorder.close()
+    clips.close()
+    cap.release()
+    sink.close()
 
-# Release the capture and close all windows
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
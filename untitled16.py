@@ -14,18 +14,60 @@ Advanced Ghost Detection Script with Machine Learning Integration and Real-Time
 
 import cv2
 import numpy as np
-from threading import Thread
-from queue import Queue
 from ultralytics import YOLO
+import blobs
+import clip_recorder
+import events
+import background_snapshot as snapshots
+from pipeline_runner import Pipeline, Stage, StopPipeline
+from detections import Detections, DetectionRenderer
+from motion_gate import MotionGatedDetector, motion_regions
+from video_io import open_sink, open_source
+
+renderer = DetectionRenderer()
+
+def draw_regions(frame, regions):
+    # Draw x, y, w, h motion boxes on the frame
+    blobs.draw_blobs(frame, regions, thickness=2)
+    return blobs.draw_labels(frame, regions, "Anomaly Detected")
+
+def draw_motion(frame, fg_mask, contour_area_threshold):
+    # Find the blobs of the detected objects and draw them on the frame
+    return draw_regions(frame, motion_regions(fg_mask, contour_area_threshold))
+
+def draw_detections(frame, result, names):
+    # Draw bounding boxes and labels of one YOLO result on the frame
+    return renderer.draw(frame, Detections.from_result(result, names))
 
 class AdvancedGhostDetector:
-    def __init__(self, video_source=0, contour_area_threshold=100, model_path='yolov8s.pt'):
+    def __init__(self, video_source=0, contour_area_threshold=100, model_path='yolov8s.pt', model=None,
+                 inference_server=None, motion_gated=False, roi_padding=32, sink=None, background_snapshot=None,
+                 event_log=None, clip_directory=None):
         self.video_source = video_source
         self.contour_area_threshold = contour_area_threshold
-        self.background_subtractor = cv2.createBackgroundSubtractorMOG2()
-        self.cap = cv2.VideoCapture(self.video_source)
-        self.frame_queue = Queue(maxsize=10)
-        self.model = YOLO(model_path)
+        # Optional snapshot file: the background model is restored from it and
+        # checkpointed to it every minute, so restarts do not start from an empty model
+        self.background_subtractor = snapshots.restore_or_create(background_snapshot,
+                                                                 cv2.createBackgroundSubtractorMOG2)
+        self.checkpointer = snapshots.BackgroundCheckpointer(self.background_subtractor, background_snapshot)
+        # Optional JSON-lines event log: motion regions are merged into events with
+        # start/end times, peak area, hull and the classes detected in them
+        self.recorder = events.EventRecorder(event_log, source="untitled16")
+        self.cap = open_source(self.video_source)
+        # Optional clip directory: a pre-roll of encoded frames is kept in memory and
+        # written with the post-roll to a clip whenever motion is found
+        self.clips = clip_recorder.ClipRecorder(clip_directory, fps=self.cap.get(cv2.CAP_PROP_FPS))
+        # Display sink: GUI window, headless null sink, video file, MJPEG, ...
+        self.sink = open_sink(sink)
+        # An already loaded model can be passed in to share it between detectors
+        self.model = model if model is not None else YOLO(model_path)
+        # Optional BatchingInferenceServer shared by several detectors
+        self.inference_server = inference_server
+        # Motion-gated mode: skip YOLO on static frames and only detect inside
+        # padded crops around the foreground contours
+        self.motion_gated = motion_gated
+        self.gate = MotionGatedDetector(self.model, imgsz=320, padding=roi_padding,
+                                        infer=self._infer_crops if inference_server is not None else None)
 
         if not self.cap.isOpened():
             raise IOError("Error: Could not open camera.")
@@ -36,70 +78,97 @@ class AdvancedGhostDetector:
             if not ret:
                 print("Error: Failed to capture image")
                 break
-            if not self.frame_queue.full():
-                self.frame_queue.put(frame)
+            yield frame
 
     def process_frame(self, frame):
         # Apply background subtraction
+        self.checkpointer.update(frame)
+        self.clips.push(frame)
         fg_mask = self.background_subtractor.apply(frame)
+        regions = motion_regions(fg_mask, self.contour_area_threshold)
+        self.recorder.update(regions)
+        self.clips.update(regions)
 
-        # Find contours of the detected objects
-        contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return draw_regions(frame, regions)
 
-        # Draw contours on the frame
-        for contour in contours:
-            if cv2.contourArea(contour) > self.contour_area_threshold:
-                x, y, w, h = cv2.boundingRect(contour)
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                cv2.putText(frame, "Anomaly Detected", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    def find_motion(self, frame):
+        # Background subtraction only; the frame stays clean for the detector
+        self.checkpointer.update(frame)
+        self.clips.push(frame)
+        fg_mask = self.background_subtractor.apply(frame)
+        regions = motion_regions(fg_mask, self.contour_area_threshold)
+        self.clips.update(regions)
+        return frame, regions
+
+    def _infer_crops(self, crops):
+        futures = [self.inference_server.submit(crop) for crop in crops]
+        return [future.result() for future in futures]
+
+    def detect_regions(self, item):
+        # Run YOLO only on the motion regions (nothing at all on static frames)
+        frame, regions = item
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        detections = self.gate.detect(rgb_frame, regions)
+        self.recorder.update(regions, labels={detections.names.get(class_id, str(class_id))
+                                              for class_id in detections.class_ids.tolist()})
+        draw_regions(frame, regions)
+        renderer.draw(frame, detections)
 
         return frame
 
     def detect_objects(self, frame):
         # Convert frame to RGB for YOLOv8
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.model(rgb_frame, imgsz=320)
+        if self.inference_server is not None:
+            results = [self.inference_server.submit(rgb_frame).result()]
+        else:
+            results = self.model(rgb_frame, imgsz=320)
 
         # Draw bounding boxes and labels on the frame
         for result in results:
-            boxes = result.boxes.data.cpu().numpy()
-            for box in boxes:
-                x1, y1, x2, y2, score, class_id = map(int, box)
-                label = f"{self.model.names[class_id]}: {score:.2f}"
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            draw_detections(frame, result, self.model.names)
 
         return frame
 
     def display_frame(self, frame):
         # Display the resulting frame
-        cv2.imshow('Advanced Ghost Detector', frame)
+        self.sink.show('Advanced Ghost Detector', frame)
 
-    def run(self):
-        capture_thread = Thread(target=self.capture_frames, daemon=True)
-        capture_thread.start()
+        # Stop the pipeline on 'q' key press
+        if self.sink.wait_key() == ord('q'):
+            raise StopPipeline
 
-        while True:
-            if not self.frame_queue.empty():
-                frame = self.frame_queue.get()
-                processed_frame = self.process_frame(frame)
-                detected_frame = self.detect_objects(processed_frame)
-                self.display_frame(detected_frame)
-
-                # Break the loop on 'q' key press
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
+    def run(self):
+        # Capture, background subtraction and detection each run on their own
+        # thread with bounded, blocking queues; the display stays on the main thread
+        if self.motion_gated:
+            stages = [Stage("background", self.find_motion, queue_size=10),
+                      Stage("detect", self.detect_regions)]
+        else:
+            stages = [Stage("background", self.process_frame, queue_size=10),
+                      Stage("detect", self.detect_objects)]
+        pipeline = Pipeline([
+            Stage("capture", self.capture_frames),
+            *stages,
+            Stage("display", self.display_frame, mode="main"),
+        ])
+        pipeline.run()
 
         self.cleanup()
 
     def cleanup(self):
         # Release the capture and close all windows
+        self.checkpointer.close()
+        self.recorder.close()
+        self.clips.close()
         self.cap.release()
-        cv2.destroyAllWindows()
+        self.sink.close()
+        if self.motion_gated:
+            print(self.gate.stats.summary())
 
 if __name__ == "__main__":
     try:
-        detector = AdvancedGhostDetector(video_source=0, contour_area_threshold=1000, model_path='yolov8n.pt')
+        detector = AdvancedGhostDetector(video_source=None, contour_area_threshold=1000, model_path='yolov8n.pt')
         detector.run()
     except Exception as e:
         print(f"An error occurred: {e}")
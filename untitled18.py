@@ -8,40 +8,46 @@ Created on Sun Aug  4 14:49:57 2024
 
 import cv2
 import mediapipe as mp
+from video_io import open_sink, open_source
 
-# Initialize MediaPipe Pose module
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose()
+def main(source=None, sink=None):
+    # Initialize MediaPipe Pose module
+    mp_pose = mp.solutions.pose
+    pose = mp_pose.Pose()
 
-# Initialize MediaPipe Drawing module
-mp_drawing = mp.solutions.drawing_utils
+    # Initialize MediaPipe Drawing module
+    mp_drawing = mp.solutions.drawing_utils
 
-# Initialize webcam
-cap = cv2.VideoCapture(0)
+    # Initialize webcam
+    cap = open_source(source)
+    sink = open_sink(sink)
 
-while True:
-    # Read frame from webcam
-    ret, frame = cap.read()
-    if not ret:
-        break
+    while True:
+        # Read frame from webcam
+        ret, frame = cap.read()
+        if not ret:
+            break
 
-    # Convert the frame to RGB
-    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # Convert the frame to RGB
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
-    # Process the frame and get pose landmarks
-    results = pose.process(frame_rgb)
+        # Process the frame and get pose landmarks
+        results = pose.process(frame_rgb)
 
-    # Draw pose landmarks on the frame
-    if results.pose_landmarks:
-        mp_drawing.draw_landmarks(frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
+        # Draw pose landmarks on the frame
+        if results.pose_landmarks:
+            mp_drawing.draw_landmarks(frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
 
-    # Display the resulting frame
-    cv2.imshow("Pose Detection", frame)
+        # Display the resulting frame
+        sink.show("Pose Detection", frame)
 
-    # Exit on 'q' key press
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+        # Exit on 'q' key press
+        if sink.wait_key() == ord('q'):
+            break
 
-# Release resources
-cap.release()
-cv2.destroyAllWindows()
+    # Release resources
+    cap.release()
+    sink.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,103 @@
 import cv2
-import numpy as np
-from skimage import exposure, filters
-from scipy.ndimage import gaussian_filter
-
-def adjust_brightness_contrast(image, beta=50, alpha=1.5):
+from frame_buffers import FrameArena, arena_buffer
+from lut_enhance import FusedLowLightEnhancer
+from adaptive_enhance import AdaptiveEnhancer
+from video_io import open_sink, open_source
+from metrics import timed
+import strip_parallel
+import cv_cache
+import tone_mapping
+
+# با ADAPTIVE هر فریم بر اساس روشنایی صحنه فقط مراحل لازم را اجرا می‌کند
+# (از عبور مستقیم در روز تا زنجیره‌ی کامل در تاریکی)
+ADAPTIVE = False
+
+def adjust_brightness_contrast(image, beta=50, alpha=1.5, arena=None):
     """افزایش روشنایی و کنتراست تصویر"""
-    return cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
+    return cv2.convertScaleAbs(image, arena_buffer(arena, 'adjust_brightness_contrast', image), alpha=alpha, beta=beta)
 
-def gamma_correction(image, gamma=2.0):
+def gamma_correction(image, gamma=2.0, arena=None):
     """تصحیح گاما برای تنظیم روشنایی و کنتراست کلی"""
-    yuv_image = cv2.cvtColor(image, cv2.COLOR_BGR2YUV)
-    yuv_image[..., 0] = np.clip(np.power(yuv_image[..., 0] / 255.0, gamma) * 255.0, 0, 255).astype(np.uint8)
-    return cv2.cvtColor(yuv_image, cv2.COLOR_YUV2BGR)
+    return tone_mapping.apply_to_channel(image, tone_mapping.gamma_lut(gamma), "yuv",
+                                         dst=arena_buffer(arena, 'gamma_correction.bgr', image), arena=arena)
 
-def apply_clahe(image):
+@timed("clahe")
+def apply_clahe(image, arena=None):
     """اعمال CLAHE برای بهبود کنتراست محلی"""
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-    clahe_image = clahe.apply(gray_image)
-    return cv2.cvtColor(clahe_image, cv2.COLOR_GRAY2BGR)
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=arena_buffer(arena, 'apply_clahe.gray', image, channels=1))
+    clahe_image = strip_parallel.clahe(gray_image, 3.0, (8, 8), arena_buffer(arena, 'apply_clahe.clahe', gray_image))
+    return cv2.cvtColor(clahe_image, cv2.COLOR_GRAY2BGR, dst=arena_buffer(arena, 'apply_clahe.bgr', image))
 
-def convert_to_hsv(image):
+def convert_to_hsv(image, arena=None):
     """تبدیل تصویر به فضای رنگی HSV و افزایش روشنایی"""
-    hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    hsv_image[..., 2] = cv2.convertScaleAbs(hsv_image[..., 2], alpha=1.5, beta=30)
-    return cv2.cvtColor(hsv_image, cv2.COLOR_HSV2BGR)
+    hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=arena_buffer(arena, 'convert_to_hsv.hsv', image))
+    v_channel = cv2.extractChannel(hsv_image, 2, arena_buffer(arena, 'convert_to_hsv.v', image, channels=1))
+    cv2.convertScaleAbs(v_channel, v_channel, alpha=1.5, beta=30)
+    cv2.insertChannel(v_channel, hsv_image, 2)
+    return cv2.cvtColor(hsv_image, cv2.COLOR_HSV2BGR, dst=arena_buffer(arena, 'convert_to_hsv.bgr', image))
 
-def enhance_details(image):
+def enhance_details(image, arena=None):
     """افزایش جزئیات با استفاده از فیلتر شارپنینگ"""
-    kernel = np.array([[0, -1, 0],
-                       [-1, 5, -1],
-                       [0, -1, 0]])
-    sharpened_image = cv2.filter2D(image, -1, kernel)
+    kernel = cv_cache.sharpen_kernel()
+    sharpened_image = strip_parallel.filter2D(image, -1, kernel, dst=arena_buffer(arena, 'enhance_details', image))
     return sharpened_image
 
-def noise_reduction(image):
+@timed("fastNlMeansDenoising")
+def noise_reduction(image, arena=None):
     """کاهش نویز با استفاده از فیلتر وینزر"""
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    denoised_image = cv2.fastNlMeansDenoising(gray_image, None, h=10, templateWindowSize=7, searchWindowSize=21)
-    return cv2.cvtColor(denoised_image, cv2.COLOR_GRAY2BGR)
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=arena_buffer(arena, 'noise_reduction.gray', image, channels=1))
+    denoised_image = cv2.fastNlMeansDenoising(gray_image, arena_buffer(arena, 'noise_reduction.denoised', gray_image),
+                                              h=10, templateWindowSize=7, searchWindowSize=21)
+    return cv2.cvtColor(denoised_image, cv2.COLOR_GRAY2BGR, dst=arena_buffer(arena, 'noise_reduction.bgr', image))
 
-def enhance_contrast(image):
+def enhance_contrast(image, arena=None):
     """افزایش کنتراست با استفاده از تکنیک‌های پیشرفته"""
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    equalized_image = exposure.equalize_hist(gray_image)
-    return cv2.cvtColor((exposure.rescale_intensity(equalized_image, out_range=(0, 255))).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=arena_buffer(arena, 'enhance_contrast.gray', image, channels=1))
+    # معادل دقیق exposure.rescale_intensity(exposure.equalize_hist(...)) به صورت جدول LUT و بدون آرایه‌های float64
+    tone_mapping.apply(gray_image, tone_mapping.equalize_rescale_lut(gray_image), dst=gray_image)
+    return cv2.cvtColor(gray_image, cv2.COLOR_GRAY2BGR, dst=arena_buffer(arena, 'enhance_contrast.bgr', image))
 
-def improve_low_light(image):
+@timed("improve_low_light")
+def improve_low_light(image, arena=None):
     """بهبود تصویر در شرایط نور کم"""
     # مرحله 1: افزایش روشنایی اولیه
-    bright_image = adjust_brightness_contrast(image, beta=50, alpha=1.5)
+    bright_image = adjust_brightness_contrast(image, beta=50, alpha=1.5, arena=arena)
     
     # مرحله 2: تصحیح گاما
-    gamma_corrected_image = gamma_correction(bright_image, gamma=2.0)
+    gamma_corrected_image = gamma_correction(bright_image, gamma=2.0, arena=arena)
     
     # مرحله 3: افزایش کنتراست با CLAHE
-    clahe_image = apply_clahe(gamma_corrected_image)
+    clahe_image = apply_clahe(gamma_corrected_image, arena)
     
     # مرحله 4: تبدیل به فضای رنگی HSV و افزایش روشنایی
-    hsv_image = convert_to_hsv(clahe_image)
+    hsv_image = convert_to_hsv(clahe_image, arena)
     
     # مرحله 5: افزایش جزئیات با فیلتر شارپنینگ
-    detailed_image = enhance_details(hsv_image)
+    detailed_image = enhance_details(hsv_image, arena)
     
     # مرحله 6: کاهش نویز (اگر نیاز باشد)
-    # denoised_image = noise_reduction(detailed_image)
+    # denoised_image = noise_reduction(detailed_image, arena)
     
     # مرحله 7: افزایش کنتراست نهایی
-    final_image = enhance_contrast(detailed_image)
+    final_image = enhance_contrast(detailed_image, arena)
     
     return final_image
 
-def main():
+def main(source=None, sink=None):
     """اتصال به دوربین و نمایش تصویر بهبود یافته"""
-    cap = cv2.VideoCapture(0)
+    cap = open_source(source)
+    sink = open_sink(sink)
 
     if not cap.isOpened():
         print("خطا: دوربین باز نشد!")
         return
 
+    # نسخه‌ی کامپایل‌شده و معادل improve_low_light با جدول‌های LUT
+    enhancer = FusedLowLightEnhancer("hsv_last")
+    if ADAPTIVE:
+        enhancer = AdaptiveEnhancer(enhancer)
+    arena = FrameArena()
+
     while True:
         # خواندن فریم از دوربین
         ret, frame = cap.read()
@@ -88,19 +107,23 @@ def main():
             break
 
         # بهبود تصویر در شرایط نور کم
-        improved_frame = improve_low_light(frame)
+        improved_frame = enhancer(frame, arena)
+        arena.next_frame()
 
         # نمایش تصویر اصلی و تصویر بهبود یافته
-        cv2.imshow('Original Frame', frame)
-        cv2.imshow('Improved Frame', improved_frame)
+        sink.show('Original Frame', frame)
+        sink.show('Improved Frame', improved_frame)
 
         # خروج از برنامه با فشار دادن کلید 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if sink.wait_key() == ord('q'):
             break
 
     # آزادسازی منابع و بستن پنجره‌ها
+    print(arena.summary())
+    if ADAPTIVE:
+        print(enhancer.stats.summary())
     cap.release()
-    cv2.destroyAllWindows()
+    sink.close()
 
 if __name__ == "__main__":
     main()
@@ -1,53 +1,101 @@
 import cv2
 import numpy as np
+from frame_buffers import FrameArena, arena_buffer
+from video_io import open_sink, open_source
+from metrics import timed
+from frame_diff import FrameDifferencer
+import pyramid_motion
+import blobs
+import clip_recorder
+import events
 
-def detect_anomalies(frame1, frame2):
-    # Convert images to grayscale
-    gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-    gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
-    
-    # Compute the absolute difference between the two images
-    diff = cv2.absdiff(gray1, gray2)
-    
-    # Threshold the difference to get binary image
-    _, thresh = cv2.threshold(diff, 50, 255, cv2.THRESH_BINARY)
-    
-    # Find contours of the anomalies
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Draw contours on the original frame
-    for contour in contours:
-        if cv2.contourArea(contour) > 500:  # Filter small contours
-            x, y, w, h = cv2.boundingRect(contour)
-            cv2.rectangle(frame1, (x, y), (x+w, y+h), (0, 255, 0), 2)
-    
-    return frame1
+# Differencing mode: "two_frame", "three_frame" or "running_average" (see frame_diff.py)
+DIFFERENCE_MODE = "two_frame"
 
-# Initialize video capture (0 is usually the default camera)
-cap = cv2.VideoCapture(0)
+# Motion events (start/end time, peak area, hull) are appended to this JSON-lines
+# log; query it with `python events.py query --since 02:00 --until 03:00` (None = disabled)
+EVENT_LOG = "anomaly_detection.log"
 
-# Read the first frame to initialize the previous frame
-ret, prev_frame = cap.read()
+# Clip directory: the seconds before and after every detection are written from an
+# in-memory pre-roll to a clip file, and nothing else is recorded (None = disabled)
+CLIP_DIRECTORY = None
 
-while True:
-    # Read the current frame
-    ret, curr_frame = cap.read()
-    if not ret:
-        break
-    
-    # Detect anomalies between previous and current frame
-    result_frame = detect_anomalies(prev_frame, curr_frame)
+def make_differencer(mode=DIFFERENCE_MODE):
+    """Frame differencer with this script's threshold."""
+    return FrameDifferencer(mode, threshold=50)
+
+@timed("detect_anomalies")
+def detect_anomalies(frame, differencer, recorder=None, clips=None, arena=None):
+    # Keep the clean frame in the clip pre-roll (the boxes only go to the output)
+    if clips is not None:
+        clips.push(frame)
+
+    # Copy the frame into a separate output buffer, so the boxes never end up in
+    # the frames the next differences are taken against
+    output = arena_buffer(arena, 'detect_anomalies.output', frame)
+    if output is None:
+        output = frame.copy()
+    else:
+        np.copyto(output, frame)
+
+    # Gray, blur and difference against the previous frames (each frame is converted once)
+    mask = differencer.push(frame)
+    if mask is None:
+        return output
     
-    # Display the result
-    cv2.imshow('Anomalies Detected', result_frame)
+    # Find the blobs of the anomalies (filtering small ones)
+    regions = blobs.extract_blobs(mask, pyramid_motion.scaled_area(500, differencer.level), arena=arena)
     
-    # Update previous frame
-    prev_frame = curr_frame
+    # Full-resolution blobs for the event log and the drawing
+    regions = blobs.upscale_blobs(regions, differencer.level, frame.shape)
+    if recorder is not None:
+        recorder.update(regions)
+    if clips is not None:
+        clips.update(regions)
+
+    # Draw the blob boxes on the output frame
+    blobs.draw_blobs(output, regions, thickness=2)
     
-    # Exit on 'q' key press
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+    return output
+
+def main(source=None, sink=None):
+    # Initialize video capture (0 is usually the default camera)
+    cap = open_source(source)
+    sink = open_sink(sink)
+    arena = FrameArena()
+
+    differencer = make_differencer()
+    recorder = events.EventRecorder(EVENT_LOG, source="untitled21", min_area=500)
+    clips = clip_recorder.ClipRecorder(CLIP_DIRECTORY, fps=cap.get(cv2.CAP_PROP_FPS))
+
+    # Read the first frame to initialize the previous frame
+    ret, prev_frame = cap.read()
+    if ret:
+        differencer.push(prev_frame)
+
+    while True:
+        # Read the current frame
+        ret, curr_frame = cap.read()
+        if not ret:
+            break
+
+        # Detect anomalies between previous and current frame
+        result_frame = detect_anomalies(curr_frame, differencer, recorder=recorder, clips=clips, arena=arena)
+        arena.next_frame()
+
+        # Display the result
+        sink.show('Anomalies Detected', result_frame)
+
+        # Exit on 'q' key press
+        if sink.wait_key() == ord('q'):
+            break
+
+    # Release video capture and close windows
+    recorder.close()
+    clips.close()
+    print(arena.summary())
+    cap.release()
+    sink.close()
 
-# Release video capture and close windows
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,78 @@
 import cv2
-import numpy as np
 from skimage import exposure, filters
-
-def adjust_brightness_contrast_gray(image, alpha=2.0, beta=50):
+from frame_buffers import FrameArena, arena_buffer
+from video_io import open_sink, open_source
+from metrics import timed
+import strip_parallel
+import cv_cache
+import tone_mapping
+from temporal_denoise import make_denoiser
+
+# روش کاهش نویز: "spatial" (fastNlMeansDenoising روی هر فریم)، یا حالت‌های زمانی
+# "recursive"، "compensated" و "nlm_multi" که از فریم‌های قبلی استفاده می‌کنند
+DENOISE_MODE = "spatial"
+
+def adjust_brightness_contrast_gray(image, alpha=2.0, beta=50, arena=None):
     """افزایش روشنایی و کنتراست تصویر خاکستری"""
-    return cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
+    return cv2.convertScaleAbs(image, arena_buffer(arena, 'adjust_brightness_contrast_gray', image), alpha=alpha, beta=beta)
 
-def gamma_correction_gray(image, gamma=2.0):
+def gamma_correction_gray(image, gamma=2.0, arena=None):
     """تصحیح گاما برای تنظیم روشنایی و کنتراست کلی در تصاویر خاکستری"""
-    image = image / 255.0
-    image = np.power(image, gamma)
-    return (image * 255).astype(np.uint8)
+    return tone_mapping.apply(image, tone_mapping.gamma_lut(gamma), dst=arena_buffer(arena, 'gamma_correction_gray', image))
 
-def apply_clahe_gray(image):
+@timed("clahe")
+def apply_clahe_gray(image, arena=None):
     """اعمال CLAHE برای بهبود کنتراست محلی در تصاویر خاکستری"""
-    clahe = cv2.createCLAHE(clipLimit=8.0, tileGridSize=(1, 1))
-    clahe_image = clahe.apply(image)
+    clahe = cv_cache.clahe(8.0, (1, 1))
+    clahe_image = clahe.apply(image, arena_buffer(arena, 'apply_clahe_gray', image))
     return clahe_image
 
-def enhance_details_gray(image):
+def enhance_details_gray(image, arena=None):
     """افزایش جزئیات با استفاده از فیلتر شارپنینگ در تصاویر خاکستری"""
-    kernel = np.array([[0, -1, 0],
-                       [-1, 5, -1],
-                       [0, -1, 0]])
-    sharpened_image = cv2.filter2D(image, -1, kernel)
+    kernel = cv_cache.sharpen_kernel()
+    sharpened_image = strip_parallel.filter2D(image, -1, kernel, dst=arena_buffer(arena, 'enhance_details_gray', image))
     return sharpened_image
 
-def reduce_noise_gray(image):
+@timed("fastNlMeansDenoising")
+def reduce_noise_gray(image, arena=None):
     """کاهش نویز با استفاده از فیلتر نهایی"""
-    return cv2.fastNlMeansDenoising(image, None, h=10, templateWindowSize=7, searchWindowSize=21)
+    return cv2.fastNlMeansDenoising(image, arena_buffer(arena, 'reduce_noise_gray', image), h=10, templateWindowSize=7, searchWindowSize=21)
 
-def improve_low_light_gray(image):
-    """بهبود تصویر خاکستری در شرایط نور کم"""
+@timed("improve_low_light_gray")
+def improve_low_light_gray(image, arena=None, denoiser=None):
+    """بهبود تصویر خاکستری در شرایط نور کم (denoiser: یک TemporalDenoiser، یا None برای fastNlMeansDenoising)"""
     # مرحله 1: افزایش روشنایی و کنتراست اولیه
-    bright_image = adjust_brightness_contrast_gray(image, alpha=5.0, beta=10)
+    bright_image = adjust_brightness_contrast_gray(image, alpha=5.0, beta=10, arena=arena)
     
     # مرحله 2: تصحیح گاما
-    gamma_corrected_image = gamma_correction_gray(bright_image, gamma=1.0)
+    gamma_corrected_image = gamma_correction_gray(bright_image, gamma=1.0, arena=arena)
     
     # مرحله 3: افزایش کنتراست با CLAHE
-    clahe_image = apply_clahe_gray(gamma_corrected_image)
+    clahe_image = apply_clahe_gray(gamma_corrected_image, arena)
     
     # مرحله 4: افزایش جزئیات با فیلتر شارپنینگ
-    detailed_image = enhance_details_gray(clahe_image)
+    detailed_image = enhance_details_gray(clahe_image, arena)
     
     # مرحله 5: کاهش نویز
-    denoised_image = reduce_noise_gray(detailed_image)
+    if denoiser is None:
+        denoised_image = reduce_noise_gray(detailed_image, arena)
+    else:
+        denoised_image = denoiser(detailed_image, arena)
     
     return denoised_image
 
-def main():
+def main(source=None, sink=None):
     """اتصال به دوربین و نمایش تصویر بهبود یافته"""
-    cap = cv2.VideoCapture(0)
+    cap = open_source(source)
+    sink = open_sink(sink)
 
     if not cap.isOpened():
         print("خطا: دوربین باز نشد!")
         return
 
+    arena = FrameArena()
+    denoiser = make_denoiser(DENOISE_MODE)
+
     while True:
         # خواندن فریم از دوربین
         ret, frame = cap.read()
@@ -66,22 +82,24 @@ def main():
             break
 
         # تبدیل فریم به خاکستری
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=arena_buffer(arena, 'main.gray', frame, channels=1))
 
         # بهبود تصویر خاکستری در شرایط نور کم
-        improved_frame = improve_low_light_gray(gray_frame)
+        improved_frame = improve_low_light_gray(gray_frame, arena, denoiser)
+        arena.next_frame()
 
         # نمایش تصویر اصلی و تصویر بهبود یافته
-        cv2.imshow('Original Frame', gray_frame)
-        cv2.imshow('Improved Frame', improved_frame)
+        sink.show('Original Frame', gray_frame)
+        sink.show('Improved Frame', improved_frame)
 
         # خروج از برنامه با فشار دادن کلید 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if sink.wait_key() == ord('q'):
             break
 
     # آزادسازی منابع و بستن پنجره‌ها
+    print(arena.summary())
     cap.release()
-    cv2.destroyAllWindows()
+    sink.close()
 
 if __name__ == "__main__":
     main()
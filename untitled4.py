@@ -7,48 +7,54 @@ Created on Sat Aug  3 19:32:54 2024
 """
 
 import cv2
-import numpy as np
 from skimage import exposure
+from frame_buffers import FrameArena, arena_buffer
+from video_io import open_sink, open_source
+from metrics import timed
+import strip_parallel
+import tone_mapping
 
-def adjust_brightness_contrast(image, alpha=2.0, beta=50):
+def adjust_brightness_contrast(image, alpha=2.0, beta=50, arena=None):
     """افزایش روشنایی و کنتراست تصویر"""
-    return cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
+    return cv2.convertScaleAbs(image, arena_buffer(arena, 'adjust_brightness_contrast', image), alpha=alpha, beta=beta)
 
-def gamma_correction(image, gamma=2.0):
+def gamma_correction(image, gamma=2.0, arena=None):
     """تصحیح گاما برای تنظیم روشنایی و کنتراست کلی"""
-    image = image / 255.0
-    image = np.power(image, gamma)
-    return (image * 255).astype(np.uint8)
+    return tone_mapping.apply(image, tone_mapping.gamma_lut(gamma), dst=arena_buffer(arena, 'gamma_correction', image))
 
-def apply_clahe(image):
+@timed("clahe")
+def apply_clahe(image, arena=None):
     """اعمال CLAHE برای بهبود کنتراست محلی"""
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    return clahe.apply(image)
+    return strip_parallel.clahe(image, 2.0, (8, 8), arena_buffer(arena, 'apply_clahe', image))
 
-def enhance_low_light(image):
+@timed("enhance_low_light")
+def enhance_low_light(image, arena=None):
     """بهبود تصویر در شرایط کم‌نور"""
     # مرحله 1: تبدیل به خاکستری
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=arena_buffer(arena, 'enhance_low_light.gray', image, channels=1))
     
     # مرحله 2: افزایش روشنایی و کنتراست
-    bright_contrast_image = adjust_brightness_contrast(gray_image, alpha=1.5, beta=70)
+    bright_contrast_image = adjust_brightness_contrast(gray_image, alpha=1.5, beta=70, arena=arena)
     
     # مرحله 3: تصحیح گاما
-    gamma_corrected_image = gamma_correction(bright_contrast_image, gamma=5)
+    gamma_corrected_image = gamma_correction(bright_contrast_image, gamma=5, arena=arena)
     
     # مرحله 4: افزایش کنتراست محلی با CLAHE
-    clahe_image = apply_clahe(gamma_corrected_image)
+    clahe_image = apply_clahe(gamma_corrected_image, arena)
     
     return clahe_image
 
-def main():
+def main(source=None, sink=None):
     """اتصال به دوربین و نمایش تصویر بهبود یافته"""
-    cap = cv2.VideoCapture(0)
+    cap = open_source(source)
+    sink = open_sink(sink)
 
     if not cap.isOpened():
         print("خطا: دوربین باز نشد!")
         return
 
+    arena = FrameArena()
+
     while True:
         # خواندن فریم از دوربین
         ret, frame = cap.read()
@@ -58,19 +64,21 @@ def main():
             break
 
         # بهبود تصویر در شرایط کم‌نور
-        improved_frame = enhance_low_light(frame)
+        improved_frame = enhance_low_light(frame, arena)
 
         # نمایش تصویر اصلی و تصویر بهبود یافته
-        cv2.imshow('Original Frame', cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
-        cv2.imshow('Improved Frame', improved_frame)
+        sink.show('Original Frame', arena.like('enhance_low_light.gray', frame, channels=1))
+        sink.show('Improved Frame', improved_frame)
+        arena.next_frame()
 
         # خروج از برنامه با فشار دادن کلید 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if sink.wait_key() == ord('q'):
             break
 
     # آزادسازی منابع و بستن پنجره‌ها
+    print(arena.summary())
     cap.release()
-    cv2.destroyAllWindows()
+    sink.close()
 
 if __name__ == "__main__":
     main()
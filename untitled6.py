@@ -1,17 +1,68 @@
 import cv2
-import numpy as np
+from video_io import open_sink, open_source
+from metrics import timed
+import strip_parallel
+import cv_cache
+import pyramid_motion
+import background_snapshot
+import blobs
+import clip_recorder
 
-def main():
+# فایل snapshot مدل پس‌زمینه: در شروع از آن بازیابی و هر دقیقه در پس‌زمینه ذخیره می‌شود
+# تا راه‌اندازی مجدد با مدل خالی شروع نشود (None = غیرفعال)
+BACKGROUND_SNAPSHOT = None
+
+# سطح هرم برای تفریق پس‌زمینه: فریم با ضریب 2**PYRAMID_LEVEL کوچک می‌شود و کادرها
+# به وضوح کامل برگردانده می‌شوند (0 = وضوح کامل؛ برای دوربین‌های 4K مقدار 1 تا 3)
+PYRAMID_LEVEL = 0
+
+# پوشه کلیپ‌ها: چند ثانیه قبل و بعد از هر تشخیص حرکت از حافظه در یک فایل ذخیره می‌شود
+# و بقیه ویدیو ذخیره نمی‌شود (None = غیرفعال)
+CLIP_DIRECTORY = None
+
+@timed("background_subtraction")
+def subtract_background(frame, backSub, level=PYRAMID_LEVEL, clips=None):
+    # نگه داشتن فریم تمیز در پیش‌نمایش کلیپ (قبل از کشیدن کادرها)
+    if clips is not None:
+        clips.push(frame)
+
+    # پردازش تصویر با مدل پس‌زمینه
+    fgMask = backSub.apply(pyramid_motion.downscale(frame, level))
+
+    # استفاده از فیلتر مورفولوژیکی برای بهبود نتایج
+    kernel = cv_cache.ones_kernel(pyramid_motion.scaled_ksize((5, 5), level))
+    fgMask = strip_parallel.morphologyEx(fgMask, cv2.MORPH_CLOSE, kernel)
+    fgMask = strip_parallel.morphologyEx(fgMask, cv2.MORPH_OPEN, kernel)
+
+    # پیدا کردن لکه‌های تصویر باینری (حذف کوچکترین لکه‌ها با فیلتر مساحت)
+    regions = blobs.extract_blobs(fgMask, pyramid_motion.scaled_area(500, level))
+
+    # شروع کلیپ وقتی لکه‌ای پیدا شده باشد
+    regions = blobs.upscale_blobs(regions, level, frame.shape)
+    if clips is not None:
+        clips.update(regions)
+
+    # کشیدن مربع دور همه لکه‌ها با یک فراخوانی
+    blobs.draw_blobs(frame, regions, thickness=2)
+
+    return frame, fgMask
+
+def main(source=None, sink=None):
     # ایجاد شیء VideoCapture برای دسترسی به دوربین
-    cap = cv2.VideoCapture(0)
+    cap = open_source(source)
+    sink = open_sink(sink)
 
     # ایجاد مدل پس‌زمینه با استفاده از MOG2
-    backSub = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=True)
+    backSub = background_snapshot.restore_or_create(
+        BACKGROUND_SNAPSHOT, lambda: cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=True))
+    checkpointer = background_snapshot.BackgroundCheckpointer(backSub, BACKGROUND_SNAPSHOT)
 
     if not cap.isOpened():
         print("خطا در باز کردن دوربین")
         return
 
+    clips = clip_recorder.ClipRecorder(CLIP_DIRECTORY, fps=cap.get(cv2.CAP_PROP_FPS))
+
     while True:
         # خواندن فریم از دوربین
         ret, frame = cap.read()
@@ -20,34 +71,23 @@ def main():
             print("خطا در خواندن فریم")
             break
 
-        # پردازش تصویر با مدل پس‌زمینه
-        fgMask = backSub.apply(frame)
-
-        # استفاده از فیلتر مورفولوژیکی برای بهبود نتایج
-        kernel = np.ones((5, 5), np.uint8)
-        fgMask = cv2.morphologyEx(fgMask, cv2.MORPH_CLOSE, kernel)
-        fgMask = cv2.morphologyEx(fgMask, cv2.MORPH_OPEN, kernel)
-
-        # پیدا کردن کانتورهای موجود در تصویر باینری
-        contours, _ = cv2.findContours(fgMask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        # کشیدن مربع دور هر کانتور
-        for contour in contours:
-            if cv2.contourArea(contour) > 500:  # برای فیلتر کردن کوچکترین کانتورها
-                x, y, w, h = cv2.boundingRect(contour)
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        # ذخیره دوره‌ای مدل پس‌زمینه (قبل از کشیدن کادرها روی فریم)
+        checkpointer.update(frame)
+        frame, fgMask = subtract_background(frame, backSub, clips=clips)
 
         # نمایش فریم اصلی و ماسک پس‌زمینه
-        cv2.imshow('Frame', frame)
-        cv2.imshow('Foreground Mask', fgMask)
+        sink.show('Frame', frame)
+        sink.show('Foreground Mask', fgMask)
 
         # خروج از حلقه با فشار دادن کلید 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if sink.wait_key() == ord('q'):
             break
 
     # آزادسازی منابع
+    checkpointer.close()
+    clips.close()
     cap.release()
-    cv2.destroyAllWindows()
+    sink.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Frame sources and display sinks shared by all scripts.
+
+Sources (cv2.VideoCapture compatible: read/isOpened/set/get/release):
+- "0", "1", ...            camera device index
+- "video.mp4", "rtsp://..."  file or stream URL
+- "synthetic[:WxH[:N]]"    generated frames with moving objects (N frames, default endless)
+
+Sinks (replace cv2.imshow + cv2.waitKey):
+- "gui"                    OpenCV windows, 'q' quits (the previous behaviour)
+- "null"                   discard frames; run headless at full speed
+- "video:out.mp4"          one video file per window
+- "mjpeg[:host]:port"      MJPEG over HTTP, one stream per window (http://host:port/)
+- "jsonl:events.jsonl"     one JSON line per shown frame plus explicit events
+
+Several sinks can be combined with commas, e.g. "null,jsonl:run.jsonl".
+When no spec is given, the VIDEO_SOURCE and VIDEO_SINK environment variables
+are used (defaults "0" and "gui"), so every script can be run headless with:
+
+    VIDEO_SOURCE=synthetic:640x480:500 VIDEO_SINK=null python untitled6.py
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+import metrics
+
+DEFAULT_SOURCE = "0"
+DEFAULT_SINK = "gui"
+
+
+class SyntheticSource:
+    """
+    Deterministic generated video: a dim noisy gradient with bright boxes moving across it.
+
+    Parameters:
+    - width, height: Frame size.
+    - frames: Number of frames before read() fails (None = endless).
+    - objects: Number of moving boxes.
+    - noise: Standard deviation of the sensor-like noise.
+    - seed: Random seed.
+    - fps: Reported through get(cv2.CAP_PROP_FPS).
+    """
+
+    def __init__(self, width=640, height=480, frames=None, objects=3, noise=6.0, seed=0, fps=30.0):
+        self.frames = frames
+        self.objects = objects
+        self.noise = noise
+        self.seed = seed
+        self.fps = fps
+        self.index = 0
+        self._opened = True
+        self._build(width, height)
+
+    def _build(self, width, height):
+        self.width, self.height = int(width), int(height)
+        rng = np.random.default_rng(self.seed)
+        gradient = np.linspace(20, 60, self.width, dtype=np.float32)[None, :] * np.ones((self.height, 1), np.float32)
+        self.background = cv2.merge([gradient, gradient * 0.9, gradient * 0.8]).astype(np.uint8)
+        # A small pool of noise frames keeps generation cheap
+        self.noise_pool = [np.clip(rng.normal(0, self.noise, self.background.shape), -128, 127).astype(np.int16)
+                           for _ in range(8)]
+        size = max(8, min(self.width, self.height) // 8)
+        self.sizes = rng.integers(size // 2, size * 2, (self.objects, 2))
+        self.positions = rng.uniform(0, 1, (self.objects, 2)) * [self.width, self.height]
+        self.velocities = rng.uniform(-1, 1, (self.objects, 2)) * max(2, self.width // 100)
+        self.colors = rng.integers(150, 256, (self.objects, 3)).tolist()
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        if not self._opened or (self.frames is not None and self.index >= self.frames):
+            return False, None
+        frame = np.clip(self.background + self.noise_pool[self.index % len(self.noise_pool)], 0, 255).astype(np.uint8)
+        self.positions += self.velocities
+        limits = np.array([self.width, self.height]) - self.sizes
+        bounced = (self.positions < 0) | (self.positions > limits)
+        self.velocities[bounced] *= -1
+        self.positions = np.clip(self.positions, 0, limits)
+        for (x, y), (w, h), color in zip(self.positions.astype(int).tolist(), self.sizes.tolist(), self.colors):
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, -1)
+        self.index += 1
+        return True, frame
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self._build(value, self.height)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self._build(self.width, value)
+        else:
+            return False
+        return True
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FRAME_WIDTH: self.width, cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+                cv2.CAP_PROP_FPS: self.fps, cv2.CAP_PROP_FRAME_COUNT: self.frames or 0,
+                cv2.CAP_PROP_POS_FRAMES: self.index}.get(prop, 0.0)
+
+    def release(self):
+        self._opened = False
+
+
+def open_source(spec=None):
+    """
+    Open a device index, file/URL or "synthetic[:WxH[:N]]" source (default: $VIDEO_SOURCE or "0").
+
+    With metrics enabled, reads are timed and counted per source.
+    """
+    if spec is None:
+        spec = os.environ.get("VIDEO_SOURCE", DEFAULT_SOURCE)
+    return metrics.instrument_source(_open_source(spec), str(spec))
+
+
+def _open_source(spec):
+    if isinstance(spec, int):
+        return cv2.VideoCapture(spec)
+    match = re.fullmatch(r"synthetic(?::(\d+)x(\d+))?(?::(\d+))?", spec)
+    if match:
+        width, height, frames = match.groups()
+        return SyntheticSource(int(width or 640), int(height or 480), int(frames) if frames else None)
+    if spec.isdigit():
+        return cv2.VideoCapture(int(spec))
+    return cv2.VideoCapture(spec)
+
+
+class Sink:
+    """Base sink: show() named frames, wait_key() once per loop iteration, event() for records."""
+
+    def show(self, name, frame):
+        pass
+
+    def wait_key(self):
+        """Key code of a pressed key (like cv2.waitKey(1) & 0xFF), or -1."""
+        return -1
+
+    def event(self, kind, **fields):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NullSink(Sink):
+    """Discards everything."""
+
+
+class GuiSink(Sink):
+    """OpenCV HighGUI windows."""
+
+    def show(self, name, frame):
+        cv2.imshow(name, frame)
+
+    def wait_key(self):
+        return cv2.waitKey(1) & 0xFF
+
+    def close(self):
+        cv2.destroyAllWindows()
+
+
+def _slug(name):
+    return re.sub(r"[^0-9A-Za-z]+", "_", name).strip("_").lower() or "frame"
+
+
+class VideoWriterSink(Sink):
+    """
+    Writes every window to its own video file.
+
+    Parameters:
+    - path: Output path; the window name is appended to the file stem
+      (out.mp4 -> out_frame.mp4, out_foreground_mask.mp4).
+    - fps: Frame rate written to the files.
+    - fourcc: Codec four-character code.
+    """
+
+    def __init__(self, path, fps=30.0, fourcc="mp4v"):
+        self.path = path
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.writers = {}
+
+    def show(self, name, frame):
+        writer = self.writers.get(name)
+        if writer is None:
+            stem, ext = os.path.splitext(self.path)
+            height, width = frame.shape[:2]
+            writer = cv2.VideoWriter(f"{stem}_{_slug(name)}{ext}", self.fourcc, self.fps, (width, height))
+            self.writers[name] = writer
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        writer.write(frame)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.release()
+        self.writers.clear()
+
+
+class MjpegSink(Sink):
+    """
+    Serves every window as an MJPEG stream over HTTP.
+
+    http://host:port/ lists the streams; http://host:port/<window> is a
+    multipart/x-mixed-replace stream viewable in a browser or VLC.  Frames
+    are only copied while a client is connected and JPEG encoding happens
+    on the client threads, so an unwatched stream costs almost nothing.
+
+    Parameters:
+    - host, port: Listening address (localhost by default).
+    - quality: JPEG quality.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8080, quality=80):
+        self.quality = quality
+        self.frames = {}
+        self.clients = 0
+        self.condition = threading.Condition()
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                name = self.path.strip("/")
+                if not name:
+                    with sink.condition:
+                        names = list(sink.frames)
+                    body = "".join(f'<p><a href="/{_slug(n)}">{n}</a></p>' for n in names).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                with sink.condition:
+                    known = name in sink.frames
+                if not known:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.end_headers()
+                sink.stream(name, self.wfile)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mjpeg-sink", daemon=True)
+        self.thread.start()
+        print(f"MJPEG streams on http://{host}:{self.server.server_address[1]}/")
+
+    def stream(self, name, output):
+        last = None
+        with self.condition:
+            self.clients += 1
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.frames.get(name, (None, None))[0] not in (None, last)
+                                            or self.server is None)
+                    if self.server is None:
+                        return
+                    last, frame = self.frames[name]
+                if frame is None:
+                    continue
+                ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if ok:
+                    output.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                                 + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg.tobytes() + b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.condition:
+                self.clients -= 1
+
+    def show(self, name, frame):
+        slug = _slug(name)
+        with self.condition:
+            sequence = self.frames.get(slug, (0, None))[0] or 0
+            # Without clients only register the window name
+            self.frames[slug] = (sequence + 1, frame.copy() if self.clients else None)
+            self.condition.notify_all()
+
+    def close(self):
+        server, self.server = self.server, None
+        with self.condition:
+            self.condition.notify_all()
+        server.shutdown()
+        server.server_close()
+
+
+class JsonLinesSink(Sink):
+    """
+    Writes one JSON line per shown frame and per event.
+
+    Parameters:
+    - path: Output file ("-" for stdout).
+    - frames: Also log a record for every shown frame (window, index, shape, time).
+    """
+
+    def __init__(self, path="-", frames=True):
+        self.file = sys.stdout if path == "-" else open(path, "a", encoding="utf-8")
+        self.log_frames = frames
+        self.counts = {}
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def show(self, name, frame):
+        index = self.counts.get(name, 0)
+        self.counts[name] = index + 1
+        if self.log_frames:
+            self._write({"type": "frame", "time": time.time(), "window": name, "frame": index,
+                         "shape": list(frame.shape)})
+
+    def event(self, kind, **fields):
+        self._write({"type": kind, "time": time.time(), **fields})
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+class MultiSink(Sink):
+    """Forwards to several sinks; wait_key returns the first pressed key."""
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def show(self, name, frame):
+        for sink in self.sinks:
+            sink.show(name, frame)
+
+    def wait_key(self):
+        keys = [sink.wait_key() for sink in self.sinks]
+        return next((key for key in keys if key not in (-1, 255)), -1)
+
+    def event(self, kind, **fields):
+        for sink in self.sinks:
+            sink.event(kind, **fields)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def _open_one(spec):
+    kind, _, argument = spec.partition(":")
+    if kind == "gui":
+        return GuiSink()
+    if kind == "null":
+        return NullSink()
+    if kind == "video":
+        return VideoWriterSink(argument or "output.mp4")
+    if kind == "mjpeg":
+        host, _, port = argument.rpartition(":")
+        return MjpegSink(host or "127.0.0.1", int(port or 8080))
+    if kind == "jsonl":
+        return JsonLinesSink(argument or "-")
+    raise ValueError(f"Unknown sink: {spec}")
+
+
+def open_sink(spec=None):
+    """Create a sink from a spec such as "gui", "null" or "null,jsonl:run.jsonl" (default: $VIDEO_SINK or "gui")."""
+    if spec is None:
+        spec = os.environ.get("VIDEO_SINK", DEFAULT_SINK)
+    if isinstance(spec, Sink):
+        return spec
+    sinks = [_open_one(part.strip()) for part in spec.split(",") if part.strip()]
+    return sinks[0] if len(sinks) == 1 else MultiSink(sinks)